@@ -1,18 +1,73 @@
 # -*- coding: utf-8; -*-
-# import datetime
+import array
+import bisect
+import collections
+import copy
+import datetime
+import decimal
+import enum
 import functools
+import io
 import json
 import logging
 import logging.config
+import logging.handlers
+import mmap
 import operator
 import os
+import queue
+import random
 import re
+import select
+import selectors
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
 import traceback
-from typing import Any, Callable, Iterable, List, Mapping, Optional, Tuple, Type, Union
+from typing import (IO, TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List,
+                    Mapping, Optional, Tuple, Type, Union)
+import uuid
 import warnings
-
-
-LOG_RECORD_ATTRS = ('asctime',
+import weakref
+import zlib
+
+if TYPE_CHECKING:  # pragma: no cover
+    import asyncio  # Imported by the only handler using it, as it takes long to import
+try:
+    import contextvars
+except ImportError:  # pragma: no cover (Python 3.6)
+    contextvars = None
+try:
+    import dataclasses
+except ImportError:  # pragma: no cover (Python 3.6)
+    dataclasses = None
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+try:
+    import rapidjson
+except ImportError:  # pragma: no cover
+    rapidjson = None
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+LOG_RECORD_ATTRS = ('args',
+                    'asctime',
                     'created',
                     'exc_info',
                     # 'exc_text',
@@ -24,6 +79,7 @@ LOG_RECORD_ATTRS = ('asctime',
                     'module',
                     'msecs',
                     'message',
+                    'msg',
                     'name',
                     'pathname',
                     'process',
@@ -34,6 +90,8 @@ LOG_RECORD_ATTRS = ('asctime',
                     'threadName',
                     )
 #: The attributes of a :class:`logging.LogRecord` that can be displayed in a log entry.
+#: ``msg`` is the message template, and ``args`` the arguments merged into it to make the
+#: ``message``: output them to group entries by template, or let the consumer do the merge.
 
 _ALL_LOG_RECORD_ATTRS = ('args',
                          'asctime',
@@ -65,6 +123,131 @@ _ALL_LOG_RECORD_ATTRS = ('args',
 #:    logging.log(<level>, <pattern>, *<pattern-args>, extra=<extra attributes>)
 #:
 
+_baseline = (None, frozenset(_ALL_LOG_RECORD_ATTRS))
+#: The log record factory for which the baseline attributes were last computed, and those
+#: attributes (see :func:`_baseline_attrs`).
+
+_CONTEXT_ATTR = '_jsonlogging_context'
+#: The attribute in which :meth:`QueueHandler.prepare` saves the context of a record, for
+#: formatters to read context variables from (see the Formatter ``context_vars`` argument).
+
+_TEMPLATE_ATTR = '_jsonlogging_template'
+#: The attribute in which :meth:`QueueHandler.prepare` saves the message template and
+#: arguments of a record, before it merges them.
+
+_UNSET = object()
+#: The value of context variables that are not set.
+
+CONTEXT_CACHE_SIZE = 256
+#: The number of encoded context variable values a :class:`Formatter` caches, before it
+#: starts over.
+
+_INT_ATTRS = frozenset(('levelno', 'lineno', 'process', 'thread'))
+#: LogRecord attributes which values are integers (or ``None`` for process and thread).
+
+_FLOAT_ATTRS = frozenset(('created', 'msecs', 'relativeCreated'))
+#: LogRecord attributes which values are floating point numbers.
+
+_STR_ATTRS = frozenset(('asctime', 'filename', 'levelname', 'message', 'module', 'name',
+                        'pathname'))
+#: LogRecord attributes which values are always strings (others, like ``processName``, may
+#: be ``None``).
+
+_encode_basestring = json.encoder.encode_basestring_ascii
+
+
+def _dumps(value: Any) -> str:
+    """Serializes any value to compact JSON, turning those JSON cannot represent to strings.
+    """
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def _dumps_bytes(value: Any) -> bytes:
+    """Serializes any value to compact, UTF-8 encoded, JSON.
+    """
+    return json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def _orjson_dumps(value: Any) -> str:
+    return orjson.dumps(value, default=str).decode('utf-8')
+
+
+def _orjson_dumps_bytes(value: Any) -> bytes:
+    return orjson.dumps(value, default=str)
+
+
+def _rapidjson_dumps(value: Any) -> str:
+    return rapidjson.dumps(value, default=str)
+
+
+def _rapidjson_dumps_bytes(value: Any) -> bytes:
+    return rapidjson.dumps(value, default=str).encode('utf-8')
+
+
+def _ujson_dumps(value: Any) -> str:
+    return ujson.dumps(value, default=str, escape_forward_slashes=False)
+
+
+def _ujson_dumps_bytes(value: Any) -> bytes:
+    return ujson.dumps(value, default=str, escape_forward_slashes=False).encode('utf-8')
+
+
+JSON_BACKENDS = (('json', lambda: json, _dumps, _dumps_bytes),
+                 ('orjson', lambda: orjson, _orjson_dumps, _orjson_dumps_bytes),
+                 ('rapidjson', lambda: rapidjson, _rapidjson_dumps, _rapidjson_dumps_bytes),
+                 ('ujson', lambda: ujson, _ujson_dumps, _ujson_dumps_bytes),
+                 )
+#: The JSON encoders a :class:`Formatter` can use: their name, a function returning their
+#: module (``None`` when it is not installed), and their ``dumps`` functions to strings and
+#: to bytes.
+
+
+def _json_backend(name: str) -> Tuple[Callable[[Any], str], Callable[[Any], bytes]]:
+    """Returns the functions serializing values to JSON strings and bytes, with a given encoder.
+    """
+    for backend, module, dumps, dumps_bytes in JSON_BACKENDS:
+        if backend == name:
+            if module() is None:
+                raise ImportError('The {} JSON backend is not installed'.format(name))
+            return dumps, dumps_bytes
+
+    raise ValueError('Unknown JSON backend: {} (choose from {})'
+                     .format(name, ', '.join(b for b, _, _, _ in JSON_BACKENDS)))
+
+
+def _json_float(value: Any) -> str:
+    """Serializes a value expected to be a float to JSON.
+    """
+    if value.__class__ is float:
+        return float.__repr__(value)
+    return _dumps(value)
+
+
+def _json_int(value: Any) -> str:
+    """Serializes a value expected to be an integer to JSON.
+    """
+    if value.__class__ is int:
+        return int.__repr__(value)
+    return _dumps(value)
+
+
+def _json_quoted(value: str) -> str:
+    """Serializes a string known not to need any escaping to JSON (*e.g.* a formatted number).
+    """
+    return '"' + value + '"'
+
+
+def _json_str(value: Any) -> str:
+    """Serializes a value expected to be a string to JSON.
+    """
+    if value.__class__ is str:
+        return _encode_basestring(value)
+    return _dumps(value)
+
+
+TIME_FORMATS = (None, 'epoch', 'iso8601')
+#: The ways a :class:`Formatter` can format the ``asctime`` attribute of log records.
+
 BRACE_FORMAT_PARSER = re.compile(r'(?:\{)(?P<key>[^:\}]+)(?:(?::(?P<fmt>[^}]*))?\})')
 DOLLAR_FORMAT_PARSER = re.compile(r'(?:(?<!\\)\$(?:(:?\$\$)*\{(?=[^ ]+\}))?)(?P<key>[^\$\{ \}]+)'
                                   r'(?:\})?')
@@ -72,6 +255,115 @@ PERCENT_FORMAT_PARSER = re.compile(r'(?:(?<!%)%(?:(?=(?:%%)*\())%*\()(?P<key>[^)
                                    r'(?:\)(?P<fmt>[^ds]*[ds]))')
 
 
+def _baseline_attrs() -> FrozenSet[str]:
+    """Returns the names of the attributes every LogRecord has, as opposed to extra ones.
+
+    The set is computed once per log record factory, from a record it creates, so attributes
+    added by a factory installed with :func:`logging.setLogRecordFactory` or by the running
+    Python version (*e.g.* ``taskName``) are not mistaken for user provided extras.
+    """
+    global _baseline
+    factory = logging.getLogRecordFactory()
+    cached_factory, attrs = _baseline
+    if factory is cached_factory:
+        return attrs
+
+    try:
+        record = factory('', logging.NOTSET, '', 0, '', (), None)
+    except Exception:  # Custom factories may not support being called without context
+        record = logging.LogRecord('', logging.NOTSET, '', 0, '', (), None)
+    attrs = frozenset(_ALL_LOG_RECORD_ATTRS).union(vars(record), (_CONTEXT_ATTR, _TEMPLATE_ATTR))
+    _baseline = (factory, attrs)
+    return attrs
+
+
+def _extras(record: logging.LogRecord) -> Dict[str, Any]:
+    """Extracts the extra attributes of a LogRecord, those the user passed with ``extra``.
+    """
+    baseline = _baseline_attrs()
+    return {k: v for k, v in record.__dict__.items() if k not in baseline}
+
+
+class Lazy:
+    """An extra attribute value computed only when a record is formatted.
+
+    *E.g.* ``logger.debug('state', extra={'state': Lazy(dump_state, machine)})`` only calls
+    ``dump_state(machine)`` if the record passes filters and levels, and reaches a formatter.
+    """
+
+    __slots__ = ('function', 'args', 'kwargs')
+
+    def __init__(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self) -> Any:
+        return self.function(*self.args, **self.kwargs)
+
+    def __str__(self) -> str:  # For formatters not aware of lazy values
+        return str(self())
+
+
+def _dataclass_fields(value: Any) -> Dict[str, Any]:
+    """Returns the fields of a dataclass instance, without copying them (unlike ``asdict``).
+    """
+    return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+
+
+DEFAULT_ENCODERS = {datetime.date: datetime.date.isoformat,
+                    datetime.datetime: datetime.datetime.isoformat,
+                    datetime.time: datetime.time.isoformat,
+                    decimal.Decimal: str,
+                    enum.Enum: operator.attrgetter('value'),
+                    Lazy: Lazy.__call__,
+                    uuid.UUID: str,
+                    }
+#: The functions turning extra values of a type (or of its subclasses) into values JSON
+#: can represent, that every :class:`Formatter` uses unless told otherwise (see its
+#: ``encoders`` argument). Dataclass instances are turned into dictionaries of their fields,
+#: values of other types, into strings.
+
+_JSON_SCALARS = frozenset((bool, float, int, type(None)))
+#: The types of extra values output as is, whatever their depth.
+
+TRUNCATED_ITEMS_MARKER = '[{} more items]'
+#: The item appended to lists and dictionaries truncated to ``extras_max_length`` items.
+
+TRUNCATED_TEXT_MARKER = '[{} more characters]'
+#: The text appended to strings truncated to ``extras_max_length`` characters.
+
+MAX_DEPTH_MARKER = '[...]'
+#: The value replacing containers nested deeper than ``extras_max_depth``.
+
+DROP_ORDER = ('extras', 'stack_info', 'frames', 'exc_info')
+#: The fields a :class:`Formatter` leaves out, in order, of log entries exceeding
+#: ``max_line_bytes``, by default.
+
+INTERNABLE_ATTRS = ('filename', 'funcName', 'levelname', 'module', 'msg', 'name', 'pathname',
+                    'processName', 'threadName')
+#: The LogRecord attributes a :class:`Formatter` can intern (see its ``intern_fields``
+#: argument): those output as strings, which repeat from record to record.
+
+INTERN_KEY = '@intern'
+#: The key under which a :class:`Formatter` interning fields announces the numbers of the
+#: values entries are the first to hold (see :class:`InternDecoder`).
+
+PROFILE_STAGES = ('format', 'attributes', 'exception', 'stack', 'extras', 'dumps')
+#: The stages of formatting a :class:`Formatter` times with ``profile``: the whole of it,
+#: computing attributes (exception and stack included), formatting exceptions and stacks,
+#: encoding extras, and encoding JSON.
+
+PROFILE_LOGGER = 'jsonlogging.profile'
+#: The name of the logger through which a profiling :class:`Formatter` logs its statistics.
+
+PROFILE_MESSAGE = 'Formatter statistics'
+#: The message of the records a profiling :class:`Formatter` logs its statistics with, under
+#: the ``formatter_stats`` extra.
+
+_clock = getattr(time, 'perf_counter_ns', None) or (lambda: int(time.perf_counter() * 1e9))
+
+
 def _brace_parser(fmt) -> Iterable[Tuple[str, str]]:
     """Parses '{'-style log format string to extract the keys to put in the JSON object.
     """
@@ -96,6 +388,11 @@ FORMAT_PARSERS = (('{', _brace_parser),
                   )
 
 
+_NOOP_STR_FORMATS = frozenset(('{}', '{:s}'))
+#: The format strings that leave strings unchanged, skipped when formatting values known to
+#: be strings, like the message.
+
+
 def _dater(formatter, fmt, record) -> str:
     """Formats the timestamp of a LogRecord in a human readable way.
     """
@@ -122,6 +419,12 @@ def _formatter(attr, fmt, record) -> str:
     return fmt.format(getattr(record, attr))
 
 
+def _str_formatter(attr, record) -> str:
+    """Formats scalar LogRecord attributes with an empty format spec, *i.e.* as strings.
+    """
+    return str(getattr(record, attr))
+
+
 def _formatter2(attr, record) -> str:
     """Formats scalar LogRecord attributes.
     """
@@ -140,6 +443,28 @@ def _messager2(record):
     return record.getMessage()
 
 
+def _templater(fmt, record) -> str:
+    """Formats the message template of a LogRecord.
+    """
+    return fmt.format(_templater2(record))
+
+
+def _templater2(record) -> str:
+    """Returns the message template of a LogRecord, before its arguments are merged into it.
+    """
+    saved = record.__dict__.get(_TEMPLATE_ATTR)
+    msg = record.msg if saved is None else saved[0]
+    return msg if msg.__class__ is str else str(msg)
+
+
+def _arguer(formatter, record) -> Any:
+    """Returns the arguments of the message of a LogRecord, as values JSON can represent.
+    """
+    saved = record.__dict__.get(_TEMPLATE_ATTR)
+    args = record.args if saved is None else saved[1]
+    return None if args is None else formatter._encodable(args)
+
+
 def _stacker(formatter, record) -> Optional[List[Tuple[str, str]]]:
     if record.stack_info:
         return formatter.formatStack(record.stack_info)
@@ -152,16 +477,35 @@ def closure_compiler(formatter, attr, fmt):
     This compiler is implemented using closures
     """
     if attr == 'message':
+        if fmt in _NOOP_STR_FORMATS:
+            return operator.methodcaller('getMessage')
+
         def _closure_messager(record):
             return fmt.format(record.getMessage())
         return _closure_messager
 
     if attr == 'asctime':
+        if fmt in _NOOP_STR_FORMATS:
+            return formatter.formatTime
+
         def _closure_dater(record) -> str:
             return fmt.format(formatter.formatTime(record))
 
         return _closure_dater
 
+    if attr == 'msg':
+        if fmt in _NOOP_STR_FORMATS:
+            return _templater2
+
+        def _closure_templater(record) -> str:
+            return fmt.format(_templater2(record))
+        return _closure_templater
+
+    if attr == 'args':
+        def _closure_arguer(record) -> Any:
+            return _arguer(formatter, record)
+        return _closure_arguer
+
     if attr == 'exc_info':
         def _closure_exceptioner(record) -> Optional[List[Tuple[str, str]]]:
             if record.exc_info:
@@ -176,6 +520,11 @@ def closure_compiler(formatter, attr, fmt):
             return None
         return _closure_stacker
 
+    if fmt == '{}':
+        def _closure_str_formatter(record) -> str:
+            return str(getattr(record, attr))
+        return _closure_str_formatter
+
     def _closure_formatter(record) -> str:
         return fmt.format(getattr(record, attr))
 
@@ -212,6 +561,14 @@ def closure_compiler2(formatter, attr):
             return None
         return _closure_stacker
 
+    if attr == 'msg':
+        return _templater2
+
+    if attr == 'args':
+        def _closure_arguer(record) -> Any:
+            return _arguer(formatter, record)
+        return _closure_arguer
+
     def _closure_formatter(record) -> str:
         return getattr(record, attr)
 
@@ -223,11 +580,13 @@ def partial_compiler(formatter, attr, fmt) -> Callable[[logging.LogRecord], Unio
 
     This compiler is implemented using partial functions.
     """
+    noop = fmt in _NOOP_STR_FORMATS
     if attr == 'message':
-        return functools.partial(_messager, fmt)
+        return functools.partial(_messager2) if noop else functools.partial(_messager, fmt)
 
     if attr == 'asctime':
-        return functools.partial(_dater, formatter, fmt)
+        return (functools.partial(_dater2, formatter) if noop else
+                functools.partial(_dater, formatter, fmt))
 
     if attr == 'exc_info':
         return functools.partial(_exceptioner, formatter)
@@ -235,6 +594,15 @@ def partial_compiler(formatter, attr, fmt) -> Callable[[logging.LogRecord], Unio
     if attr == 'stack_info':
         return functools.partial(_stacker, formatter)
 
+    if attr == 'msg':
+        return functools.partial(_templater2) if noop else functools.partial(_templater, fmt)
+
+    if attr == 'args':
+        return functools.partial(_arguer, formatter)
+
+    if fmt == '{}':
+        return functools.partial(_str_formatter, attr)
+
     return functools.partial(_formatter, attr, fmt)
 
 
@@ -246,8 +614,10 @@ def partial_compiler2(formatter: logging.Formatter,
     This compiler is implemented using partial functions.
     """
     return functools.partial(*{'message': (_messager2, ),
+                               'args': (_arguer, formatter),
                                'asctime': (_dater2, formatter),
                                'exc_info': (_exceptioner, formatter),
+                               'msg': (_templater2, ),
                                'stack_info': (_stacker, formatter),
                                }.get(attr, (_formatter2, attr))
                              )
@@ -261,27 +631,368 @@ def partial_compiler3(formatter: logging.Formatter,
     This compiler is implemented using partial functions.
     """
     return {'message': functools.partial(_messager2),
+            'args': functools.partial(_arguer, formatter),
             'asctime': functools.partial(_dater2, formatter),
             'exc_info': functools.partial(_exceptioner, formatter),
+            'msg': functools.partial(_templater2),
             'stack_info': functools.partial(_stacker, formatter),
             }.get(attr, operator.attrgetter(attr))
 
 
+_INSTANCE_ATTRS = frozenset(('args', 'asctime', 'exc_info', 'stack_info'))
+#: The attributes which compiled callables depend on the formatter they are compiled for.
+
+_SHARED_COMPILERS = frozenset((closure_compiler, closure_compiler2, partial_compiler,
+                               partial_compiler2, partial_compiler3))
+#: The compilers known to not use the formatter for attributes outside of
+#: :data:`_INSTANCE_ATTRS`, the callables of which formatters can share.
+
+
+def _compile(compiler: Callable[..., Callable[[logging.LogRecord], Any]],
+             formatter: logging.Formatter,
+             attr: str,
+             *fmt: str
+             ) -> Callable[[logging.LogRecord], Any]:
+    """Compiles the callable outputting an attribute, shared by formatters when it can be.
+
+    Compilers other than the built-in ones may read their formatter: they are always given
+    it.
+    """
+    if attr in _INSTANCE_ATTRS or compiler not in _SHARED_COMPILERS:
+        return compiler(formatter, attr, *fmt)
+    return _compile_shared(compiler, attr, *fmt)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_shared(compiler: Callable[..., Callable[[logging.LogRecord], Any]],
+                    attr: str,
+                    *fmt: str
+                    ) -> Callable[[logging.LogRecord], Any]:
+    return compiler(None, attr, *fmt)
+
+
+@functools.lru_cache(maxsize=256)
+def _layout(fmt: str,
+            style: str,
+            keymap: Tuple[Tuple[str, str], ...],
+            time_as_number: bool,
+            per_attr_spec: bool,
+            ) -> Tuple[Tuple[str, str, Optional[str], str, str], ...]:
+    """Parses a format string into the layout of the JSON output, shared by formatters.
+
+    Returns, for each LogRecord attribute in the format string: its name, its key in the
+    output, its format spec (``None`` for time stamps output as numbers), the JSON of its
+    key as it prefixes its value, and the name of the encoder for its value (see
+    :meth:`Formatter.__init__`). ``per_attr_spec`` tells whether the compiler formats
+    values to strings, according to their spec.
+    """
+    keymap = dict(keymap)
+    float_attrs = _FLOAT_ATTRS | {'asctime'} if time_as_number else _FLOAT_ATTRS
+    selected = {}
+    for attr, spec in dict(FORMAT_PARSERS)[style](fmt):
+        if attr in LOG_RECORD_ATTRS:
+            selected[attr] = None if attr == 'asctime' and attr in float_attrs else spec
+
+    layout = []
+    for attr, spec in selected.items():
+        key = keymap.get(attr, attr)
+        if not per_attr_spec:
+            kind = ('int' if attr in _INT_ATTRS else
+                    'float' if attr in float_attrs else
+                    'dumps' if attr in {'args', 'exc_info', 'stack_info'} else
+                    'str' if attr in _STR_ATTRS else
+                    'json_str')
+        else:  # Values are formatted to strings, but for args, exc_info and stack_info, and
+            # time stamps output as numbers.
+            kind = ('float' if spec is None else
+                    'dumps' if attr in {'args', 'exc_info', 'stack_info'} else
+                    'quoted' if not spec and attr in _INT_ATTRS | _FLOAT_ATTRS else
+                    'str')
+        layout.append((attr, key, spec, ',{}:'.format(_encode_basestring(key)), kind))
+    return tuple(layout)
+
+
+_codegen_cache = {}  # type: Dict[Tuple[Tuple[Tuple[str, str], ...], ...], Any]
+#: Code objects generated by :func:`codegen_compiler`, keyed on the parsed format and keymap.
+
+
+def _codegen_expression(attr: str, fmt: str) -> str:
+    """Returns the source of the expression that computes the value of ``attr`` in the output.
+    """
+    if attr == 'asctime' and fmt is None:  # Time stamps as numbers (see Formatter's time_format)
+        return 'record.created'
+
+    if attr == 'exc_info':
+        return 'formatter.formatException(record.exc_info) if record.exc_info else None'
+
+    if attr == 'stack_info':
+        return 'formatter.formatStack(record.stack_info) if record.stack_info else None'
+
+    if attr == 'args':
+        return '_arguer(formatter, record)'
+
+    value = {'message': 'record.getMessage()',
+             'asctime': 'formatter.formatTime(record)',
+             'msg': '_templater2(record)',
+             }.get(attr, 'record.{}'.format(attr))
+    if attr in {'message', 'asctime', 'msg'} and fmt in {'', 's'}:
+        return value  # Formatting the few functions known to return a string is a no-op
+
+    if not fmt:
+        return '_str({})'.format(value)  # '{}'.format(x) is str(x)
+
+    return '{!r}.format({})'.format('{{:{}}}'.format(fmt), value)
+
+
+def _codegen_dict(attrs: Tuple[Tuple[str, str], ...], keymap: Mapping[str, str]) -> List[str]:
+    """Returns the source of functions that build a dictionary, then encode it.
+    """
+    source = []
+    for name, dumps in (('format', '_dumps'), ('format_bytes', '_dumps_bytes')):
+        source.extend(['def {}(record):'.format(name),
+                       '    output = {',
+                       ])
+        source.extend('        {!r}: {},'.format(keymap.get(attr, attr),
+                                                 _codegen_expression(attr, fmt))
+                      for attr, fmt in attrs)
+        source.extend(['    }',
+                       '    output.update(_extras(record))',
+                       '    return {}(output)'.format(dumps),
+                       ])
+    return source
+
+
+def _codegen_direct(attrs: Tuple[Tuple[str, str], ...], keymap: Mapping[str, str]) -> List[str]:
+    """Returns the source of a function that assembles the JSON string itself.
+    """
+    source = ['def format(record):',
+              "    body = ''.join((",
+              ]
+    for attr, fmt in attrs:
+        key = ',{}:'.format(_encode_basestring(keymap.get(attr, attr)))
+        expression = _codegen_expression(attr, fmt)
+        if attr in {'args', 'exc_info', 'stack_info'}:
+            source.append('        {!r}, _dumps({}),'.format(key, expression))
+        elif fmt is None:
+            source.append('        {!r}, _json_float({}),'.format(key, expression))
+        elif not fmt and attr in _INT_ATTRS | _FLOAT_ATTRS:
+            # Formatted numbers never need escaping.
+            source.append('        {!r}, {},'.format(key + '"', expression))
+            source.append("        '\"',")
+        else:
+            # The expression always evaluates to a string.
+            source.append('        {!r}, _encode_basestring({}),'.format(key, expression))
+    source.extend(['    ))',
+                   '    extras = _extras(record)',
+                   '    if extras:',
+                   "        body += ',' + _dumps(extras)[1:-1]",
+                   "    return '{' + body[1:] + '}'",
+                   '',
+                   'def format_bytes(record):',
+                   "    return format(record).encode('utf-8')",
+                   ])
+    return source
+
+
+def codegen_compiler(formatter: logging.Formatter,
+                     attrs: Iterable[Tuple[str, str]],
+                     keymap: Mapping[str, str],
+                     direct_json: bool = False,
+                     ) -> Tuple[Callable[[logging.LogRecord], str],
+                                Callable[[logging.LogRecord], bytes]]:
+    """Compiles the formatting pattern into a single callable that formats a whole log record.
+
+    Unlike the other compilers, which return one callable per attribute, this compiler
+    generates the source code of a ``format(record)`` function in which attribute reads,
+    key renaming and formatting are inlined, then compiles it. The code generated is cached
+    so formatters with equivalent configurations share it.
+
+    Returns:
+        the ``format`` function, and its ``format_bytes`` counterpart, returning UTF-8
+        encoded JSON.
+
+    Arguments:
+        formatter: the formatter the function is compiled for.
+        attrs: the attribute names and format specs to output, as returned by the format
+            parsers. A ``None`` format spec for ``asctime`` outputs the time stamp as a number.
+        keymap: the mapping from attribute names to keys in the JSON output.
+        direct_json: whether the generated function should assemble the JSON string
+            itself, rather than build a dictionary and encode it.
+    """
+    attrs = tuple(attrs)
+    cache_key = (attrs, tuple(sorted(keymap.items())), (direct_json, ))
+    code = _codegen_cache.get(cache_key)
+    if code is None:
+        source = (_codegen_direct if direct_json else _codegen_dict)(attrs, keymap)
+        code = compile('\n'.join(source), '<jsonlogging-codegen>', 'exec')
+        _codegen_cache[cache_key] = code
+
+    namespace = {'formatter': formatter,
+                 '_dumps': formatter._dumps,
+                 '_dumps_bytes': formatter._dumps_bytes,
+                 '_extras': formatter._encoded_extras,
+                 '_encode_basestring': _encode_basestring,
+                 '_json_float': _json_float,
+                 '_arguer': _arguer,
+                 '_templater2': _templater2,
+                 '_str': str,
+                 }
+    exec(code, namespace)
+    return namespace['format'], namespace['format_bytes']
+
+
+@functools.lru_cache(maxsize=None)
+def _package_dirs(prefixes: Tuple[str, ...]) -> Any:
+    """Compiles a regular expression matching site package directories or any of ``prefixes``.
+
+    The part of the path that follows the prefix is captured in the first group. Longer
+    prefixes are tried first, so the most specific of nested directories wins.
+    """
+    alternatives = ['(?:.*)(?:' + os.sep + '(?:site|dist)-packages' + os.sep + ')']
+    alternatives.extend(re.escape(prefix.rstrip(os.sep) + os.sep)
+                        for prefix in sorted(prefixes, key=len, reverse=True))
+    return re.compile('(?:{})(.*)'.format('|'.join(alternatives)))
+
+
+ELIDED_FRAMES_MARKER = '[{} frames elided]'
+#: The text of the frame replacing those elided from a stack trace (see ``max_frames``).
+
+REPEATED_FRAME_MARKER = '[Previous frame repeated {} more times]'
+#: The text of the frame replacing repetitions of a frame (see ``collapse_recursion``).
+
+
+def _marker_frame(text: str) -> Tuple[str, int, str, str]:
+    """Returns a pseudo frame that signals frames were removed from a stack trace.
+    """
+    return ('...', 0, '...', text)
+
+
+def _collapse_recursion(frames: List[Tuple[str, int, str, Optional[str]]]
+                        ) -> List[Tuple[str, int, str, Optional[str]]]:
+    """Replaces consecutive occurrences of a frame with the first one and a marker frame.
+    """
+    collapsed = []
+    repeated = 0
+    for frame in frames:
+        if collapsed and frame[:3] == collapsed[-1][:3]:
+            repeated += 1
+            continue
+        if repeated:
+            collapsed.append(_marker_frame(REPEATED_FRAME_MARKER.format(repeated)))
+            repeated = 0
+        collapsed.append(frame)
+    if repeated:
+        collapsed.append(_marker_frame(REPEATED_FRAME_MARKER.format(repeated)))
+    return collapsed
+
+
+def _min_size(values: Dict[str, Any]) -> int:
+    """Returns a lower bound of the size of the JSON object holding ``values``.
+    """
+    return sum(len(k) + (len(v) if v.__class__ is str else 0) + 6 for k, v in values.items())
+
+
+def _fragments(fragment: str) -> Tuple[str, str, bytes, bytes]:
+    """Returns what to replace the opening brace of an object with to add a JSON fragment to it
+    (and the object holding only the fragment), as strings and as UTF-8 encoded bytes.
+    """
+    parts = ('{' + fragment + ',' if fragment else '{', '{' + fragment + '}')
+    return parts + tuple(part.encode('utf-8') for part in parts)
+
+
+CacheInfo = collections.namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+#: Statistics about the use of a cache, as returned by :meth:`Formatter.traceback_cache_info`.
+
+
+class _LRUCache:
+    """A bounded, thread-safe, mapping that evicts its least recently used entries.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """Initializes an empty cache, which holds at most ``maxsize`` entries (0 disables it).
+        """
+        self._data = collections.OrderedDict()
+        self._hits = 0
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        """Removes all entries and resets statistics.
+        """
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Returns the value cached for ``key``, or ``default``.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def info(self) -> CacheInfo:
+        """Returns statistics about the use of the cache.
+        """
+        return CacheInfo(self._hits, self._misses, self._maxsize, len(self._data))
+
+    def put(self, key: Any, value: Any) -> None:
+        """Caches ``value`` for ``key``, evicting the least recently used entry if full.
+        """
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+
 class Formatter(logging.Formatter):
     """A :class:`logging.Formatter<py3>` implementation that encodes log records as JSON objects.
     """
 
     __slots__ = ('_keymap', '_datefmt', '_raw_fmt', '_compiler')
     __package_dirs = re.compile('(?:.*)(?:' + os.sep + '(?:site|dist)-packages' + os.sep + ')(.*)')
+    _relativize_cache = _LRUCache(4096)  # Shared by all instances (see relativize_cache_info)
     __code_location = re.compile(r'^(?:  File ")([^"]*)(?:", line )([0-9]+)(?:, in )(.*)$')
 
     def __init__(self,
                  fmt: str = None,
                  datefmt: str = None,
+                 collapse_recursion: bool = False,
+                 context_vars: Iterable['contextvars.ContextVar'] = None,
+                 direct_json: bool = False,
+                 drop_order: Iterable[str] = DROP_ORDER,
+                 encoders: Mapping[type, Callable[[Any], Any]] = None,
+                 extras_max_depth: int = 8,
+                 extras_max_length: int = 10000,
                  format_stacks: bool = False,
+                 intern_fields: Iterable[str] = None,
+                 intern_reset: int = 10000,
+                 json_backend: str = 'json',
                  keymap: Mapping[str, str] = None,
+                 max_field_length: int = None,
+                 max_frames: int = None,
+                 max_line_bytes: int = None,
+                 path_prefixes: Iterable[str] = None,
+                 profile: bool = False,
+                 profile_interval: float = None,
                  relative_paths: bool = False,
+                 source_lines: bool = True,
+                 static_fields: Mapping[str, Any] = None,
                  style: str = '%',
+                 time_format: str = None,
+                 traceback_cache_size: int = 128,
                  _compiler: Callable[['Formatter', str, str],
                                      Callable[[logging.LogRecord],
                                               Union[str, int, float]]] = partial_compiler,
@@ -292,14 +1003,92 @@ class Formatter(logging.Formatter):
         :ref:`logging.Formatter<py:formatter-objects>`.
 
         Arguments:
+            collapse_recursion: whether to collapse, in stack traces, consecutive
+                occurrences of the same frame (as recursive calls produce) into a single
+                frame followed by a marker frame giving the number of repetitions.
+            context_vars: context variables to output in every log entry, under their
+                name, like a request identifier. Their values are read when records are
+                formatted, or queued (see :meth:`QueueHandler.prepare`), and those not
+                set are left out. The JSON of recently seen values is cached, so records
+                logged in the same context only cost a lookup.
+            direct_json: whether to assemble the JSON output by concatenating pre-encoded
+                keys with the encoded values of the attributes, the types of which are
+                known, instead of building a dictionary and passing it to the JSON encoder.
+                The encoder remains used for the ``exc_info`` and ``stack_info`` attributes
+                and for extras. Output is the same either way.
+            drop_order: the fields to leave out, in order, of log entries longer than
+                ``max_line_bytes``: ``'extras'`` for all extras, ``'frames'`` for the
+                frames of exception tracebacks, or the name of a LogRecord attribute.
+            encoders: functions turning extra values of a type (or of its subclasses)
+                into values JSON can represent, overriding or completing
+                :data:`DEFAULT_ENCODERS` (see :meth:`register_encoder`). Extra
+                dictionaries, lists, tuples and sets are output as nested JSON.
+            extras_max_depth: the depth from which containers in extra values are
+                replaced with :data:`MAX_DEPTH_MARKER`.
+            extras_max_length: the number of items, or characters, from which
+                containers, or strings, in extra values are truncated.
+            intern_fields: LogRecord attributes (among :data:`INTERNABLE_ATTRS`) the
+                values of which are output once, then referred to by a number in the
+                following entries. Entries announce the numbers of the values they are the
+                first to hold under :data:`INTERN_KEY`, and numbers start over from 0 every
+                ``intern_reset`` entries, and on :meth:`reset_interning`, so a reader can
+                pick up the stream from there. Read entries back with :class:`InternDecoder`.
+                As entries depend on the previous ones, the formatter must serve a single
+                handler. This disables ``direct_json`` and the code generating compiler.
+            intern_reset: the number of entries after which interned values are numbered
+                anew.
+            json_backend: the name of the JSON encoder to use, one of ``'json'`` (the
+                standard library's, the default), ``'orjson'``, ``'rapidjson'`` or
+                ``'ujson'``, provided it is installed. Whatever the encoder, values it cannot
+                serialize are turned to strings. Note that ``orjson`` does not escape
+                non-ASCII characters.
             keymap: a dictionary to map LogRecord attribute names to alternate
                 keys in the JSON output. *E.g.* to rename 'asctime' to 'timestamp',
                 pass the keymap ``{'asctime': 'timestamp'}``.
+            max_field_length: the number of characters from which string values are
+                truncated, and suffixed with :data:`TRUNCATED_TEXT_MARKER`, before
+                being encoded.
+            max_frames: the maximum number of frames to output in stack traces. The
+                outermost and innermost frames are kept and a marker frame replaces those
+                in between, giving their number.
+            max_line_bytes: the size in bytes log entries should not exceed. Fields
+                are left out of longer entries, in ``drop_order``, then the longest
+                strings truncated, until they fit, or cannot be shortened any further.
+                Static fields, context variables and the values an entry announces (see
+                ``intern_fields``) count in the size, but are never left out nor truncated.
+                Setting this or ``max_field_length`` disables ``direct_json`` and the
+                code generating compiler, as values are checked before being encoded.
+            path_prefixes: additional directories, like the root of your application
+                or of a virtual environment, to remove from files path in stack traces
+                along with site package prefixes, when ``relative_paths`` is set.
+            profile: whether to time the stages of formatting (see :data:`PROFILE_STAGES`),
+                to the nanosecond, and count their durations by power of two (see
+                :meth:`stats`). This disables ``direct_json`` and the code generating
+                compiler. Formatters not profiling do not pay for it.
+            profile_interval: the number of seconds between records logging the statistics
+                of a profiling formatter, and resetting them (see :meth:`log_stats`). None
+                by default.
             relative_paths: whether to remove the site package prefix from files
                 path in stack traces, to saves some bytes (can prove usefull if
-                logs are shipped through a network).
-
-
+                logs are shipped through a network). Relative paths are cached (see
+                :meth:`relativize_cache_info`).
+            source_lines: whether to output the source code line of frames in stack
+                traces. Without them, tracebacks do not require reading source files.
+            static_fields: fields to output first in every log entry, like the name
+                or version of the application. They are encoded once, when the formatter
+                is created, and their JSON copied in each entry as is.
+            time_format: how to format ``asctime``: ``None`` (the default) formats it
+                as the :ref:`logging.Formatter<py:formatter-objects>` does, in local time
+                with ``datefmt`` if set, ``'iso8601'`` formats it in UTC, with
+                milliseconds (*e.g.* ``'2019-01-01T00:00:00.000Z'``), while ``'epoch'``
+                outputs the creation time of the record, a number of seconds since the
+                epoch, without any formatting. Formatted time stamps are cached, so
+                records created within the same second only cost the formatting of the
+                milliseconds.
+            traceback_cache_size: the number of structured tracebacks to cache. Tracebacks
+                are identified by the code locations they go through, so a recurring
+                exception is only extracted once (see :meth:`traceback_cache_info`).
+                0 disables the cache.
 
         Warnings:
 
@@ -308,33 +1097,152 @@ class Formatter(logging.Formatter):
         """
         super().__init__(fmt, datefmt=datefmt, style=style)  # TODO: python3.8 add: , validate=True
 
+        if time_format not in TIME_FORMATS:
+            raise ValueError('Unknown time format: {} (choose from {})'
+                             .format(time_format, ', '.join(map(str, TIME_FORMATS))))
+        self._time_format = time_format
+        self._time_cache = (None, None, '')  # (seconds, datefmt, formatted seconds)
         keymap = keymap or dict()
-        # Ensure we only keep valid LogRecord attribute names.
-        if _compiler in {partial_compiler3, partial_compiler2, closure_compiler2}:
-            selected_attrs = {a: a
-                              for a, f in dict(FORMAT_PARSERS)[style](fmt) if a in LOG_RECORD_ATTRS}
-            self._keymap = {keymap.get(a, a): _compiler(self, a)
-                            for a, _ in selected_attrs.items()}
-            self.format = self._format2
+        self._dumps, self._dumps_bytes = _json_backend(json_backend)
+        plan_encoders = {'dumps': self._dumps,
+                         'float': _json_float,
+                         'int': _json_int,
+                         'json_str': _json_str,
+                         'quoted': _json_quoted,
+                         'str': _encode_basestring,
+                         }
+        per_attr_spec = _compiler not in {partial_compiler3, partial_compiler2, closure_compiler2}
+        layout = _layout(fmt, style, tuple(sorted(keymap.items())), time_format == 'epoch',
+                         per_attr_spec)
+        selected_attrs = [attr for attr, _, _, _, _ in layout]
+        self._keys = tuple((attr, key) for attr, key, _, _, _ in layout)
+        # As a number, the time stamp is the record creation time, output as is (its spec is
+        # None then).
+        if not per_attr_spec:
+            self._keymap = {key: (operator.attrgetter('created') if spec is None else
+                                  _compile(_compiler, self, attr))
+                            for attr, key, spec, _, _ in layout}
+            self._plan = tuple((prefix, self._keymap[key], plan_encoders[kind])
+                               for attr, key, spec, prefix, kind in layout)
+            self._values = self._values2
+            if direct_json:
+                self.format = self._format_direct
+            else:
+                self.format, self.format_bytes = self._format2, self._format_values_bytes
 
         else:
-            selected_attrs = {a: (a, f)
-                              for a, f in dict(FORMAT_PARSERS)[style](fmt) if a in LOG_RECORD_ATTRS}
-            self._keymap = {a: (keymap.get(k, k),
-                                _compiler(self,
-                                          a,
-                                          '{{{}{}}}'.format(':' if selected_attrs[a][1] else '',
-                                                            selected_attrs[a][1])),
-                                )
-                            for a, (k, f) in selected_attrs.items()}
-            self.format = self._format1
+            # The code generator works on whole records, not on attributes.
+            attr_compiler = partial_compiler if _compiler is codegen_compiler else _compiler
+            self._keymap = {attr: (key,
+                                   operator.attrgetter('created') if spec is None else
+                                   _compile(attr_compiler,
+                                            self,
+                                            attr,
+                                            '{{{}{}}}'.format(':' if spec else '', spec)),
+                                   )
+                            for attr, key, spec, _, _ in layout}
+            self._plan = tuple((prefix, self._keymap[attr][1], plan_encoders[kind])
+                               for attr, key, spec, prefix, kind in layout)
+            self._values = self._values1
+            if _compiler is codegen_compiler:
+                self.format, self.format_bytes = codegen_compiler(self,
+                                                                  ((attr, spec)
+                                                                   for attr, _, spec, _, _
+                                                                   in layout),
+                                                                  keymap,
+                                                                  direct_json)
+            elif direct_json:
+                self.format = self._format_direct
+            else:
+                self.format, self.format_bytes = self._format1, self._format_values_bytes
+
+        self._profile = {stage: [0, 0, [0] * 65] for stage in PROFILE_STAGES} if profile else None
+        self._profile_lock = threading.Lock()
+        self._profile_interval = profile_interval
+        self._last_report = time.monotonic()
+        self._reporting = False
+        if profile:
+            self._profile_fields = ([(k, f) for k, f in self._keymap.items()]
+                                    if self._values == self._values2 else
+                                    [(k, f) for a, (k, f) in self._keymap.items()])
+            self._values = self._profiled_values
+            self.format, self.format_bytes = self._format_values, self._format_values_bytes
+            self._dumps = self._timed('dumps', self._dumps)
+            self._dumps_bytes = self._timed('dumps', self._dumps_bytes)
+            self.formatException = self._timed('exception', self.formatException)
+            self.formatStack = self._timed('stack', self.formatStack)
+
+        intern_attrs = set(intern_fields or ())
+        self._intern_keys = tuple(keymap.get(a, a) for a in selected_attrs if a in intern_attrs)
+        self._interned = {key: {} for key in self._intern_keys}  # type: Dict[str, Dict[str, int]]
+        self._intern_reset = intern_reset
+        self._intern_count = 0
+        if intern_fields:
+            unknown_fields = intern_attrs - set(INTERNABLE_ATTRS)
+            if unknown_fields:
+                raise ValueError('Fields that cannot be interned: {}'
+                                 .format(', '.join(sorted(unknown_fields))))
+            self._values_fields = self._values
+            self._values = self._interned_values
+            self.format, self.format_bytes = self._format_values, self._format_values_bytes
 
         # self._datefmt = datefmt or '%Y-%m-%dT%H:%M:%S.%f'
         self._raw_fmt = fmt  # TODO: only useful for debug, remove ?
+        self._traceback_cache = _LRUCache(traceback_cache_size)
+        self._collapse_recursion = collapse_recursion
+        self._max_frames = max_frames
+        self._source_lines = source_lines
         self._relative_paths = relative_paths
+        self._package_dirs = (_package_dirs(tuple(path_prefixes))
+                              if path_prefixes else self.__package_dirs)
         self._blob = not format_stacks
-
-        unknown_keys = set(keymap.keys()) - set(selected_attrs.keys())
+        self._encoders = dict(DEFAULT_ENCODERS)
+        self._encoders.update(encoders or {})
+        self._encoder_cache = {}  # type: Dict[type, Callable[[Any, int], Any]]
+        self._extras_max_depth = extras_max_depth
+        self._extras_max_length = extras_max_length
+        self._static_fragment = (self._dumps(self._encodable(dict(static_fields)))[1:-1]
+                                 if static_fields else '')
+        self._static = _fragments(self._static_fragment)
+        if max_field_length is not None or max_line_bytes is not None:
+            unknown_fields = set(drop_order) - {'extras', 'frames'} - set(LOG_RECORD_ATTRS)
+            if unknown_fields:
+                raise ValueError('Unknown fields to drop: {}'
+                                 .format(', '.join(sorted(unknown_fields))))
+            self._max_field_length = max_field_length
+            # Static fields take the place of the opening brace, already accounted for.
+            self._max_line_bytes = max_line_bytes
+            self._line_budget = (None if max_line_bytes is None else
+                                 max_line_bytes - len(self._static[2]) + 1)
+            self._record_keys = frozenset([keymap.get(a, a) for a in selected_attrs]
+                                          + ([INTERN_KEY] if intern_fields else []))
+            self._drop_order = tuple(('extras', None) if field == 'extras' else
+                                     ('frames', keymap.get('exc_info', 'exc_info'))
+                                     if field == 'frames' else
+                                     ('field', keymap.get(field, field))
+                                     for field in drop_order)
+            self.format, self.format_bytes = self._format_limited, self._format_limited_bytes
+        self._context_vars = tuple(context_vars or ())
+        self._context_cache = {}  # type: Dict[Tuple[int, ...], Tuple[Tuple[Any, ...], List[Any]]]
+        if static_fields or context_vars:
+            if 'format_bytes' in vars(self):  # Otherwise, format_bytes encodes format's output
+                self._format_fields_bytes = self.format_bytes
+                self.format_bytes = (self._format_context_bytes if context_vars else
+                                     self._format_static_bytes)
+            self._format_fields = self.format
+            self.format = self._format_context if context_vars else self._format_static
+
+        if profile:
+            self.format = self._timed('format', self.format)
+            self.format_bytes = self._timed('format', self.format_bytes)
+
+        duplicate_keys = ((set(static_fields or ()) | {var.name for var in self._context_vars})
+                          & {keymap.get(a, a) for a in selected_attrs})
+        if duplicate_keys:
+            raise ValueError('Static fields or context variables would duplicate log record '
+                             'keys: {}'
+                             .format(', '.join(sorted(duplicate_keys))))
+        unknown_keys = set(keymap.keys()) - set(selected_attrs)
         if unknown_keys:
             warnings.warn('Your configuration contains unknown log record keys: {}'
                           .format(', '.join(unknown_keys)))
@@ -342,80 +1250,2372 @@ class Formatter(logging.Formatter):
             warnings.warn('No attributes to seralize to JSON ! '
                           'The format string and format style you selected may not match')
 
-    def _format1(self, record: logging.LogRecord) -> str:
+    def register_encoder(self, type_: type, encoder: Callable[[Any], Any]) -> None:
+        """Registers how to turn extra values of a type (or of its subclasses) into JSON.
+
+        ``encoder`` returns a value JSON can represent, or any value the formatter
+        knows how to encode in turn.
+        """
+        self._encoders[type_] = encoder
+        self._encoder_cache.clear()
+
+    def _encoder(self, cls: type) -> Callable[[Any, int], Any]:
+        """Returns, and caches, the function encoding extra values of a given type.
+        """
+        containers = {dict: self._encodable_dict,
+                      frozenset: self._encodable_list,
+                      list: self._encodable_list,
+                      set: self._encodable_list,
+                      str: self._encodable_str,
+                      tuple: self._encodable_list,
+                      }
+        for base in cls.__mro__:
+            if base in self._encoders:
+                convert = self._encoders[base]
+                break
+            if base in containers:
+                self._encoder_cache[cls] = containers[base]
+                return containers[base]
+        else:
+            convert = (_dataclass_fields
+                       if dataclasses is not None and dataclasses.is_dataclass(cls) else
+                       str)
+
+        def encoder(value: Any, depth: int) -> Any:
+            return self._encodable(convert(value), depth + 1)
+
+        self._encoder_cache[cls] = encoder
+        return encoder
+
+    def _encodable(self, value: Any, depth: int = 0) -> Any:
+        """Turns an extra value into one JSON can represent, applying depth and length limits.
+        """
+        cls = value.__class__
+        if cls in _JSON_SCALARS:
+            return value
+        try:
+            encoder = self._encoder_cache[cls]
+        except KeyError:
+            encoder = self._encoder(cls)
+        return encoder(value, depth)
+
+    def _encodable_dict(self, value: Dict[Any, Any], depth: int) -> Any:
+        if depth >= self._extras_max_depth:
+            return MAX_DEPTH_MARKER
+        output = {}
+        for key, item in value.items():
+            if len(output) == self._extras_max_length:
+                output['...'] = TRUNCATED_ITEMS_MARKER.format(len(value) - len(output))
+                break
+            output[key if key.__class__ is str else str(key)] = self._encodable(item, depth + 1)
+        return output
+
+    def _encodable_list(self, value: Iterable[Any], depth: int) -> Any:
+        if depth >= self._extras_max_depth:
+            return MAX_DEPTH_MARKER
+        output = []
+        for item in value:
+            if len(output) == self._extras_max_length:
+                output.append(TRUNCATED_ITEMS_MARKER.format(len(value) - len(output)))
+                break
+            output.append(self._encodable(item, depth + 1))
+        return output
+
+    def _encodable_str(self, value: str, depth: int) -> str:
+        if len(value) > self._extras_max_length:
+            return (value[:self._extras_max_length]
+                    + TRUNCATED_TEXT_MARKER.format(len(value) - self._extras_max_length))
+        return value
+
+    def _encoded_extras(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """Extracts the extra attributes of a LogRecord, as values JSON can represent.
+        """
+        return {k: self._encodable(v) for k, v in _extras(record).items()}
+
+    def _values1(self, record: logging.LogRecord) -> Dict[str, Any]:
         output = {k: f(record) for a, (k, f) in self._keymap.items()}
-        output.update({k: str(getattr(record, k))
-                       for k in dir(record)
-                       if k not in _ALL_LOG_RECORD_ATTRS and not k.startswith('__')})
-        return json.dumps(output, separators=(',', ':'))
+        output.update(self._encoded_extras(record))
+        return output
 
-    def _format2(self, record: logging.LogRecord) -> str:
+    def _values2(self, record: logging.LogRecord) -> Dict[str, Any]:
         output = {k: f(record) for k, f in self._keymap.items()}
-        output.update({k: str(getattr(record, k))
-                       for k in dir(record)
-                       if k not in _ALL_LOG_RECORD_ATTRS and not k.startswith('__')})
-        return json.dumps(output, separators=(',', ':'))
-
-    # def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None):
-    #     datefmt = datefmt or self._datefmt
-    #     timestamp = datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc)
-    #     if datefmt:
-    #         return timestamp.strftime(datefmt)
-    #     return timestamp.isoformat()
+        output.update(self._encoded_extras(record))
+        return output
+
+    def _format1(self, record: logging.LogRecord) -> str:
+        return self._dumps(self._values1(record))
+
+    def _format2(self, record: logging.LogRecord) -> str:
+        return self._dumps(self._values2(record))
+
+    def _format_limited(self, record: logging.LogRecord) -> str:
+        return self._format_limited_bytes(record).decode('utf-8')
+
+    def _format_limited_bytes(self, record: logging.LogRecord) -> bytes:
+        """Formats a log record within the field length and line size limits.
+        """
+        values = self._values(record)
+        max_length = self._max_field_length
+        if max_length is not None:
+            for key, value in values.items():
+                if value.__class__ is str and len(value) > max_length:
+                    values[key] = (value[:max_length]
+                                   + TRUNCATED_TEXT_MARKER.format(len(value) - max_length))
+        budget = self._line_budget
+        if budget is None:
+            return self._dumps_bytes(values)
+        if self._context_vars:  # Their fragment, with the static fields, varies by record
+            budget = self._max_line_bytes - len(self._context_fragments(record)[2]) + 1
+
+        # The values an entry announces are kept whole: later entries refer to them.
+        announced = values.get(INTERN_KEY, ())
+        # The size of string values is a lower bound of that of the entry: fields are
+        # left out without encoding them while it exceeds the budget.
+        drops = iter(self._drop_order)
+        while _min_size(values) > budget and self._drop(values, next(drops, None), announced):
+            pass
+        output = self._dumps_bytes(values)
+        while len(output) > budget and self._drop(values, next(drops, None), announced):
+            output = self._dumps_bytes(values)
+
+        # Last resort, truncates the longest string, until none can be shortened.
+        shortened = set(announced)
+        while len(output) > budget:
+            candidates = [k for k, v in values.items() if v.__class__ is str and k not in shortened]
+            if not candidates:
+                break  # The fields left cannot fit: the entry is as short as it gets.
+            key = max(candidates, key=lambda k: len(values[k]))
+            value = values[key]
+            # Escaped characters take more than a byte: cut in proportion to the encoded size.
+            size = len(self._dumps_bytes(value))
+            target = size - (len(output) - budget) - len(TRUNCATED_TEXT_MARKER) - 8
+            keep = max(0, target * len(value) // size)
+            truncated = value[:keep] + TRUNCATED_TEXT_MARKER.format(len(value) - keep)
+            if keep == 0 or len(truncated) >= len(value):
+                shortened.add(key)  # Cut to the marker, or too short to cut
+            if len(truncated) < len(value):
+                values[key] = truncated
+                output = self._dumps_bytes(values)
+        return output
+
+    def _drop(self, values: Dict[str, Any], drop: Optional[Tuple[str, Optional[str]]],
+              announced: Iterable[str] = ()) -> bool:
+        """Leaves a field out of the values of a log entry, returns whether there was one to.
+
+        Fields whose value the entry announces (see ``intern_fields``) are kept.
+        """
+        if drop is None:
+            return False
+        kind, key = drop
+        if kind == 'extras':
+            for extra in [k for k in values if k not in self._record_keys]:
+                del values[extra]
+        elif kind == 'frames':
+            exception = values.get(key)
+            if isinstance(exception, dict) and 'frames' in exception:
+                values[key] = {k: v for k, v in exception.items() if k != 'frames'}
+        elif key not in announced:
+            values.pop(key, None)
+        return True
+
+    def _interned_values(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """Returns the values of a log entry, with those of interned fields seen before
+        replaced by their number, and the numbers of the others under :data:`INTERN_KEY`.
+        """
+        values = self._values_fields(record)
+        if self._intern_count >= self._intern_reset:
+            self.reset_interning()
+        self._intern_count += 1
+        announced = None
+        for key in self._intern_keys:
+            value = values.get(key)
+            if value.__class__ is not str:  # Numbers would be taken for references
+                continue
+            interned = self._interned[key]
+            number = interned.get(value)
+            if number is None:
+                if announced is None:
+                    announced = {}
+                announced[key] = interned[value] = len(interned)
+            else:
+                values[key] = number
+        if announced is not None:
+            values[INTERN_KEY] = announced
+        return values
+
+    def reset_interning(self) -> None:
+        """Numbers interned values anew, from the next entry on (see ``intern_fields``).
+        """
+        for interned in self._interned.values():
+            interned.clear()
+        self._intern_count = 0
+
+    def _profiled_values(self, record: logging.LogRecord) -> Dict[str, Any]:
+        start = _clock()
+        values = {k: f(record) for k, f in self._profile_fields}
+        middle = _clock()
+        values.update(self._encoded_extras(record))
+        end = _clock()
+        self._record_stage('attributes', middle - start)
+        self._record_stage('extras', end - middle)
+        return values
+
+    def _record_stage(self, stage: str, duration: int) -> None:
+        with self._profile_lock:
+            counters = self._profile[stage]
+            counters[0] += 1
+            counters[1] += duration
+            counters[2][min(max(duration, 0).bit_length(), 64)] += 1
+
+    def _timed(self, stage: str, function: Callable[..., Any]) -> Callable[..., Any]:
+        """Returns a function timing calls to another as a stage, and logging statistics
+        when they are due, for the ``'format'`` stage.
+        """
+        record_stage = self._record_stage
+        report = stage == 'format' and self._profile_interval is not None
+
+        def timed(*args):
+            start = _clock()
+            try:
+                return function(*args)
+            finally:
+                record_stage(stage, _clock() - start)
+                if (report and not self._reporting
+                        and time.monotonic() - self._last_report >= self._profile_interval):
+                    self.log_stats()
+
+        return timed
+
+    def stats(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Returns, by stage, the number of times, and nanoseconds, a profiling formatter
+        spent formatting (see :data:`PROFILE_STAGES`).
+
+        Besides the ``count`` and the ``total_ns``, the ``histogram`` of a stage lists,
+        for each power of two of nanoseconds, the number of durations below it (and not
+        below the previous one). Formatters not profiling return an empty dictionary.
+
+        Arguments:
+            reset: whether to start counting over.
+        """
+        if self._profile is None:
+            return {}
+        with self._profile_lock:
+            stats = {stage: {'count': count,
+                             'total_ns': total,
+                             'histogram': [[1 << bucket if bucket else 0, number]
+                                           for bucket, number in enumerate(histogram)
+                                           if number],
+                             }
+                     for stage, (count, total, histogram) in self._profile.items()}
+            if reset:
+                self._profile = {stage: [0, 0, [0] * 65] for stage in PROFILE_STAGES}
+        return stats
+
+    def log_stats(self) -> None:
+        """Logs the statistics of a profiling formatter through the :data:`PROFILE_LOGGER`
+        logger, then resets them.
+        """
+        self._last_report = time.monotonic()
+        self._reporting = True
+        try:
+            logging.getLogger(PROFILE_LOGGER).info(PROFILE_MESSAGE,
+                                                   extra={'formatter_stats':
+                                                          self.stats(reset=True)})
+        finally:
+            self._reporting = False
+
+    def _format_values(self, record: logging.LogRecord) -> str:
+        return self._dumps(self._values(record))
+
+    def _format_values_bytes(self, record: logging.LogRecord) -> bytes:
+        return self._dumps_bytes(self._values(record))
+
+    def _format_direct(self, record: logging.LogRecord) -> str:
+        body = ''.join([prefix + encode(f(record)) for prefix, f, encode in self._plan])
+        extras = self._encoded_extras(record)
+        if extras:
+            body += ',' + self._dumps(extras)[1:-1]
+        return '{' + body[1:] + '}'
+
+    def _format_static(self, record: logging.LogRecord) -> str:
+        output = self._format_fields(record)
+        if len(output) == 2:  # '{}'
+            return self._static[1]
+        return self._static[0] + output[1:]
+
+    def _format_static_bytes(self, record: logging.LogRecord) -> bytes:
+        output = self._format_fields_bytes(record)
+        if len(output) == 2:
+            return self._static[3]
+        return self._static[2] + output[1:]
+
+    def _context_fragments(self, record: logging.LogRecord) -> Tuple[str, str, bytes, bytes]:
+        """Returns the fragments of JSON for the static fields and context variables.
+        """
+        context = record.__dict__.get(_CONTEXT_ATTR)
+        if context is None:
+            values = [var.get(_UNSET) for var in self._context_vars]
+        else:
+            values = [context.get(var, _UNSET) for var in self._context_vars]
+        # The cache keeps the values alive, so their identifiers cannot be reused meanwhile.
+        key = tuple(map(id, values))
+        try:
+            return self._context_cache[key][0]
+        except KeyError:
+            pass
+
+        fields = {var.name: self._encodable(value)
+                  for var, value in zip(self._context_vars, values) if value is not _UNSET}
+        fragment = ','.join(part for part in (self._static_fragment, self._dumps(fields)[1:-1])
+                            if part)
+        fragments = _fragments(fragment)
+        if len(self._context_cache) >= CONTEXT_CACHE_SIZE:
+            self._context_cache.clear()
+        self._context_cache[key] = (fragments, values)
+        return fragments
+
+    def _format_context(self, record: logging.LogRecord) -> str:
+        output = self._format_fields(record)
+        fragments = self._context_fragments(record)
+        if len(output) == 2:
+            return fragments[1]
+        return fragments[0] + output[1:]
+
+    def _format_context_bytes(self, record: logging.LogRecord) -> bytes:
+        output = self._format_fields_bytes(record)
+        fragments = self._context_fragments(record)
+        if len(output) == 2:
+            return fragments[3]
+        return fragments[2] + output[1:]
+
+    def format_bytes(self, record: logging.LogRecord) -> bytes:
+        """Formats a log record as a UTF-8 encoded JSON object.
+
+        Handlers writing to binary streams should prefer this method over :meth:`format`,
+        as some JSON backends produce bytes: it saves a decoding and an encoding.
+        """
+        return self.format(record).encode('utf-8')
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        """Formats the creation time of a log record, according to the formatter time format.
+
+        The formatting of the date and time up to the second is cached, and reused for
+        records created within the same second: only the milliseconds are formatted then.
+        When ``datefmt`` is not given, the one the formatter was created with is used.
+        """
+        if self._time_format == 'epoch':
+            return repr(record.created)
+
+        datefmt = datefmt or self.datefmt
+        seconds = int(record.created)
+        cached_seconds, cached_datefmt, formatted = self._time_cache
+        if seconds != cached_seconds or datefmt != cached_datefmt:
+            if self._time_format == 'iso8601':
+                formatted = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+            else:
+                formatted = time.strftime(datefmt or self.default_time_format,
+                                          self.converter(seconds))
+            # A tuple so threads sharing the formatter never see a partial update.
+            self._time_cache = (seconds, datefmt, formatted)
+
+        if self._time_format == 'iso8601':
+            return '%s.%03dZ' % (formatted, record.msecs)
+        if datefmt or not self.default_msec_format:
+            return formatted
+        return self.default_msec_format % (formatted, record.msecs)
 
     def formatException(self, exc_info: Tuple[Type[BaseException], Exception, Any]):
         """Formats exceptions as a JSON serializable object.
         """
-        tb_frames = []
         type_, value, tbk = exc_info
 
-        if self._relative_paths is True:
-            for filename, lineno, code, line in traceback.extract_tb(tbk):
-                filename = self._relativize(filename)
-                tb_frames.append((filename, lineno, code, line))
-        else:
-            tb_frames = list(tuple(f) for f in traceback.extract_tb(tbk))
+        locations = []
+        tb = tbk
+        while tb is not None:
+            locations.append((tb.tb_frame.f_code, tb.tb_lineno))
+            tb = tb.tb_next
+        locations = tuple(locations)
+
+        tb_frames = self._traceback_cache.get(locations)
+        if tb_frames is None:
+            if self._source_lines:
+                tb_frames = [tuple(f) for f in traceback.extract_tb(tbk)]
+            else:  # Saves reading source files through linecache
+                tb_frames = [(code.co_filename, lineno, code.co_name, None)
+                             for code, lineno in locations]
+            if self._relative_paths is True:
+                tb_frames = [(self._relativize(filename), lineno, code, line)
+                             for filename, lineno, code, line in tb_frames]
+            tb_frames = tuple(self._trim_frames(tb_frames))
+            self._traceback_cache.put(locations, tb_frames)
 
         return {'value': None if value is None else str(value),
                 'type': getattr(type_, '__name__', str(type_)),
-                'frames': tb_frames,
+                'frames': list(tb_frames),
                 }
 
-    def _relativize(self, filename):
-        match = self.__package_dirs.match(filename)
-        if match:
-            return match.group(1)
+    def _trim_frames(self, frames: List[Tuple[str, int, str, Optional[str]]]
+                     ) -> List[Tuple[str, int, str, Optional[str]]]:
+        """Collapses recursions and elides frames in excess, as configured.
+        """
+        if self._collapse_recursion:
+            frames = _collapse_recursion(frames)
+        if self._max_frames is not None and len(frames) > self._max_frames:
+            head = self._max_frames // 2
+            tail = self._max_frames - head
+            frames = (frames[:head]
+                      + [_marker_frame(ELIDED_FRAMES_MARKER.format(len(frames) - head - tail))]
+                      + frames[len(frames) - tail:])
+        return frames
+
+    def traceback_cache_info(self) -> CacheInfo:
+        """Returns statistics about the use of the structured tracebacks cache.
+        """
+        return self._traceback_cache.info()
 
-        return filename
+    def _relativize(self, filename):
+        key = (self._package_dirs, filename)
+        relative = self._relativize_cache.get(key)
+        if relative is None:
+            match = self._package_dirs.match(filename)
+            relative = match.group(1) if match else filename
+            self._relativize_cache.put(key, relative)
+
+        return relative
+
+    @classmethod
+    def relativize_cache_info(cls) -> CacheInfo:
+        """Returns statistics about the use of the relative paths cache, shared by formatters.
+        """
+        return cls._relativize_cache.info()
 
     def formatStack(self, stack_info):
         if self._blob:
             return stack_info
+
+        frames = getattr(stack_info, 'frames', None)
+        if frames is not None:  # Captured from the frames by Logger, nothing to parse.
+            stack_frames = list(frames)
+            if self._relative_paths:
+                stack_frames = [(self._relativize(filename), lineno, code, line)
+                                for filename, lineno, code, line in stack_frames]
         else:
             stack_frames = []
+            for text in stack_info.split('\n')[1:]:
+                match = self.__code_location.match(text)
+                if match is not None:
+                    filename, lineno, code = match.groups()
+                    if self._relative_paths:
+                        filename = self._relativize(filename)
+                    stack_frames.append((filename, int(lineno), code, None))
+                elif stack_frames and self._source_lines:  # Frames source is not always known
+                    stack_frames[-1] = stack_frames[-1][:3] + (text, )
+        stack_frames = self._trim_frames(stack_frames)
 
-            stack_info_lines = stack_info.split('\n')[1:]
-            for location, line in zip(stack_info_lines[0::2], stack_info_lines[1::2]):
-                match = self.__code_location.match(location)
-                filename, lineno, code = ('?', '?', '?') if match is None else match.groups()
-                if self._relative_paths:
-                    filename = self._relativize(filename)
-                stack_frames.append((filename, lineno, code, line))
-
-        # else:  # TODO: Appears we never receive something other than a string. DEAD CODE
-        #     if self._relative_path is True:
-        #         for filename, lineno, code, line in traceback.extract_stack():
-        #             if filename[0] == '<':
-        #                 stack_frames.append((filename, lineno, code, line))
-        #                 continue
-        #             match = self.__package_dirs.match(filename)
-        #             if match:
-        #                 stack_frames.append((match.group(1), lineno, code, line))
-        #                 continue
-        #             stack_frames.append((filename, lineno, code, line))
-        #     else:
-        #         stack_frames = list(traceback.extract_stack(stack_info))
         return {'frames': stack_frames}
 
 
+_stack_locations = {}  # type: Dict[Any, str]
+#: Templates of the stack frames locations rendered by :class:`Logger`, per code object.
+
+
+class _StructuredStack(str):
+    """The stack information of a log record, along with the frames it was rendered from.
+
+    It renders as the :meth:`logging.Logger.findCaller` does, but without source code
+    lines, so other formatters can use it as usual, while :class:`Formatter` uses
+    the frames directly.
+    """
+
+    def __new__(cls, text: str, frames: Tuple[Tuple[str, int, str, None], ...]
+                ) -> '_StructuredStack':
+        stack = super().__new__(cls, text)
+        stack.frames = tuple(frames)
+        return stack
+
+    def __reduce__(self):
+        return self.__class__, (str(self), self.frames)
+
+    @classmethod
+    def capture(cls, frame) -> '_StructuredStack':
+        """Returns the stack of frames leading to, and including, a frame.
+        """
+        frames = []
+        lines = ['Stack (most recent call last):']
+        while frame is not None:
+            code = frame.f_code
+            location = _stack_locations.get(code)
+            if location is None:
+                if len(_stack_locations) >= 4096:  # Code may be dynamically generated
+                    _stack_locations.clear()
+                location = '  File "{}", line %d, in {}'.format(code.co_filename, code.co_name)
+                _stack_locations[code] = location
+            frames.append((code.co_filename, frame.f_lineno, code.co_name, None))
+            lines.append(location % frame.f_lineno)
+            frame = frame.f_back
+        frames.reverse()
+        lines[1:] = reversed(lines[1:])
+        return cls('\n'.join(lines), frames)
+
+
+def _is_internal_frame(frame) -> bool:
+    """Tells whether a frame belongs to the logging machinery (see :meth:`Logger.findCaller`).
+    """
+    filename = frame.f_code.co_filename
+    return (filename in _INTERNAL_SOURCES
+            or ('importlib' in filename and '_bootstrap' in filename))
+
+
+class Logger(logging.Logger):
+    """A :class:`logging.Logger` that captures stack information as frames, not as text.
+
+    When logging with ``stack_info=True``, the standard logger renders the stack as
+    text, reading source files, and :class:`Formatter` would then have to parse that
+    text back into frames. This logger records the frames as they are walked, and
+    renders them without source lines, which makes stack information cheap enough to be
+    left on. To use it::
+
+        logging.setLoggerClass(jsonlogging.Logger)
+
+    before any logger is created.
+    """
+
+    def findCaller(self, stack_info: bool = False, stacklevel: int = 1):
+        """Finds the stack frame of the caller, its location, and the stack leading to it.
+        """
+        frame = sys._getframe(0)
+        while stacklevel > 0:
+            next_frame = frame.f_back
+            if next_frame is None:
+                break
+            frame = next_frame
+            if not _is_internal_frame(frame):
+                stacklevel -= 1
+
+        code = frame.f_code
+        return (code.co_filename,
+                frame.f_lineno,
+                code.co_name,
+                _StructuredStack.capture(frame) if stack_info else None)
+
+
+_INTERNAL_SOURCES = frozenset((logging.Logger.findCaller.__code__.co_filename,
+                               Logger.findCaller.__code__.co_filename))
+#: The source files of the logging machinery, which frames a logger skips to find its caller.
+
+
+def _format_bytes(handler: logging.Handler, record: logging.LogRecord) -> bytes:
+    """Formats a log record with the handler's formatter, as UTF-8 encoded bytes.
+    """
+    formatter = handler.formatter
+    if isinstance(formatter, Formatter):
+        return formatter.format_bytes(record)
+    return handler.format(record).encode('utf-8')
+
+
+def _binary_buffer(stream) -> Optional[IO[bytes]]:
+    """Returns the binary stream to write log entries to, or ``None`` for a text stream
+    without any.
+    """
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is None and not isinstance(stream, io.TextIOBase):
+        return stream
+    return buffer
+
+
+class StreamHandler(logging.StreamHandler):
+    """A :class:`logging.StreamHandler` that writes the bytes :class:`Formatter` produces.
+
+    Log entries are written to the binary buffer underlying text streams (like
+    :data:`sys.stderr`), or to the stream itself if it is binary. Text streams without a
+    buffer (like :class:`io.StringIO`) are written strings.
+    """
+
+    terminator = b'\n'
+
+    def __init__(self, stream=None) -> None:
+        """Initializes the handler, which writes to ``stream`` (defaults to :data:`sys.stderr`).
+        """
+        super().__init__(stream)
+        self._buffer = _binary_buffer(self.stream)
+
+    def setStream(self, stream):
+        """Sets the stream the handler writes to, returning the former one.
+        """
+        result = super().setStream(stream)
+        self._buffer = _binary_buffer(self.stream)
+        return result
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Writes a formatted log record, followed by a new line, to the stream.
+        """
+        try:
+            if self._buffer is None:
+                self.stream.write(self.format(record) + '\n')
+            else:
+                self._buffer.write(_format_bytes(self, record) + self.terminator)
+            self.flush()
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class FileHandler(logging.FileHandler):
+    """A :class:`logging.FileHandler` that writes the bytes :class:`Formatter` produces.
+    """
+
+    terminator = b'\n'
+
+    def __init__(self, filename: str, mode: str = 'ab', delay: bool = False) -> None:
+        """Initializes the handler, which appends log entries to the file ``filename``.
+        """
+        if 'b' not in mode:
+            mode += 'b'
+        super().__init__(filename, mode=mode, delay=delay)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Writes a formatted log record, followed by a new line, to the file.
+        """
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(_format_bytes(self, record) + self.terminator)
+            self.flush()
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+COMPRESSIONS = (('gzip', '.gz', lambda: zlib),
+                ('zstd', '.zst', lambda: zstandard),
+                )
+#: The compression formats a :class:`CompressedRotatingFileHandler` can use: their name, the
+#: suffix of the files they compress, and a function returning their module (``None`` when
+#: it is not installed).
+
+
+def _compression(name: str) -> Tuple[str, Callable[[Optional[int]], Any], Any]:
+    """Returns the suffix, a factory of streaming compressors taking a compression level, and
+    the mode that flushes compressors to a point where the output can be decompressed.
+
+    Compressors have a ``compress(data)`` method, and a ``flush(mode)`` one, which finishes
+    the compressed stream when called without a mode.
+    """
+    for compression, suffix, module in COMPRESSIONS:
+        if compression == name:
+            if module() is None:
+                raise ImportError('The {} compression is not installed'.format(name))
+            break
+    else:
+        raise ValueError('Unknown compression: {} (choose from {})'
+                         .format(name, ', '.join(c for c, _, _ in COMPRESSIONS)))
+
+    if name == 'gzip':
+        return (suffix,
+                lambda level: zlib.compressobj(-1 if level is None else level, zlib.DEFLATED, 31),
+                zlib.Z_SYNC_FLUSH)
+    return (suffix,
+            lambda level: zstandard.ZstdCompressor(level=3 if level is None else level)
+            .compressobj(),
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+class CompressedRotatingFileHandler(FileHandler):
+    """A file handler that rotates files once they reach a size, and compresses them.
+
+    Rotated files are renamed, then compressed by a background thread, so the logging thread
+    never waits for the compression (which releases the GIL), and kept as ``<filename>.1.gz``
+    (the most recent) to ``<filename>.<backup_count>.gz``. With ``stream``, entries are
+    compressed as they are written, to ``<filename>.gz``, and the compressor is flushed
+    to a point from which what was written can be decompressed every ``sync_interval``
+    seconds, and by :meth:`flush`, so the tail of the file stays readable (*e.g.* with
+    ``zcat``). Rotating only takes renaming files then.
+
+    Attributes:
+        bytes_in: the number of bytes of log entries written.
+        bytes_out: the number of compressed bytes written.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 backup_count: int = 5,
+                 compression: str = 'gzip',
+                 compression_level: int = None,
+                 stream: bool = False,
+                 sync_interval: float = 1.0,
+                 delay: bool = False,
+                 ) -> None:
+        """Initializes the handler, which appends log entries to the file ``filename``.
+
+        Arguments:
+            max_bytes: the size of the file (compressed, with ``stream``) from which the
+                handler rotates it.
+            backup_count: the number of rotated files to keep.
+            compression: ``'gzip'`` or, if the ``zstandard`` package is installed,
+                ``'zstd'``.
+            compression_level: the compression level, the compression's default if
+                ``None``.
+            stream: whether to compress entries as they are written.
+            sync_interval: the number of seconds between flushes of the compressor, with
+                ``stream``.
+        """
+        self._suffix, self._new_compressor, self._sync_mode = _compression(compression)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compression_level = compression_level
+        self.sync_interval = sync_interval
+        self.bytes_in = self.bytes_out = 0
+        self._basename = os.path.abspath(filename)
+        self._compressor = None  # With stream, that of the current file
+        self._jobs = None  # type: Optional[queue.Queue]
+        self._last_sync = time.monotonic()
+        self._rotations = 0
+        self._size = 0
+        self._streaming = stream
+        self._worker = None  # type: Optional[threading.Thread]
+        super().__init__(filename + self._suffix if stream else filename, mode='ab', delay=delay)
+
+    def _open(self):
+        stream = super()._open()
+        self._size = os.fstat(stream.fileno()).st_size
+        if self._streaming:  # Appends a new gzip member, or zstd frame, which both allow
+            self._compressor = self._new_compressor(self.compression_level)
+            self._last_sync = time.monotonic()
+        return stream
+
+    def _backup_name(self, number: int) -> str:
+        return '{}.{}{}'.format(self._basename, number, self._suffix)
+
+    def _shift_backups(self) -> None:
+        for number in range(self.backup_count - 1, 0, -1):
+            source = self._backup_name(number)
+            if os.path.exists(source):
+                os.replace(source, self._backup_name(number + 1))
+
+    def _write_compressed(self, data: bytes) -> None:
+        if data:
+            self.stream.write(data)
+            self._size += len(data)
+            self.bytes_out += len(data)
+
+    def _sync(self) -> None:
+        self._write_compressed(self._compressor.flush(self._sync_mode))
+        self.stream.flush()
+        self._last_sync = time.monotonic()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Writes a formatted log record, followed by a new line, rotating the file if full.
+        """
+        try:
+            data = _format_bytes(self, record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            if self._size and self._size + len(data) > self.max_bytes:
+                self.doRollover()
+                # Anew, as the formatter may refer to values output in the previous file.
+                data = _format_bytes(self, record) + self.terminator
+            self.bytes_in += len(data)
+            if self._compressor is None:
+                self.stream.write(data)
+                self.stream.flush()
+                self._size += len(data)
+            else:
+                self._write_compressed(self._compressor.compress(data))
+                if time.monotonic() - self._last_sync >= self.sync_interval:
+                    self._sync()
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """Flushes the file, and with ``stream``, the compressor.
+        """
+        with self.lock:
+            if self._compressor is not None and self.stream is not None:
+                self._sync()
+            else:
+                super().flush()
+
+    def doRollover(self) -> None:
+        """Closes the current file, and has it compressed and renamed as the first backup.
+        """
+        if self.stream is not None:
+            if self._compressor is not None:
+                self._write_compressed(self._compressor.flush())
+                self._compressor = None
+            self.stream.close()
+            self.stream = None
+
+        if self._streaming:
+            self._shift_backups()
+            if self.backup_count > 0:
+                os.replace(self.baseFilename, self._backup_name(1))
+            else:
+                os.remove(self.baseFilename)
+        elif os.path.exists(self.baseFilename):
+            self._rotations += 1
+            rotated = '{}.rotated-{}-{}'.format(self.baseFilename, os.getpid(), self._rotations)
+            os.replace(self.baseFilename, rotated)
+            if self._jobs is None:
+                self._jobs = queue.Queue()
+                self._worker = threading.Thread(target=self._compress_rotated,
+                                                name='jsonlogging-compression',
+                                                daemon=True)
+                self._worker.start()
+            self._jobs.put(rotated)
+        self.stream = self._open()
+        if isinstance(self.formatter, Formatter):  # Lets the new file be read on its own
+            self.formatter.reset_interning()
+
+    def _compress_rotated(self) -> None:
+        """Compresses rotated files into backups, in order, until told to stop.
+        """
+        while True:
+            rotated = self._jobs.get()
+            if rotated is None:
+                return
+            try:
+                self._shift_backups()
+                if self.backup_count > 0:
+                    compressed = self._backup_name(1)
+                    compressor = self._new_compressor(self.compression_level)
+                    with open(rotated, 'rb') as source, open(compressed + '.tmp', 'wb') as target:
+                        for chunk in iter(functools.partial(source.read, 1024 * 1024), b''):
+                            self.bytes_out += target.write(compressor.compress(chunk))
+                        self.bytes_out += target.write(compressor.flush())
+                    os.replace(compressed + '.tmp', compressed)
+                os.remove(rotated)
+            except Exception:  # Keeps the rotated file, uncompressed
+                traceback.print_exc(file=sys.stderr)
+
+    def close(self) -> None:
+        """Finishes the compressed stream, closes the file, and waits for compressions to end.
+        """
+        with self.lock:
+            if self._compressor is not None and self.stream is not None:
+                self._write_compressed(self._compressor.flush())
+                self._compressor = None
+            super().close()
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._jobs.put(None)
+            worker.join()
+            self._jobs = None
+
+
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, OSError, ValueError):  # pragma: no cover
+    _IOV_MAX = 1024
+
+
+def _write_buffers(fd: int, buffers: List[bytes]) -> None:
+    """Writes buffers to a file descriptor, with one system call per :data:`_IOV_MAX` buffers.
+    """
+    if not hasattr(os, 'writev'):  # pragma: no cover
+        buffers = [b''.join(buffers)]
+    while buffers:
+        chunk, buffers = buffers[:_IOV_MAX], buffers[_IOV_MAX:]
+        if len(chunk) == 1:
+            written = os.write(fd, chunk[0])
+        else:
+            written = os.writev(fd, chunk)
+        if written < sum(map(len, chunk)):  # Partial write: retry with what is left
+            buffers.insert(0, b''.join(chunk)[written:])
+
+
+def _register_at_fork(obj: Any, **hooks: str) -> None:
+    """Registers methods of ``obj`` to call around forks, for as long as ``obj`` lives.
+
+    The keyword arguments are those of :func:`os.register_at_fork`, given method names.
+    """
+    if not hasattr(os, 'register_at_fork'):  # pragma: no cover
+        return
+
+    ref = weakref.ref(obj)
+
+    def call(name):
+        def hook():
+            target = ref()
+            if target is not None:
+                getattr(target, name)()
+        return hook
+
+    os.register_at_fork(**{when: call(name) for when, name in hooks.items()})
+
+
+class BufferedFileHandler(logging.Handler):
+    """A handler that appends log records to a JSON-lines file, in batches.
+
+    Formatted records are kept in memory until the buffer reaches ``buffer_size`` bytes,
+    ``flush_interval`` seconds have passed since the last flush, or a record is logged
+    at ``flush_level`` or above. The batch is then written with a single system call
+    (``os.writev``). Like every handler, it is flushed and closed by
+    :func:`logging.shutdown`, which runs at interpreter exit. It is flushed before the
+    process forks, and children start with an empty buffer.
+    """
+
+    terminator = b'\n'
+
+    def __init__(self,
+                 filename: str,
+                 buffer_size: int = 64 * 1024,
+                 flush_interval: float = 1.0,
+                 flush_level: int = logging.ERROR,
+                 level: int = logging.NOTSET,
+                 ) -> None:
+        """Initializes a handler that appends log records to the file ``filename``.
+
+        Arguments:
+            buffer_size: the number of bytes buffered that triggers a flush.
+            flush_interval: the maximum number of seconds records stay in the buffer.
+                A background thread flushes the buffer if no record is logged in the
+                meantime. ``None`` disables time based flushes.
+            flush_level: the level from which records trigger a flush, so they reach
+                the file immediately.
+        """
+        super().__init__(level)
+        self.baseFilename = os.path.abspath(filename)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._buffer = []  # type: List[bytes]
+        self._buffered = 0
+        self._fd = self._open()
+        self._last_flush = time.monotonic()
+        self._stopping = threading.Event()
+        self._start_flusher()
+        _register_at_fork(self, before='flush', after_in_child='_after_fork')
+
+    def _after_fork(self) -> None:
+        # The parent flushed before forking: what is left is not the child's to write.
+        self._buffer, self._buffered = [], 0
+        self._start_flusher()
+
+    def _open(self) -> int:
+        return os.open(self.baseFilename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+
+    def _start_flusher(self) -> None:
+        if self.flush_interval is None or self._stopping.is_set():
+            return
+        flusher = threading.Thread(target=self._flush_periodically,
+                                   name='{}-flusher'.format(self.__class__.__name__),
+                                   daemon=True)
+        flusher.start()
+
+    def _write(self, buffers: List[bytes]) -> None:
+        _write_buffers(self._fd, buffers)
+
+    def _flush_periodically(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def close(self) -> None:
+        """Writes the records left in the buffer, then closes the file.
+        """
+        with self.lock:
+            self.flush()
+            self._stopping.set()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            super().close()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Buffers a formatted log record, and flushes the buffer if a threshold is reached.
+        """
+        try:
+            data = _format_bytes(self, record) + self.terminator
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if (self._buffered >= self.buffer_size or record.levelno >= self.flush_level
+                    or (self.flush_interval is not None
+                        and time.monotonic() - self._last_flush >= self.flush_interval)):
+                self.flush()
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """Writes the buffered records to the file.
+        """
+        with self.lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer or self._fd is None:
+                return
+            buffer, self._buffer, self._buffered = self._buffer, [], 0
+            self._write(buffer)
+
+
+class MultiprocessFileHandler(BufferedFileHandler):
+    """A :class:`BufferedFileHandler` safe to share between processes, *e.g.* pre-fork workers.
+
+    Buffered records are written in batches of whole records of at most ``atomic_size``
+    bytes, each with a single write to the file, opened in append mode: batches of
+    different processes never interleave. Records larger than ``atomic_size`` are written
+    while holding an exclusive lock on the ``<filename>.lock`` file, and batches while
+    holding a shared one, so records the system splits the write of are not torn by
+    other processes' batches. Batches themselves are only split on errors, like a full
+    disk: their remainder is written while holding the shared lock still, so it may
+    follow other processes' batches, but never tears an oversized record.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 atomic_size: int = getattr(select, 'PIPE_BUF', 512),
+                 **kwargs: Any,
+                 ) -> None:
+        """Initializes a handler that appends log records to the file ``filename``.
+
+        Arguments:
+            atomic_size: the maximum size of writes made without a lock.
+
+        Other arguments are those of :class:`BufferedFileHandler`.
+        """
+        self.atomic_size = atomic_size
+        self._lock_fd = None
+        super().__init__(filename, **kwargs)
+
+    def _write(self, buffers: List[bytes]) -> None:
+        batch = []  # type: List[bytes]
+        size = 0
+        for data in buffers:
+            if size + len(data) > self.atomic_size and batch:
+                self._write_batch(batch)
+                batch, size = [], 0
+            if len(data) > self.atomic_size:
+                self._write_locked(data)
+            else:
+                batch.append(data)
+                size += len(data)
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        self._write_locked(b''.join(batch), exclusive=False)
+
+    def _write_locked(self, data: bytes, exclusive: bool = True) -> None:
+        if fcntl is None:  # pragma: no cover
+            _write_buffers(self._fd, [data])
+            return
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.baseFilename + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            _write_buffers(self._fd, [data])
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _after_fork(self) -> None:
+        super()._after_fork()
+        # Processes sharing an open lock file share its locks: the child opens its own.
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def close(self) -> None:
+        """Writes the records left in the buffer, then closes the file.
+        """
+        with self.lock:
+            super().close()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+class UnixSocketHandler(logging.Handler):
+    """A handler that sends JSON lines to a :class:`LogAggregator` over a Unix socket.
+
+    Records are formatted in the process that logs, and sent encoded, so the aggregator
+    has nothing left to do but write them. Each process has its own connection (it
+    reconnects after a fork), so lines of different processes never interleave.
+    """
+
+    terminator = b'\n'
+
+    def __init__(self, path: str, level: int = logging.NOTSET) -> None:
+        """Initializes a handler sending records to the aggregator listening at ``path``.
+        """
+        super().__init__(level)
+        self.path = path
+        self.sock = None
+        _register_at_fork(self, after_in_child='_after_fork')
+
+    def _after_fork(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def close(self) -> None:
+        """Closes the connection to the aggregator.
+        """
+        with self.lock:
+            self._after_fork()
+            super().close()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Sends a formatted log record to the aggregator, connecting to it if needed.
+        """
+        try:
+            data = _format_bytes(self, record) + self.terminator
+            if self.sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.connect(self.path)
+                except OSError:
+                    sock.close()
+                    raise
+                self.sock = sock
+            self.sock.sendall(data)
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self._after_fork()  # Reconnect next time
+            self.handleError(record)
+
+
+class LogAggregator:
+    """Collects the JSON lines :class:`UnixSocketHandler` send, and appends them to a file.
+
+    Run it in a single process (or thread) with :meth:`serve_forever`; lines are only
+    written whole, in batches.
+    """
+
+    def __init__(self, path: str, filename: str) -> None:
+        """Initializes an aggregator listening at ``path``, and writing to ``filename``.
+        """
+        self.path = path
+        self.filename = filename
+        self.lines = 0
+        self._stopping = threading.Event()
+        if os.path.exists(path):  # Left over by a previous run
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen(socket.SOMAXCONN)
+        self._server.setblocking(False)
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        """Collects lines until :meth:`shutdown` is called.
+        """
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        pending = {}  # type: Dict[socket.socket, bytes]
+        selector = selectors.DefaultSelector()
+        selector.register(self._server, selectors.EVENT_READ)
+        try:
+            while True:
+                # Once stopping, drain what connections have left to read.
+                stopping = self._stopping.is_set()
+                events = selector.select(0 if stopping else poll_interval)
+                if stopping and not events:
+                    break
+                lines = []
+                for key, _ in events:
+                    if key.fileobj is self._server:
+                        connection, _ = self._server.accept()
+                        connection.setblocking(False)
+                        selector.register(connection, selectors.EVENT_READ)
+                        pending[connection] = b''
+                        continue
+                    data = self._receive(key.fileobj)
+                    if data is None:
+                        continue
+                    if not data:  # Closed: an unterminated line is an incomplete one.
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        del pending[key.fileobj]
+                        continue
+                    data = pending[key.fileobj] + data
+                    end = data.rfind(b'\n') + 1
+                    pending[key.fileobj] = data[end:]
+                    if end:
+                        lines.append(data[:end])
+                        self.lines += data.count(b'\n', 0, end)
+                if lines:
+                    _write_buffers(fd, lines)
+        finally:
+            for connection in pending:
+                connection.close()
+            selector.close()
+            os.close(fd)
+            self._server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    @staticmethod
+    def _receive(connection: socket.socket) -> Optional[bytes]:
+        try:
+            return connection.recv(256 * 1024)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError:
+            return b''
+
+    def shutdown(self) -> None:
+        """Tells :meth:`serve_forever` to write what is left to read, remove the socket and return.
+        """
+        self._stopping.set()
+
+
+class AsyncioHandler(logging.Handler):
+    """A handler for asyncio applications, that never blocks the event loop on I/O.
+
+    Records are formatted when logged, then their bytes are handed to a writer the event
+    loop owns. Pipes and terminals the handler opens by name, like FIFOs, are switched to
+    non-blocking mode and written to when the loop finds them writable. Regular files,
+    which cannot be written to without blocking, and file descriptors or objects given,
+    like :data:`sys.stderr`, the mode of which other writers rely on, are written to in a
+    dedicated thread. Records logged from other threads are handed to the loop
+    thread-safely; records logged while no loop runs are written synchronously.
+
+    Attributes:
+        buffered: the number of bytes waiting to be written.
+        dropped: the number of records dropped because ``max_buffered`` was reached.
+        high_water: the largest number of bytes that ever waited to be written.
+        written: the number of bytes written.
+    """
+
+    terminator = b'\n'
+
+    def __init__(self,
+                 target: Union[str, int, Any] = None,
+                 loop: 'asyncio.AbstractEventLoop' = None,
+                 max_buffered: int = 16 * 1024 * 1024,
+                 level: int = logging.NOTSET,
+                 ) -> None:
+        """Initializes a handler writing to ``target``.
+
+        Arguments:
+            target: a file name to append to, a file descriptor, or a file object.
+                Defaults to :data:`sys.stderr`.
+            loop: the event loop that owns the writer. Defaults to the loop running
+                when the first record is logged.
+            max_buffered: the number of bytes waiting to be written from which new
+                records are dropped.
+        """
+        import asyncio  # Here, rather than with the module, as only this handler needs it
+        import concurrent.futures
+
+        super().__init__(level)
+        self._get_running_loop = asyncio._get_running_loop
+        if target is None:
+            target = sys.stderr
+        self._owns_fd = isinstance(target, str)
+        if self._owns_fd:
+            self._fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        else:
+            self._fd = target if isinstance(target, int) else target.fileno()
+        self._blocking = os.get_blocking(self._fd)
+        self._executor = None
+        if not self._owns_fd or stat.S_ISREG(os.fstat(self._fd).st_mode):
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._loop = loop
+        self._pending = bytearray()
+        self._in_flight = 0  # Bytes being written by the executor
+        self._scheduled = False
+        self._watching = False  # Whether the loop waits for the file to become writable
+        self._waiters = []  # type: List[asyncio.Future]
+        self.max_buffered = max_buffered
+        self.buffered = self.dropped = self.high_water = self.written = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Formats a log record, and hands it to the writer.
+        """
+        try:
+            data = _format_bytes(self, record) + self.terminator
+            running = self._get_running_loop()
+            if self._loop is None and running is not None:
+                self._loop = running
+                if self._executor is None:
+                    os.set_blocking(self._fd, False)
+            if self._loop is None or self._loop.is_closed():
+                _write_buffers(self._fd, [data])
+                self.written += len(data)
+                return
+        except RecursionError:  # See issue 36272
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+
+        if running is self._loop:
+            self._enqueue(data)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, data)
+
+    def _enqueue(self, data: bytes) -> None:
+        if self.buffered + len(data) > self.max_buffered:
+            self.dropped += 1
+            return
+        self._pending += data
+        self.buffered += len(data)
+        self.high_water = max(self.high_water, self.buffered)
+        if not (self._scheduled or self._in_flight or self._watching):
+            self._scheduled = True
+            self._loop.call_soon(self._write)
+
+    def _write(self) -> None:
+        self._scheduled = False
+        if not self._pending or self._in_flight:
+            return
+        if self._executor is None:
+            self._on_writable()
+            return
+
+        data, self._pending = bytes(self._pending), bytearray()
+        self._in_flight = len(data)
+        future = self._loop.run_in_executor(self._executor, _write_buffers, self._fd, [data])
+        future.add_done_callback(self._on_written)
+
+    def _on_written(self, future: 'asyncio.Future') -> None:
+        size, self._in_flight = self._in_flight, 0
+        self.buffered -= size
+        if future.exception() is None:
+            self.written += size
+        self._write()
+        self._wake_up_waiters()
+
+    def _on_writable(self) -> None:
+        try:
+            written = os.write(self._fd, self._pending)
+        except (BlockingIOError, InterruptedError):
+            written = 0
+        except OSError:  # The reader went away: drop what is left.
+            written = len(self._pending)
+        else:
+            self.written += written
+        del self._pending[:written]
+        self.buffered -= written
+
+        if self._pending and not self._watching:
+            self._watching = True
+            self._loop.add_writer(self._fd, self._on_writable)
+        elif not self._pending and self._watching:
+            self._watching = False
+            self._loop.remove_writer(self._fd)
+        self._wake_up_waiters()
+
+    def _wake_up_waiters(self) -> None:
+        if self.buffered:
+            return
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def drain(self) -> None:
+        """Waits until every record logged so far is written.
+        """
+        if self._loop is None or not self.buffered:
+            return
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    def close(self) -> None:
+        """Writes synchronously what is left to write, then closes the handler.
+        """
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            elif self._watching and not self._loop.is_closed():
+                self._loop.remove_writer(self._fd)
+                self._watching = False
+            if self._pending:
+                os.set_blocking(self._fd, True)
+                _write_buffers(self._fd, [bytes(self._pending)])
+                self._pending = bytearray()
+            if self._fd is not None:
+                os.set_blocking(self._fd, self._blocking)
+            if self._owns_fd and self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            super().close()
+
+
+QUEUE_POLICIES = ('block', 'drop', 'drop_oldest')
+#: What a :class:`QueueHandler` does with records when its queue is full: wait for room,
+#: drop the record, or drop the oldest record in the queue to make room.
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """A :class:`logging.handlers.QueueHandler` that leaves formatting to the listener thread.
+
+    The standard queue handler formats records before queueing them, on the thread that
+    logs. This one only captures the state of the record that could change once the call
+    to the logger returns: it resolves the message, and copies the record so later changes
+    to its attributes do not show. Formatting and I/O happen in the thread of a
+    :class:`QueueListener`.
+
+    Note that objects passed as ``extra`` are not copied: they should not be mutated once
+    logged.
+    """
+
+    def __init__(self,
+                 queue_: queue.Queue = None,
+                 maxsize: int = 10000,
+                 policy: str = 'block',
+                 timeout: float = None,
+                 ) -> None:
+        """Initializes a handler that puts records in ``queue_``, or in a new bounded queue.
+
+        Arguments:
+            queue_: the queue to put records in. Defaults to a new :class:`queue.Queue`.
+            maxsize: the maximum number of records in the queue the handler creates.
+            policy: what to do with records when the queue is full, one of
+                :data:`QUEUE_POLICIES`.
+            timeout: with the ``'block'`` policy, how long to wait for room in the
+                queue before dropping the record. Waits forever by default.
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError('Unknown queue policy: {} (choose from {})'
+                             .format(policy, ', '.join(QUEUE_POLICIES)))
+        super().__init__(queue.Queue(maxsize) if queue_ is None else queue_)
+        self.dropped = 0
+        self.policy = policy
+        self.timeout = timeout
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Puts a record in the queue, or drops a record if it is full, as the policy says.
+
+        Dropped records are counted in :attr:`dropped`.
+        """
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.timeout)
+                return
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.policy == 'drop_oldest':
+                try:
+                    oldest = self.queue.get_nowait()
+                except queue.Empty:  # The listener just made room
+                    pass
+                else:
+                    self.queue.task_done()
+                    if oldest is logging.handlers.QueueListener._sentinel:
+                        # The listener is stopping: it must get it, the record is dropped.
+                        self.queue.put_nowait(oldest)
+                        return
+                self.enqueue(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Returns a copy of the record with its message resolved, and its context saved.
+        """
+        record = copy.copy(record)
+        setattr(record, _TEMPLATE_ATTR, (record.msg, record.args))  # For formatters to output
+        record.msg = record.getMessage()
+        record.args = None
+        if contextvars is not None:  # For formatters to read context variables from
+            setattr(record, _CONTEXT_ATTR, contextvars.copy_context())
+        return record
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """A :class:`logging.handlers.QueueListener` to pair with a :class:`QueueHandler`.
+
+    It can be used as a context manager, which starts and stops it.
+    """
+
+    def __init__(self,
+                 queue_: Union[queue.Queue, QueueHandler],
+                 *handlers: logging.Handler,
+                 respect_handler_level: bool = True
+                 ) -> None:
+        """Initializes a listener handling records from a queue, or from a queue handler's.
+        """
+        super().__init__(getattr(queue_, 'queue', queue_),
+                         *handlers,
+                         respect_handler_level=respect_handler_level)
+
+    def enqueue_sentinel(self) -> None:
+        """Tells the thread to stop, once the queue has room and is drained.
+        """
+        self.queue.put(self._sentinel)
+
+    def __enter__(self) -> 'QueueListener':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+SUPPRESSED_MESSAGE = 'Suppressed %d occurrences of: %s'
+#: The message of the summary records a :class:`RateLimitFilter` logs.
+
+
+class RateLimitFilter(logging.Filter):
+    """A filter that samples records, and rate limits those that repeat.
+
+    Records repeat when they come from the same logger and line, with the same level and
+    message template. Each such key gets a token bucket, refilled at ``rate`` tokens per
+    second up to ``burst``, and records finding it empty are suppressed. At most every
+    ``summary_interval`` seconds, the filter logs, for each key which records were
+    suppressed, a record at the same level and location saying how many were (in its
+    ``suppressed`` attribute), through the logger of the key.
+
+    Filters run before handlers, so suppressed records cost no formatting.
+    """
+
+    def __init__(self,
+                 rate: float = 10.0,
+                 burst: float = None,
+                 max_keys: int = 10000,
+                 sample_rates: Mapping[int, float] = None,
+                 summary_interval: Optional[float] = 60.0,
+                 name: str = '',
+                 ) -> None:
+        """Initializes a filter letting ``rate`` records per second and per key through.
+
+        Arguments:
+            burst: the number of records of a key let through at once, after a quiet
+                period. Defaults to ``rate``.
+            max_keys: the number of keys to track, the least recently seen are forgotten.
+            sample_rates: the probability, by level, that a record is considered at all,
+                *e.g.* ``{logging.DEBUG: 0.01}`` keeps one debug record in a hundred.
+            summary_interval: the minimum number of seconds between summaries (``None``
+                disables them, see :meth:`log_summaries`).
+            name: as for :class:`logging.Filter`.
+        """
+        super().__init__(name)
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.max_keys = max_keys
+        self.sample_rates = dict(sample_rates or {})
+        self.summary_interval = summary_interval
+        # Keys are (name, levelno, msg, pathname, lineno), values [tokens, time, suppressed].
+        self._buckets = collections.OrderedDict()
+        self._last_summary = time.monotonic()
+        self._local = threading.local()  # Lets summary records through
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Returns whether the record should be logged.
+        """
+        if getattr(self._local, 'summarizing', False):
+            return True
+        if not super().filter(record):
+            return False
+        sample_rate = self.sample_rates.get(record.levelno)
+        if sample_rate is not None and random.random() >= sample_rate:
+            return False
+
+        msg = record.msg if record.msg.__class__ is str else str(record.msg)
+        key = (record.name, record.levelno, msg, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            else:
+                bucket[2] += 1
+            summarize = (self.summary_interval is not None
+                         and now - self._last_summary >= self.summary_interval)
+
+        if summarize:
+            self.log_summaries()
+        return allowed
+
+    def log_summaries(self) -> None:
+        """Logs a summary record for each key which records were suppressed since the last.
+        """
+        with self._lock:
+            self._last_summary = time.monotonic()
+            summaries = [(key, bucket[2]) for key, bucket in self._buckets.items() if bucket[2]]
+            for key, _ in summaries:
+                self._buckets[key][2] = 0
+
+        self._local.summarizing = True
+        try:
+            for (name, levelno, msg, pathname, lineno), count in summaries:
+                logger = logging.getLogger(name)
+                logger.handle(logger.makeRecord(name, levelno, pathname, lineno,
+                                                SUPPRESSED_MESSAGE, (count, msg), None,
+                                                extra={'suppressed': count}))
+        finally:
+            self._local.summarizing = False
+
+
+class InternDecoder:
+    """Restores the values of interned fields in entries a :class:`Formatter` output with
+    ``intern_fields``, read in order (see :meth:`decode`).
+
+    Numbers referring to values announced before the decoder started reading, like in a
+    rotated file, are decoded as ``None`` until the formatter numbers values anew.
+    """
+
+    def __init__(self, keys: Iterable[str] = None) -> None:
+        """Initializes a decoder.
+
+        Arguments:
+            keys: the keys of interned fields, as output (*e.g.* renamed by a keymap). By
+                default, those of the values announced so far.
+        """
+        self._values = {key: [] for key in keys or ()}  # type: Dict[str, List[Any]]
+
+    def decode(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns a decoded entry, with its interned values restored, after taking note of
+        the values it announces.
+        """
+        announced = entry.pop(INTERN_KEY, None) or {}
+        for key, number in announced.items():
+            values = self._values.setdefault(key, [])
+            if number == 0:  # Values are numbered anew
+                values.clear()
+            elif len(values) < number:  # The decoder started reading after the announcement
+                values.extend([None] * (number - len(values)))
+            values[number:] = [entry.get(key)]
+        for key, values in self._values.items():
+            number = entry.get(key)
+            if number.__class__ is int and key not in announced:
+                entry[key] = values[number] if number < len(values) else None
+        return entry
+
+
+_loads = json.loads if orjson is None else orjson.loads
+
+INDEX_SUFFIX = '.idx'
+#: The suffix of the sidecar index files :func:`build_index` writes next to log files.
+
+
+def _needle(value: Any) -> Optional[bytes]:
+    """Returns the JSON of a value as any JSON backend writes it, or ``None`` if they differ.
+    """
+    if value is not None and value.__class__ not in (bool, int, str):
+        return None
+    encoded = json.dumps(value)
+    if '\\' in encoded or encoded != json.dumps(value, ensure_ascii=False):
+        return None  # Backends escape characters differently
+    return encoded.encode('ascii')
+
+
+def _as_number(text: str) -> Optional[Union[int, float]]:
+    """Returns the number a string holds, or ``None`` if it holds none.
+    """
+    for number in (int, float):
+        try:
+            return number(text)
+        except ValueError:
+            pass
+    return None
+
+
+def _same_value(value: Any, expected: Any) -> bool:
+    """Returns whether the value of an entry is the one expected, comparing numbers as such
+    when one of them is written as a string (as formatters output them by default).
+    """
+    if value == expected:
+        return True
+    if value.__class__ is str and expected.__class__ in (int, float):
+        value = _as_number(value)
+    elif expected.__class__ is str and value.__class__ in (int, float):
+        expected = _as_number(expected)
+    else:
+        return False
+    return value is not None and value == expected
+
+
+class LogQuery:
+    """Selects log entries, as output by :class:`Formatter`, by level, logger, time or fields.
+
+    Lines of JSON can be rejected before they are decoded, when they lack the bytes of the
+    values looked for (see :meth:`prefilter`), then decoded entries are matched (see
+    :meth:`matches`). Attributes are looked up under the keys a formatter with the same
+    ``keymap`` outputs them.
+    """
+
+    def __init__(self,
+                 level: int = None,
+                 logger: str = None,
+                 since: Union[float, str] = None,
+                 until: Union[float, str] = None,
+                 fields: Mapping[str, Any] = None,
+                 keymap: Mapping[str, str] = None,
+                 time_key: str = 'asctime',
+                 ) -> None:
+        """Initializes a query for entries matching all the criteria given.
+
+        Arguments:
+            level: the minimum level of entries (from their ``levelno`` or ``levelname``).
+            logger: the name of the logger of entries, or of one of its ancestors.
+            since: the earliest time stamp of entries, inclusive. Time stamps are compared
+                as numbers (those output as strings, the default, included), or as strings
+                (which sort chronologically in ISO 8601 or in the default
+                :meth:`Formatter.formatTime` format).
+            until: the latest time stamp of entries, inclusive.
+            fields: the values entries must have, by key (*e.g.* extras). Numbers match
+                the same numbers written as strings, and the other way round.
+            keymap: the keymap of the formatter that output the entries.
+            time_key: the attribute holding time stamps, ``asctime`` or ``created``.
+        """
+        keymap = dict(keymap or {})
+        self.level = level
+        self.logger = logger
+        self.since = since
+        self.until = until
+        self.fields = dict(fields or {})
+        self.levelno_key = keymap.get('levelno', 'levelno')
+        self.levelname_key = keymap.get('levelname', 'levelname')
+        self.name_key = keymap.get('name', 'name')
+        self.time_key = keymap.get(time_key, time_key)
+
+        # A line must contain one of the needles of each group to be decoded.
+        needles = []
+        if level is not None:
+            group = [b'"' + name.encode('ascii', 'replace') + b'"'
+                     for levelno, name in logging._levelToName.items() if levelno >= level]
+            levelno_key = _needle(self.levelno_key)
+            if levelno_key is not None:  # Entries with a levelno are decoded
+                group.append(levelno_key + b':')
+            needles.append(tuple(group))
+        if logger is not None:
+            name = _needle(logger)
+            if name is not None:
+                needles.append((name[:-1], ))  # Without the closing quote, for descendants
+        for value in self.fields.values():
+            needle = _needle(value)
+            if needle is not None and value.__class__ is str and _as_number(value) is not None:
+                needle = needle[1:-1]  # The number may be written as such, without quotes
+            if needle is not None:
+                needles.append((needle, ))
+        self._needles = tuple(group for group in needles if group)
+
+    def levelno(self, entry: Mapping[str, Any]) -> Optional[int]:
+        """Returns the level of an entry, or ``None`` if it has none.
+        """
+        levelno = entry.get(self.levelno_key)
+        if levelno.__class__ is str:  # Formatters output numbers as strings by default
+            try:
+                levelno = int(levelno)
+            except ValueError:
+                pass
+        if levelno.__class__ is not int:
+            levelno = logging.getLevelName(entry.get(self.levelname_key))
+        return levelno if levelno.__class__ is int else None
+
+    def timestamp(self, entry: Mapping[str, Any]) -> Any:
+        """Returns the time stamp of an entry, as a number if it is one written as a string.
+        """
+        timestamp = entry.get(self.time_key)
+        if timestamp.__class__ is str:  # Formatters output numbers as strings by default
+            try:
+                return float(timestamp)
+            except ValueError:
+                pass
+        return timestamp
+
+    def prefilter(self, buffer: Union[bytes, mmap.mmap], start: int, end: int) -> bool:
+        """Returns whether the line between two offsets of a buffer may match the query.
+        """
+        for group in self._needles:
+            for needle in group:
+                if buffer.find(needle, start, end) >= 0:
+                    break
+            else:
+                return False
+        return True
+
+    def matches(self, entry: Mapping[str, Any]) -> bool:
+        """Returns whether a decoded entry matches the query.
+        """
+        if self.level is not None:
+            levelno = self.levelno(entry)
+            if levelno is None or levelno < self.level:
+                return False
+        if self.logger is not None:
+            name = entry.get(self.name_key)
+            if name != self.logger and not (name.__class__ is str
+                                            and name.startswith(self.logger + '.')):
+                return False
+        if self.since is not None or self.until is not None:
+            timestamp = self.timestamp(entry)
+            try:
+                if ((self.since is not None and timestamp < self.since)
+                        or (self.until is not None and timestamp > self.until)):
+                    return False
+            except TypeError:  # No time stamp, or not of the type of the bounds
+                return False
+        for key, value in self.fields.items():
+            if not _same_value(entry.get(key, _UNSET), value):
+                return False
+        return True
+
+
+def _lines(buffer: mmap.mmap, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """Yields the start and end offsets of the lines between two offsets of a buffer.
+    """
+    while start < end:
+        stop = buffer.find(b'\n', start, end)
+        if stop < 0:
+            stop = end
+        yield start, stop
+        start = stop + 1
+
+
+def _index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+def _load_index(path: str, buffer: mmap.mmap, query: LogQuery) -> Optional[Dict[str, Any]]:
+    """Returns the index of a log file, if it has one still valid and usable for the query.
+    """
+    try:
+        with open(_index_path(path), 'rb') as index_file:
+            index = _loads(index_file.read())
+    except (OSError, ValueError):
+        return None
+    if (index.get('version') != 2
+            or index['size'] > len(buffer)
+            or index['head'] != buffer[:64].hex()  # The log file was replaced
+            or index['keys'] != [query.levelno_key, query.levelname_key, query.time_key]):
+        return None
+    return index
+
+
+def _candidate_lines(buffer: mmap.mmap,
+                     query: LogQuery,
+                     index: Optional[Dict[str, Any]]
+                     ) -> Iterator[Tuple[int, int]]:
+    """Yields the offsets of the lines that may match a query, skipping those the index rules out.
+    """
+    if index is None:
+        yield from _lines(buffer, 0, len(buffer))
+        return
+
+    size = index['size']
+    offsets = [block[0] for block in index['blocks']] + [size]
+    ranges = []
+    for (start, first, last), end in zip(index['blocks'], offsets[1:]):
+        try:
+            if ((query.since is not None and last is not None and last < query.since)
+                    or (query.until is not None and first is not None and first > query.until)):
+                continue
+        except TypeError:
+            pass
+        ranges.append((start, end))
+
+    if query.level is None:
+        for start, end in ranges:
+            yield from _lines(buffer, start, end)
+    else:
+        starts = [start for start, _ in ranges]
+        lines = sorted(offset
+                       for levelno, level_offsets in index['levels'].items()
+                       if int(levelno) >= query.level
+                       for offset in level_offsets)
+        for start in lines:
+            position = bisect.bisect_right(starts, start) - 1
+            if position >= 0 and start < ranges[position][1]:
+                end = buffer.find(b'\n', start, size)
+                yield start, size if end < 0 else end
+    yield from _lines(buffer, size, len(buffer))
+
+
+def read_logs(path: str,
+              query: LogQuery = None,
+              raw: bool = False,
+              use_index: bool = True,
+              ) -> Iterator[Union[Dict[str, Any], bytes]]:
+    """Yields the entries of a file of JSON lines that match a query.
+
+    The file is memory mapped and scanned for lines that may match the query, which are
+    the only ones decoded. The sidecar index :func:`build_index` writes, if present, lets
+    whole ranges of lines be skipped for time and level queries; lines appended after it
+    was built are scanned. Lines that are not JSON objects, like a line being written, are
+    skipped.
+
+    Arguments:
+        path: the path of the log file.
+        query: the entries to yield, all of them by default.
+        raw: whether to yield the lines, as bytes, rather than the decoded entries.
+        use_index: whether to use the sidecar index, if present.
+    """
+    query = query or LogQuery()
+    with open(path, 'rb') as log_file:
+        if os.fstat(log_file.fileno()).st_size == 0:  # Empty files cannot be mapped
+            return
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            index = _load_index(path, buffer, query) if use_index else None
+            for start, end in _candidate_lines(buffer, query, index):
+                if not query.prefilter(buffer, start, end):
+                    continue
+                line = buffer[start:end]
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    continue
+                if entry.__class__ is dict and query.matches(entry):
+                    yield line if raw else entry
+
+
+def _index_lines(buffer: mmap.mmap,
+                 index: Dict[str, Any],
+                 query: LogQuery,
+                 block_lines: int,
+                 ) -> None:
+    """Fills an index with the levels and time ranges of the complete lines of a buffer.
+    """
+    end = buffer.rfind(b'\n') + 1  # Leaves a line being written out
+    index['size'], index['head'] = end, buffer[:64].hex()
+    block = None
+    for count, (start, stop) in enumerate(_lines(buffer, 0, end)):
+        if count % block_lines == 0:
+            block = [start, None, None]
+            index['blocks'].append(block)
+        try:
+            entry = _loads(buffer[start:stop])
+        except ValueError:
+            continue
+        if entry.__class__ is not dict:
+            continue
+        levelno = query.levelno(entry)
+        if levelno is not None:
+            index['levels'].setdefault(str(levelno), []).append(start)
+        timestamp = query.timestamp(entry)
+        if timestamp is not None:
+            try:
+                if block[1] is None or timestamp < block[1]:
+                    block[1] = timestamp
+                if block[2] is None or timestamp > block[2]:
+                    block[2] = timestamp
+            except TypeError:
+                pass
+
+
+def build_index(path: str,
+                keymap: Mapping[str, str] = None,
+                time_key: str = 'asctime',
+                block_lines: int = 1024,
+                ) -> Dict[str, Any]:
+    """Writes, and returns, an index of a log file, for :func:`read_logs` to seek with.
+
+    The index, a JSON object in a file named after the log file with :data:`INDEX_SUFFIX`
+    appended, holds the offsets of the lines of each level, and the earliest and latest time
+    stamps of each block of ``block_lines`` lines.
+
+    Arguments:
+        keymap: the keymap of the formatter that output the entries.
+        time_key: the attribute holding time stamps, ``asctime`` or ``created``.
+    """
+    query = LogQuery(keymap=keymap, time_key=time_key)
+    index = {'version': 2,
+             'size': 0,
+             'head': '',
+             'keys': [query.levelno_key, query.levelname_key, query.time_key],
+             'blocks': [],
+             'levels': {},
+             }
+    with open(path, 'rb') as log_file:
+        if os.fstat(log_file.fileno()).st_size:  # Empty files cannot be mapped
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                _index_lines(buffer, index, query, block_lines)
+
+    with open(_index_path(path), 'w') as index_file:
+        json.dump(index, index_file, separators=(',', ':'))
+    return index
+
+
+COLUMNAR_MAGIC = b'JSONLOGC1\n'
+#: The first bytes of the files :func:`export_columnar` writes.
+
+COLUMNAR_SUFFIX = '.jlc'
+#: The suffix :func:`export_columnar` appends to the name of log files, by default.
+
+COLUMN_TYPES = {'created': 'delta_time',
+                'filename': 'dictionary',
+                'funcName': 'dictionary',
+                'levelname': 'dictionary',
+                'levelno': 'int',
+                'lineno': 'int',
+                'module': 'dictionary',
+                'msg': 'dictionary',
+                'name': 'dictionary',
+                'pathname': 'dictionary',
+                'process': 'int',
+                'processName': 'dictionary',
+                'thread': 'int',
+                'threadName': 'dictionary',
+                }
+#: How :func:`export_columnar` stores the values of log record attributes: as indices in a
+#: list of the distinct values (``'dictionary'``), as 64 bits integers (``'int'``), as
+#: nanoseconds since the previous value (``'delta_time'``), and, for attributes not listed,
+#: as a JSON array (``'json'``).
+
+_INT64_NULL = -2 ** 63  # Stands for missing values in integer columns
+
+
+def columnar_schema(formatter: 'Formatter' = None,
+                    keymap: Mapping[str, str] = None,
+                    ) -> Tuple[Tuple[str, str], ...]:
+    """Returns the keys, and column types, of the entries a formatter outputs.
+
+    Without a formatter, the schema lists all the log record attributes, under the keys a
+    formatter with the given ``keymap`` outputs them.
+    """
+    if formatter is None:
+        keymap = keymap or {}
+        keys = tuple((attr, keymap.get(attr, attr)) for attr in LOG_RECORD_ATTRS)
+    else:
+        keys = formatter._keys
+    return tuple((key,
+                  'delta_time' if attr == 'asctime' and formatter is not None
+                  and formatter._time_format == 'epoch' else
+                  COLUMN_TYPES.get(attr, 'json'))
+                 for attr, key in keys)
+
+
+def _little_endian(numbers: array.array) -> bytes:
+    if sys.byteorder == 'big':  # pragma: no cover
+        numbers = array.array(numbers.typecode, numbers)
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array.array:
+    numbers = array.array(typecode, data)
+    if sys.byteorder == 'big':  # pragma: no cover
+        numbers.byteswap()
+    return numbers
+
+
+def _encode_dictionary_column(values: List[Any]) -> Optional[Tuple[Dict[str, Any], List[bytes]]]:
+    positions = {}  # type: Dict[Any, int]
+    dictionary = []
+    indices = array.array('i')
+    for value in values:
+        if value is None:
+            indices.append(-1)
+            continue
+        # Keeps True apart from 1, and makes lists and objects hashable.
+        key = value if value.__class__ is str else (value.__class__, json.dumps(value))
+        position = positions.get(key)
+        if position is None:
+            position = positions[key] = len(dictionary)
+            dictionary.append(value)
+        indices.append(position)
+    return {'dictionary': dictionary}, [_little_endian(indices)]
+
+
+def _encode_int_column(values: List[Any]) -> Optional[Tuple[Dict[str, Any], List[bytes]]]:
+    numbers = array.array('q')
+    for value in values:
+        if value is None or value == 'None':
+            value = _INT64_NULL
+        elif value.__class__ is str:  # Formatters output numbers as strings by default
+            try:
+                value = int(value)
+            except ValueError:
+                return None
+        elif value.__class__ is not int or value == _INT64_NULL:
+            return None
+        try:
+            numbers.append(value)
+        except OverflowError:
+            return None
+    return {}, [_little_endian(numbers)]
+
+
+def _encode_delta_time_column(values: List[Any]) -> Optional[Tuple[Dict[str, Any], List[bytes]]]:
+    deltas = array.array('q')
+    base = previous = None
+    for value in values:
+        if value is None:
+            deltas.append(_INT64_NULL)
+            continue
+        if value.__class__ not in (float, int, str):
+            return None
+        try:  # Exactly, as floats cannot hold nanoseconds since the epoch
+            nanoseconds = int(decimal.Decimal(value).scaleb(9).to_integral_value())
+        except (ArithmeticError, ValueError):
+            return None
+        if base is None:
+            base = previous = nanoseconds
+        try:
+            deltas.append(nanoseconds - previous)
+        except OverflowError:
+            return None
+        previous = nanoseconds
+    return {'base': base or 0}, [_little_endian(deltas)]
+
+
+def _encode_json_column(values: List[Any]) -> Optional[Tuple[Dict[str, Any], List[bytes]]]:
+    return {}, [json.dumps(values, separators=(',', ':')).encode('ascii')]
+
+
+def _decode_dictionary_column(column: Mapping[str, Any], buffers: List[bytes]) -> List[Any]:
+    dictionary = column['dictionary']
+    return [None if index < 0 else dictionary[index]
+            for index in _from_little_endian('i', buffers[0])]
+
+
+def _decode_int_column(column: Mapping[str, Any], buffers: List[bytes]) -> List[Any]:
+    return [None if number == _INT64_NULL else number
+            for number in _from_little_endian('q', buffers[0])]
+
+
+def _decode_delta_time_column(column: Mapping[str, Any], buffers: List[bytes]) -> List[Any]:
+    values = []
+    nanoseconds = column['base']
+    for delta in _from_little_endian('q', buffers[0]):
+        if delta == _INT64_NULL:
+            values.append(None)
+        else:
+            nanoseconds += delta
+            values.append(nanoseconds / 1000000000)  # Correctly rounded
+    return values
+
+
+def _decode_json_column(column: Mapping[str, Any], buffers: List[bytes]) -> List[Any]:
+    return _loads(buffers[0])
+
+
+_COLUMN_CODECS = {'delta_time': (_encode_delta_time_column, _decode_delta_time_column),
+                  'dictionary': (_encode_dictionary_column, _decode_dictionary_column),
+                  'int': (_encode_int_column, _decode_int_column),
+                  'json': (_encode_json_column, _decode_json_column),
+                  }
+
+
+def _write_chunk(output: IO[bytes],
+                 schema: Tuple[Tuple[str, str], ...],
+                 entries: List[Dict[str, Any]],
+                 ) -> None:
+    """Writes entries as a chunk: the size of its JSON header, the header, then its buffers.
+    """
+    columns = []
+    buffers = []
+    for key, column_type in schema:
+        values = [entry.get(key) for entry in entries]
+        encoded = _COLUMN_CODECS[column_type][0](values)
+        if encoded is None:  # Values the column type cannot hold
+            column_type, encoded = 'json', _encode_json_column(values)
+        column, column_buffers = encoded
+        column.update(key=key, encoding=column_type, sizes=[len(b) for b in column_buffers])
+        columns.append(column)
+        buffers.extend(column_buffers)
+
+    keys = frozenset(key for key, _ in schema)
+    others = [{k: v for k, v in entry.items() if k not in keys} or None for entry in entries]
+    if any(others):
+        column, column_buffers = _encode_json_column(others)
+        column.update(key=None, encoding='json', sizes=[len(b) for b in column_buffers])
+        columns.append(column)
+        buffers.extend(column_buffers)
+
+    header = json.dumps({'rows': len(entries), 'columns': columns},
+                        separators=(',', ':')).encode('ascii')
+    output.write(struct.pack('<I', len(header)))
+    output.write(header)
+    output.writelines(buffers)
+
+
+def export_columnar(path: str,
+                    output: str = None,
+                    schema: Iterable[Tuple[str, str]] = None,
+                    chunk_rows: int = 65536,
+                    ) -> int:
+    """Converts a file of JSON log entries to a columnar file, and returns its number of rows.
+
+    Entries are read, and written, by chunks of ``chunk_rows``, each column of which is
+    stored as its type in ``schema`` (see :data:`COLUMN_TYPES`) allows, or as JSON if
+    values do not fit it. The other keys of entries, like extras, are stored as JSON objects
+    in a column of their own. Numbers formatters output as strings (their default) are
+    stored as numbers. Time stamps are stored to the nanosecond, and read back as floats.
+    Lines that are not JSON objects are skipped. Read the file with :func:`read_columnar`.
+
+    Arguments:
+        path: the path of the log file.
+        output: the path of the columnar file, that of the log file with
+            :data:`COLUMNAR_SUFFIX` appended by default.
+        schema: the keys, and column types, of entries, as :func:`columnar_schema` returns
+            them. All log record attributes, by default.
+        chunk_rows: the number of entries held in memory at once.
+    """
+    schema = columnar_schema() if schema is None else tuple(schema)
+    rows = 0
+    with open(path, 'rb') as log_file, \
+            open(path + COLUMNAR_SUFFIX if output is None else output, 'wb') as output_file:
+        output_file.write(COLUMNAR_MAGIC)
+        entries = []
+        for line in log_file:
+            try:
+                entry = _loads(line)
+            except ValueError:
+                continue
+            if entry.__class__ is not dict:
+                continue
+            entries.append(entry)
+            if len(entries) == chunk_rows:
+                _write_chunk(output_file, schema, entries)
+                rows += len(entries)
+                entries = []
+        if entries:
+            _write_chunk(output_file, schema, entries)
+            rows += len(entries)
+    return rows
+
+
+def export_columnar_files(paths: Iterable[str],
+                          schema: Iterable[Tuple[str, str]] = None,
+                          chunk_rows: int = 65536,
+                          processes: Optional[int] = 1,
+                          ) -> List[int]:
+    """Converts log files to columnar files, next to them, and returns their numbers of rows.
+
+    Arguments:
+        processes: the number of processes converting files in parallel, one per processor
+            if ``None``.
+    """
+    paths = list(paths)
+    schema = None if schema is None else tuple(schema)
+    if processes == 1 or len(paths) < 2:
+        return [export_columnar(path, schema=schema, chunk_rows=chunk_rows) for path in paths]
+    import concurrent.futures  # Here, rather than with the module, as only this needs it
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(functools.partial(export_columnar,
+                                                   schema=schema,
+                                                   chunk_rows=chunk_rows),
+                                 paths))
+
+
+def read_columnar(path: str, rows: bool = False) -> Iterator[Dict[Any, Any]]:
+    """Yields the chunks of a file :func:`export_columnar` wrote, as lists of values by key.
+
+    The other keys of entries are under the ``None`` key, as objects (or ``None``).
+
+    Arguments:
+        rows: whether to yield entries instead, with all the keys of the schema, and the
+            other keys of entries.
+    """
+    with open(path, 'rb') as columnar_file:
+        if columnar_file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError('Not a columnar log file: {}'.format(path))
+        while True:
+            size = columnar_file.read(4)
+            if not size:
+                return
+            header = _loads(columnar_file.read(struct.unpack('<I', size)[0]))
+            chunk = {}
+            for column in header['columns']:
+                buffers = [columnar_file.read(size) for size in column['sizes']]
+                chunk[column['key']] = _COLUMN_CODECS[column['encoding']][1](column, buffers)
+            if not rows:
+                yield chunk
+                continue
+            others = chunk.pop(None, None)
+            columns = list(chunk.items())
+            for row in range(header['rows']):
+                entry = {key: values[row] for key, values in columns}
+                if others is not None and others[row]:
+                    entry.update(others[row])
+                yield entry
+
+
+def _cli_value(text: str) -> Any:
+    """Returns the value of a command line argument, as JSON if it is valid, as is otherwise.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _cli_pairs(pairs: Iterable[str]) -> Dict[str, str]:
+    return dict(pair.split('=', 1) for pair in pairs)
+
+
+def main(argv: List[str] = None) -> int:
+    """Runs the ``python -m jsonlogging`` command, to query, index or export JSON log files.
+    """
+    import argparse  # Here, rather than with the module, as only the command needs it
+
+    parser = argparse.ArgumentParser(prog='python -m jsonlogging',
+                                     description='Query, index or export files of JSON log '
+                                                 'entries.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    query_parser = commands.add_parser('query', help='output the entries matching a query')
+    index_parser = commands.add_parser('index', help='build the sidecar index of a log file')
+    export_parser = commands.add_parser('export',
+                                        help='convert log files to columnar files next to them')
+    for command in (query_parser, index_parser):
+        command.add_argument('path', help='the log file')
+        command.add_argument('--keymap', action='append', default=[], metavar='ATTR=KEY',
+                             help='a key renamed by the keymap of the formatter')
+        command.add_argument('--time-key', default='asctime', choices=['asctime', 'created'],
+                             help='the attribute holding time stamps')
+    query_parser.add_argument('--level', help='the minimum level, by name or number')
+    query_parser.add_argument('--logger', help='the logger, descendants included')
+    query_parser.add_argument('--since', type=_cli_value, help='the earliest time stamp')
+    query_parser.add_argument('--until', type=_cli_value, help='the latest time stamp')
+    query_parser.add_argument('--field', action='append', default=[], metavar='KEY=VALUE',
+                              help='a field value (parsed as JSON, if valid)')
+    query_parser.add_argument('--no-index', action='store_true', help='ignore the index')
+    index_parser.add_argument('--block-lines', type=int, default=1024,
+                              help='the number of lines per time range')
+    export_parser.add_argument('paths', nargs='+', metavar='path', help='a log file')
+    export_parser.add_argument('--keymap', action='append', default=[], metavar='ATTR=KEY',
+                               help='a key renamed by the keymap of the formatter')
+    export_parser.add_argument('--chunk-rows', type=int, default=65536,
+                               help='the number of entries converted at once')
+    export_parser.add_argument('--processes', type=int, default=1,
+                               help='the number of files converted in parallel (0: one per '
+                                    'processor)')
+    args = parser.parse_args(argv)
+    keymap = _cli_pairs(args.keymap)
+
+    if args.command == 'index':
+        build_index(args.path, keymap, args.time_key, args.block_lines)
+        return 0
+    if args.command == 'export':
+        export_columnar_files(args.paths,
+                              columnar_schema(keymap=keymap),
+                              args.chunk_rows,
+                              args.processes or None)
+        return 0
+
+    level = args.level
+    if level is not None:
+        level = int(level) if level.isdigit() else logging.getLevelName(level.upper())
+        if level.__class__ is not int:
+            parser.error('unknown level: {}'.format(args.level))
+    query = LogQuery(level=level,
+                     logger=args.logger,
+                     since=args.since,
+                     until=args.until,
+                     fields={k: _cli_value(v) for k, v in _cli_pairs(args.field).items()},
+                     keymap=keymap,
+                     time_key=args.time_key)
+    output = sys.stdout.buffer
+    try:
+        for line in read_logs(args.path, query, raw=True, use_index=not args.no_index):
+            output.write(line + b'\n')
+        output.flush()
+    except BrokenPipeError:  # The output was piped to a command that did not read it all
+        sys.stderr.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
 # vim: et:sw=4:syntax=python:ts=4:
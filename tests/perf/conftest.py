@@ -0,0 +1,58 @@
+# -*- coding: utf-8; -*-
+import logging
+
+import pytest
+
+
+class NullHandler(logging.Handler):
+    """A handler that formats log records, then discards them.
+
+    Unlike :class:`logging.NullHandler`, it does call the formatter, which is what we
+    want to measure.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        """Formats the log record and throws the result away.
+        """
+        self.format(record)
+
+
+@pytest.fixture
+def null_handler():
+    """Provides a NullHandler instance.
+    """
+    yield NullHandler(level=logging.DEBUG)
+
+
+@pytest.fixture
+def null_logger(null_handler):
+    """Create a logger isolated from others, which only handler is the ``null_handler``.
+    """
+    the_logger = logging.getLogger('null_logger')
+    the_logger.propagate = False
+    the_logger.addHandler(null_handler)
+    the_logger.setLevel(logging.DEBUG)
+    the_logger.disabled = False
+
+    yield the_logger
+
+    the_logger.removeHandler(null_handler)
+
+
+@pytest.fixture
+def record():
+    """Provides a log record with a few extra attributes, as made by ``Logger.makeRecord``.
+    """
+    return logging.getLogger('null_logger').makeRecord('null_logger',
+                                                       logging.INFO,
+                                                       __file__,
+                                                       42,
+                                                       'greeting: %s',
+                                                       ('hello', ),
+                                                       None,
+                                                       extra={'request_id': 'abcdef',
+                                                              'user': 'someone',
+                                                              })
+
+
+# vim: et:sw=4:syntax=python:ts=4:
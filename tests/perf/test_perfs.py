@@ -1,8 +1,19 @@
 # -*- coding: utf-8; -*-
+import asyncio
+import json
 import logging
+import logging.config
 import logging_tree
+import multiprocessing
+import os
+import sys
+import threading
 
 import pytest
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
 try:
     from pythonjsonlogger import jsonlogger
 except ImportError:
@@ -120,4 +131,471 @@ def test_jsonlogging_with_partial_compiler2(all_attr_fmt,
                        iterations=100)
 
 
+@pytest.mark.parametrize('level',
+                         [logging.DEBUG, logging.ERROR, logging.INFO, logging.WARNING])
+@pytest.mark.parametrize('kwargs',
+                         [{'exc_info': True, 'stack_info': True, },
+                          {'exc_info': True, 'stack_info': False, },
+                          {'exc_info': False, 'stack_info': False, },
+                          {'exc_info': False, 'stack_info': True, },
+                          ])
+def test_jsonlogging_with_codegen_compiler(all_attr_fmt,
+                                           benchmark,
+                                           kwargs,
+                                           level,
+                                           null_handler,
+                                           null_logger):
+    # Given
+    null_handler.setFormatter(jsonlogging.Formatter(fmt=all_attr_fmt,
+                                                    style='{',
+                                                    _compiler=jsonlogging.codegen_compiler))
+    logging_tree.printout()
+
+    # Then
+    benchmark.pedantic(null_logger.log,
+                       args=(level, 'message'),
+                       kwargs=kwargs,
+                       rounds=100,
+                       iterations=100)
+
+
+@pytest.mark.parametrize('compiler',
+                         [jsonlogging.partial_compiler,
+                          jsonlogging.partial_compiler2,
+                          jsonlogging.partial_compiler3,
+                          jsonlogging.closure_compiler,
+                          jsonlogging.closure_compiler2,
+                          jsonlogging.codegen_compiler,
+                          ])
+def test_format_with_compiler(all_attr_fmt, benchmark, compiler, record):
+    """Compares compilers on the formatting of a record, without the logging machinery.
+    """
+    # Given
+    formatter = jsonlogging.Formatter(fmt=all_attr_fmt, style='{', _compiler=compiler)
+
+    # Then
+    benchmark.pedantic(formatter.format, args=(record, ), rounds=100, iterations=100)
+
+
+@pytest.mark.parametrize('compiler',
+                         [jsonlogging.partial_compiler,
+                          jsonlogging.partial_compiler3,
+                          jsonlogging.codegen_compiler,
+                          ])
+@pytest.mark.parametrize('direct_json', [False, True])
+def test_format_with_direct_json(all_attr_fmt, benchmark, compiler, direct_json, record):
+    # Given
+    formatter = jsonlogging.Formatter(fmt=all_attr_fmt,
+                                      direct_json=direct_json,
+                                      style='{',
+                                      _compiler=compiler)
+
+    # Then
+    benchmark.pedantic(formatter.format, args=(record, ), rounds=100, iterations=100)
+
+
+@pytest.mark.parametrize('backend',
+                         [pytest.param(name,
+                                       marks=pytest.mark.skipif(module() is None,
+                                                                reason='{} is not installed'
+                                                                .format(name)))
+                          for name, module, _, _ in jsonlogging.JSON_BACKENDS])
+@pytest.mark.parametrize('method', ['format', 'format_bytes'])
+def test_format_with_json_backend(all_attr_fmt, backend, benchmark, method, record):
+    # Given
+    formatter = jsonlogging.Formatter(fmt=all_attr_fmt,
+                                      json_backend=backend,
+                                      style='{',
+                                      _compiler=jsonlogging.codegen_compiler)
+
+    # Then
+    benchmark.pedantic(getattr(formatter, method), args=(record, ), rounds=100, iterations=100)
+
+
+def test_format_time_with_logging_formatter(benchmark, record):
+    """Reference: time stamps formatting by the standard library.
+    """
+    # Given
+    formatter = logging.Formatter()
+
+    # Then
+    benchmark.pedantic(formatter.formatTime, args=(record, ), rounds=100, iterations=1000)
+
+
+@pytest.mark.parametrize('time_format', jsonlogging.TIME_FORMATS)
+def test_format_time(benchmark, record, time_format):
+    # Given
+    formatter = jsonlogging.Formatter('{asctime}', style='{', time_format=time_format)
+
+    # Then
+    benchmark.pedantic(formatter.formatTime, args=(record, ), rounds=100, iterations=1000)
+
+
+@pytest.mark.parametrize('traceback_cache_size', [0, 128])
+def test_format_exception(benchmark, traceback_cache_size):
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}',
+                                      style='{',
+                                      traceback_cache_size=traceback_cache_size)
+    try:
+        raise ValueError('oops')
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    # Then
+    benchmark.pedantic(formatter.formatException,
+                       args=(exc_info, ),
+                       rounds=100,
+                       iterations=1000)
+
+
+@pytest.mark.parametrize('logger_class', [logging.Logger, jsonlogging.Logger])
+def test_log_with_structured_stack(benchmark, logger_class, null_handler):
+    # Given
+    logger = logger_class('structured_logger', level=logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(null_handler)
+    null_handler.setFormatter(jsonlogging.Formatter('{message} {stack_info}',
+                                                    format_stacks=True,
+                                                    style='{'))
+
+    # Then
+    benchmark.pedantic(logger.info,
+                       args=('message', ),
+                       kwargs={'stack_info': True},
+                       rounds=100,
+                       iterations=100)
+
+
+def test_log_through_queue_handler(all_attr_fmt, benchmark, null_handler):
+    """Measures the cost of logging on the caller's thread, formatting happens in the listener's.
+    """
+    # Given
+    queue_handler = jsonlogging.QueueHandler(maxsize=0)
+    logger = logging.Logger('queue_logger', level=logging.DEBUG)
+    logger.addHandler(queue_handler)
+    null_handler.setFormatter(jsonlogging.Formatter(fmt=all_attr_fmt, style='{'))
+
+    # Then
+    with jsonlogging.QueueListener(queue_handler, null_handler):
+        benchmark.pedantic(logger.info,
+                           args=('message', ),
+                           kwargs={'extra': {'k': 'v'}},
+                           rounds=100,
+                           iterations=100)
+
+
+@pytest.mark.parametrize('handler_class',
+                         [jsonlogging.FileHandler, jsonlogging.BufferedFileHandler])
+def test_log_to_file(benchmark, handler_class, tmpdir):
+    # Given
+    handler = handler_class(str(tmpdir.join('log.jsonl')))
+    handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {name} {message}',
+                                               style='{'))
+    logger = logging.Logger('file_logger', level=logging.DEBUG)
+    logger.addHandler(handler)
+
+    # Then
+    benchmark.pedantic(logger.info, args=('message', ), rounds=100, iterations=100)
+    handler.close()
+
+
+def log_in_workers(handler, processes=4, count=1000):
+    def work():
+        logger = logging.Logger('worker', level=logging.DEBUG)
+        logger.addHandler(handler)
+        for i in range(count):
+            logger.info('record %d', i)
+        handler.flush()
+
+    fork = multiprocessing.get_context('fork')
+    workers = [fork.Process(target=work) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@pytest.mark.parametrize('sink', ['file', 'aggregator'])
+def test_multiprocess_throughput(benchmark, sink, tmpdir):
+    """Measures the time 4 processes take to log 1000 records each.
+    """
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    if sink == 'file':
+        handler = jsonlogging.MultiprocessFileHandler(filename)
+    else:
+        aggregator = jsonlogging.LogAggregator(str(tmpdir.join('log.sock')), filename)
+        server = threading.Thread(target=aggregator.serve_forever, kwargs={'poll_interval': 0.01})
+        server.start()
+        handler = jsonlogging.UnixSocketHandler(aggregator.path)
+    handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {process} {message}',
+                                               style='{'))
+
+    # Then
+    benchmark.pedantic(log_in_workers, args=(handler, ), rounds=5, iterations=1)
+    handler.close()
+    if sink == 'aggregator':
+        aggregator.shutdown()
+        server.join()
+
+
+def log_from_event_loop(logger, drain, count=1000):
+    async def work():
+        for i in range(count):
+            logger.info('record %d', i)
+        await drain()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(work())
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('handler_kind', ['asyncio', 'queue'])
+def test_log_from_event_loop(benchmark, handler_kind, tmpdir):
+    """Compares the AsyncioHandler with a QueueHandler/QueueListener pair, from a coroutine.
+    """
+    # Given
+    formatter = jsonlogging.Formatter('{asctime} {levelname} {name} {message}', style='{')
+    filename = str(tmpdir.join('log.jsonl'))
+    logger = logging.Logger('loop_logger', level=logging.DEBUG)
+    if handler_kind == 'asyncio':
+        handler = jsonlogging.AsyncioHandler(filename)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+        listener = None
+        drain = handler.drain
+    else:
+        file_handler = jsonlogging.FileHandler(filename)
+        file_handler.setFormatter(formatter)
+        handler = jsonlogging.QueueHandler(maxsize=0)
+        logger.addHandler(handler)
+        listener = jsonlogging.QueueListener(handler, file_handler)
+        listener.start()
+
+        async def drain():
+            handler.queue.join()
+
+    # Then
+    benchmark.pedantic(log_from_event_loop, args=(logger, drain), rounds=10)
+    if listener is not None:
+        listener.stop()
+        file_handler.close()
+    handler.close()
+
+
+@pytest.mark.parametrize('static', [False, True])
+def test_format_with_static_fields(benchmark, static):
+    """Compares global fields passed as extras on every call, with static fields.
+    """
+    # Given
+    fields = {'service': 'api', 'host': 'localhost', 'version': '1.2.3'}
+    formatter = jsonlogging.Formatter('{asctime} {levelname} {message}',
+                                      style='{',
+                                      static_fields=fields if static else None)
+    record = logging.makeLogRecord(dict({'msg': 'message'}, **({} if static else fields)))
+
+    # Then
+    benchmark(formatter.format, record)
+
+
+@pytest.mark.skipif(contextvars is None, reason='contextvars require Python 3.7')
+@pytest.mark.parametrize('context', [False, True])
+def test_format_with_context_vars(benchmark, context):
+    """Compares request scoped fields passed as extras on every call, with context variables.
+    """
+    # Given
+    fields = {'request_id': '6f1e0c1c', 'user': 'alice'}
+    context_vars = [contextvars.ContextVar(name) for name in fields]
+    for var in context_vars:
+        var.set(fields[var.name])
+    formatter = jsonlogging.Formatter('{asctime} {levelname} {message}',
+                                      style='{',
+                                      context_vars=context_vars if context else None)
+    record = logging.makeLogRecord(dict({'msg': 'message'}, **({} if context else fields)))
+
+    # Then
+    benchmark(formatter.format, record)
+
+
+@pytest.mark.parametrize('limited', [False, True])
+def test_format_oversized_record(benchmark, limited):
+    """Measures the formatting of a record with a multi-megabyte message, with size limits or not.
+    """
+    # Given
+    formatter = jsonlogging.Formatter('{asctime} {levelname} {message}',
+                                      style='{',
+                                      max_field_length=4096 if limited else None,
+                                      max_line_bytes=8192 if limited else None)
+    record = logging.makeLogRecord({'msg': 'x' * (4 * 1024 * 1024), 'payload': 'y' * 65536})
+
+    # Then
+    benchmark(formatter.format, record)
+
+
+@pytest.mark.parametrize('rate_limited', [False, True])
+def test_log_repeated_warning(benchmark, null_handler, rate_limited):
+    """Measures logging a warning fired in a loop, through a rate limiting filter or not.
+    """
+    # Given
+    null_handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {message}',
+                                                    style='{'))
+    if rate_limited:
+        null_handler.addFilter(jsonlogging.RateLimitFilter(rate=10, summary_interval=None))
+    logger = logging.Logger('repeated_logger', level=logging.DEBUG)
+    logger.addHandler(null_handler)
+
+    # Then
+    benchmark(logger.warning, 'disk full: %d bytes left', 0)
+
+
+def configure_handlers(count):
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {'json{}'.format(i): {'()': 'jsonlogging.Formatter',
+                                            'fmt': '{asctime} {levelname} {name} {message}',
+                                            'style': '{',
+                                            'keymap': {'asctime': 'timestamp'},
+                                            }
+                       for i in range(count)},
+        'handlers': {'null{}'.format(i): {'class': 'logging.NullHandler',
+                                          'formatter': 'json{}'.format(i)}
+                     for i in range(count)},
+        'loggers': {'configured.{}'.format(i): {'handlers': ['null{}'.format(i)],
+                                                'propagate': False}
+                    for i in range(count)},
+    })
+
+
+@pytest.mark.parametrize('count', [100, 500])
+def test_dict_config_with_many_handlers(benchmark, count):
+    """Measures the time dictConfig takes to set up hundreds of handlers, with a formatter each.
+    """
+    # Then
+    benchmark.pedantic(configure_handlers, args=(count, ), rounds=10)
+    logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})
+
+
+@pytest.fixture(scope='module')
+def large_log(tmpdir_factory):
+    """Provides a log file of 100,000 entries, one in a hundred an error.
+    """
+    path = str(tmpdir_factory.mktemp('logs').join('log.jsonl'))
+    handler = jsonlogging.FileHandler(path)
+    handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {name} {message}',
+                                               style='{',
+                                               time_format='epoch'))
+    for i in range(100000):
+        level = logging.ERROR if i % 100 == 0 else logging.INFO
+        handler.handle(logging.makeLogRecord({'name': 'app', 'levelno': level,
+                                              'levelname': logging.getLevelName(level),
+                                              'msg': 'entry %d', 'args': (i, ),
+                                              'created': float(i)}))
+    handler.close()
+    return path
+
+
+def read_errors_with_json(path):
+    with open(path, 'rb') as log_file:
+        return [entry for entry in map(json.loads, log_file) if entry['levelname'] == 'ERROR']
+
+
+@pytest.mark.parametrize('reader', ['json', 'read_logs', 'read_logs_indexed'])
+def test_read_errors(benchmark, large_log, reader):
+    """Compares decoding every line, with read_logs prefiltering lines, or seeking with an index.
+    """
+    # Given
+    query = jsonlogging.LogQuery(level=logging.ERROR)
+    if reader == 'read_logs_indexed':
+        jsonlogging.build_index(large_log)
+    elif os.path.exists(large_log + jsonlogging.INDEX_SUFFIX):
+        os.remove(large_log + jsonlogging.INDEX_SUFFIX)
+
+    # When
+    if reader == 'json':
+        errors = benchmark(read_errors_with_json, large_log)
+    else:
+        errors = benchmark(lambda: list(jsonlogging.read_logs(large_log, query)))
+
+    # Then
+    assert len(errors) == 1000
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_log_to_compressed_rotating_file(benchmark, stream, tmpdir):
+    """Measures logging to rotated files compressed in the background, or as they are written.
+    """
+    # Given
+    handler = jsonlogging.CompressedRotatingFileHandler(str(tmpdir.join('log.jsonl')),
+                                                        max_bytes=256 * 1024,
+                                                        stream=stream)
+    handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {name} {message}',
+                                               style='{'))
+    logger = logging.Logger('compressed_logger', level=logging.DEBUG)
+    logger.addHandler(handler)
+
+    # Then
+    benchmark.pedantic(logger.info, args=('message', ), rounds=100, iterations=100)
+    handler.close()
+
+
+def test_export_columnar(benchmark, large_log):
+    """Measures the conversion of a large log file to a columnar file.
+    """
+    # Then
+    benchmark.pedantic(jsonlogging.export_columnar, args=(large_log, ), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize('interned', [False, True])
+def test_format_with_interned_fields(benchmark, interned):
+    """Measures the formatting of records with their repetitive fields interned, or not.
+    """
+    # Given
+    fields = ['filename', 'funcName', 'module', 'name', 'pathname', 'processName', 'threadName']
+    formatter = jsonlogging.Formatter(' '.join('{%s}' % field for field in fields) + ' {message}',
+                                      style='{',
+                                      intern_fields=fields if interned else None)
+    record = logging.makeLogRecord({'msg': 'message', 'name': 'app.db', 'pathname': __file__})
+
+    # Then
+    benchmark(formatter.format, record)
+
+
+@pytest.mark.parametrize('profile', [False, True])
+def test_format_with_profile(benchmark, profile):
+    """Measures the overhead of timing the stages of formatting.
+    """
+    # Given
+    formatter = jsonlogging.Formatter('{asctime} {levelname} {name} {message}',
+                                      style='{',
+                                      profile=profile)
+    record = logging.makeLogRecord({'msg': 'message', 'k': 'v'})
+
+    # Then
+    benchmark(formatter.format, record)
+
+
+def test_extras_with_dir_scan(benchmark, record):
+    """Reference: how extras were extracted before (kept here for comparison).
+    """
+    # Given
+    def extras(record):
+        return {k: str(getattr(record, k))
+                for k in dir(record)
+                if k not in jsonlogging._ALL_LOG_RECORD_ATTRS and not k.startswith('__')}
+
+    # Then
+    result = benchmark.pedantic(extras, args=(record, ), rounds=100, iterations=1000)
+    assert result == {'request_id': 'abcdef', 'user': 'someone'}
+
+
+def test_extras_with_baseline_diff(benchmark, record):
+    # Then
+    result = benchmark.pedantic(jsonlogging._extras, args=(record, ), rounds=100, iterations=1000)
+    assert result == {'request_id': 'abcdef', 'user': 'someone'}
+
+
 # vim: et:sw=4:syntax=python:ts=4:
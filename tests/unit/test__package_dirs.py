@@ -24,4 +24,42 @@ def test__package_dirs_with(filename, expected):
     assert match.group(1) == expected
 
 
+@pytest.mark.parametrize('filename,expected',
+                         [('/usr/lib/pythonX.Y/site-packages/somelib/somemodule.py',
+                           'somelib/somemodule.py'),
+                          ('/srv/app/.venv/lib/pythonX.Y/site-packages/somelib/somemodule.py',
+                           'somelib/somemodule.py'),
+                          ('/srv/app/src/mymodule.py', 'src/mymodule.py'),
+                          ('/srv/app/vendor/lib/module.py', 'lib/module.py'),
+                          ('/opt/elsewhere/module.py', '/opt/elsewhere/module.py'),
+                          ])
+def test_relativize_with_path_prefixes(filename, expected):
+    """Ensures we remove configured prefixes, the most specific first.
+    """
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}',
+                                      style='{',
+                                      path_prefixes=['/srv/app/', '/srv/app/vendor'],
+                                      relative_paths=True)
+
+    # Then
+    assert formatter._relativize(filename) == expected
+
+
+def test_relativize_is_cached_across_formatters():
+    # Given
+    filename = '/usr/lib/pythonX.Y/site-packages/cachedlib/module.py'
+    first = jsonlogging.Formatter('{exc_info}', style='{', relative_paths=True)
+    second = jsonlogging.Formatter('{exc_info}', style='{', relative_paths=True)
+    before = jsonlogging.Formatter.relativize_cache_info()
+
+    # When
+    first._relativize(filename)
+    second._relativize(filename)
+
+    # Then
+    after = second.relativize_cache_info()
+    assert (after.hits - before.hits, after.misses - before.misses) == (1, 1)
+
+
 # vim: et:sw=4:syntax=python:ts=4:
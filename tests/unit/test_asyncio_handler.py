@@ -0,0 +1,226 @@
+# -*- coding: utf-8; -*-
+import asyncio
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def loop():
+    """Provides a fresh event loop, closed afterwards.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def logger():
+    """Provides a logger out of the logging tree, without any handler.
+    """
+    return logging.Logger('asyncio_logger', level=logging.DEBUG)
+
+
+def make_handler(target, **kwargs):
+    handler = jsonlogging.AsyncioHandler(target, **kwargs)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+    return handler
+
+
+def test_asyncio_handler_writes_regular_files_off_the_loop(loop, logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = make_handler(filename)
+    logger.addHandler(handler)
+
+    async def main():
+        for i in range(10):
+            logger.info('message %d', i)
+        pending = handler.buffered
+        await handler.drain()
+        return pending
+
+    # When
+    pending = loop.run_until_complete(main())
+    handler.close()
+
+    # Then
+    with open(filename, 'rb') as log_file:
+        logs = [json.loads(line.decode('utf-8')) for line in log_file]
+    assert [log['message'] for log in logs] == ['message {}'.format(i) for i in range(10)]
+    assert pending > 0
+    assert handler.buffered == 0
+    assert handler.written == handler.high_water == os.path.getsize(filename)
+
+
+def test_asyncio_handler_waits_for_pipes_to_become_writable(loop, logger):
+    # Given
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    handler = make_handler(write_fd)
+    logger.addHandler(handler)
+    received = bytearray()
+
+    def read():
+        try:
+            received.extend(os.read(read_fd, 65536))
+        except BlockingIOError:
+            pass
+
+    async def main():
+        loop.add_reader(read_fd, read)
+        for i in range(2000):
+            logger.info('message %d', i)
+        await handler.drain()
+        loop.remove_reader(read_fd)
+        read()
+
+    # When
+    loop.run_until_complete(main())
+    handler.close()
+
+    # Then
+    messages = [json.loads(line)['message'] for line in bytes(received).splitlines()]
+    assert messages == ['message {}'.format(i) for i in range(2000)]
+    assert handler.high_water > 65536  # More than a pipe buffer: the handler had to wait
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_asyncio_handler_waits_for_fifos_it_opens_to_become_writable(loop, logger, tmpdir):
+    # Given
+    path = str(tmpdir.join('log.fifo'))
+    os.mkfifo(path)
+    read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    handler = make_handler(path)
+    logger.addHandler(handler)
+    received = bytearray()
+
+    def read():
+        try:
+            received.extend(os.read(read_fd, 65536))
+        except BlockingIOError:
+            pass
+
+    async def main():
+        loop.add_reader(read_fd, read)
+        for i in range(2000):
+            logger.info('message %d', i)
+        assert not os.get_blocking(handler._fd)
+        await handler.drain()
+        loop.remove_reader(read_fd)
+        read()
+
+    # When
+    loop.run_until_complete(main())
+    handler.close()
+    os.close(read_fd)
+
+    # Then
+    messages = [json.loads(line)['message'] for line in bytes(received).splitlines()]
+    assert messages == ['message {}'.format(i) for i in range(2000)]
+    assert handler.high_water > 65536
+
+
+def test_asyncio_handler_leaves_given_file_descriptors_blocking(loop, logger):
+    # Given
+    read_fd, write_fd = os.pipe()
+    handler = make_handler(write_fd)
+    logger.addHandler(handler)
+
+    async def main():
+        logger.info('message')
+        assert os.get_blocking(write_fd)
+        await handler.drain()
+
+    # When
+    loop.run_until_complete(main())
+    handler.close()
+
+    # Then
+    assert os.get_blocking(write_fd)
+    assert json.loads(os.read(read_fd, 65536))['message'] == 'message'
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_asyncio_handler_drops_records_past_max_buffered(loop, logger, tmpdir):
+    # Given
+    handler = make_handler(str(tmpdir.join('log.jsonl')), max_buffered=100)
+    logger.addHandler(handler)
+
+    async def main():
+        for i in range(10):
+            logger.info('message %d', i)
+        await handler.drain()
+
+    # When
+    loop.run_until_complete(main())
+    handler.close()
+
+    # Then
+    assert handler.dropped > 0
+    assert handler.high_water <= 100
+
+
+def test_asyncio_handler_accepts_records_from_other_threads(loop, logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = make_handler(filename, loop=loop)
+    logger.addHandler(handler)
+
+    async def main():
+        thread = threading.Thread(target=logger.info, args=('from a thread',))
+        thread.start()
+        await loop.run_in_executor(None, thread.join)
+        await asyncio.sleep(0)
+        await handler.drain()
+
+    # When
+    loop.run_until_complete(main())
+    handler.close()
+
+    # Then
+    with open(filename, 'rb') as log_file:
+        assert json.loads(log_file.read().decode('utf-8'))['message'] == 'from a thread'
+
+
+def test_asyncio_handler_writes_synchronously_without_loop(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = make_handler(filename)
+    logger.addHandler(handler)
+
+    # When
+    logger.warning('no loop')
+
+    # Then
+    with open(filename, 'rb') as log_file:
+        assert json.loads(log_file.read().decode('utf-8'))['message'] == 'no loop'
+    handler.close()
+
+
+def test_asyncio_handler_reports_write_errors_without_loop(logger):
+    # Given
+    read_fd, write_fd = os.pipe()
+    os.close(read_fd)
+    handler = make_handler(write_fd)
+    errors = []
+    handler.handleError = errors.append
+    logger.addHandler(handler)
+
+    # When
+    logger.warning('nobody reads')
+
+    # Then
+    assert [record.getMessage() for record in errors] == ['nobody reads']
+    handler.close()
+    os.close(write_fd)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
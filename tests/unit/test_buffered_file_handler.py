@@ -0,0 +1,96 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import os
+import time
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def buffered_handler(tmpdir):
+    """Provides a BufferedFileHandler writing to a temporary file, without time based flushes.
+    """
+    handler = jsonlogging.BufferedFileHandler(str(tmpdir.join('log.jsonl')),
+                                              buffer_size=1024,
+                                              flush_interval=None)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+    yield handler
+    handler.close()
+
+
+@pytest.fixture
+def logger():
+    """Provides a logger out of the logging tree, without any handler.
+    """
+    return logging.Logger('buffered_logger', level=logging.DEBUG)
+
+
+def read_logs(handler):
+    with open(handler.baseFilename, 'rb') as log_file:
+        return [json.loads(line.decode('utf-8')) for line in log_file]
+
+
+def test_buffered_file_handler_flushes_at_flush_level(buffered_handler, logger, mocker):
+    # Given
+    logger.addHandler(buffered_handler)
+    writev = mocker.spy(os, 'writev')
+
+    # When
+    logger.info('first')
+    logger.warning('second')
+    before_error = read_logs(buffered_handler)
+    logger.error('third')
+
+    # Then
+    assert before_error == []
+    assert [log['message'] for log in read_logs(buffered_handler)] == ['first', 'second', 'third']
+    assert writev.call_count == 1
+
+
+def test_buffered_file_handler_flushes_when_buffer_is_full(buffered_handler, logger):
+    # Given
+    logger.addHandler(buffered_handler)
+
+    # When
+    for i in range(100):
+        logger.info('message number %d', i)
+
+    # Then
+    logs = read_logs(buffered_handler)
+    assert 0 < len(logs) < 100
+    assert logs[-1]['message'] == 'message number {}'.format(len(logs) - 1)
+
+
+def test_buffered_file_handler_flushes_on_close(buffered_handler, logger):
+    # Given
+    logger.addHandler(buffered_handler)
+    logger.info('first')
+
+    # When
+    buffered_handler.close()
+
+    # Then
+    assert [log['message'] for log in read_logs(buffered_handler)] == ['first']
+
+
+def test_buffered_file_handler_flushes_periodically(logger, tmpdir):
+    # Given
+    handler = jsonlogging.BufferedFileHandler(str(tmpdir.join('log.jsonl')), flush_interval=0.01)
+    handler.setFormatter(jsonlogging.Formatter('{message}', style='{'))
+    logger.addHandler(handler)
+
+    # When
+    logger.info('first')
+    deadline = time.monotonic() + 5
+    while not read_logs(handler) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Then
+    handler.close()
+    assert read_logs(handler) == [{'message': 'first'}]
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,62 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import sys
+
+import jsonlogging
+
+
+FMT = '{asctime} {levelname:8s} {levelno} {name} {lineno:5d} {message}'
+
+
+def test_codegen_compiler_output_matches_partial_compiler(logger):
+    # Given
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'greeting: %s', ('hello', ),
+                               None, extra={'k': 'v'})
+    reference = jsonlogging.Formatter(FMT, style='{', keymap={'name': 'domain'})
+    formatter = jsonlogging.Formatter(FMT,
+                                      style='{',
+                                      keymap={'name': 'domain'},
+                                      _compiler=jsonlogging.codegen_compiler)
+
+    # When
+    expected = reference.format(record)
+    log = formatter.format(record)
+
+    # Then
+    assert log == expected
+    assert json.loads(log)['domain'] == logger.name
+
+
+def test_codegen_compiler_output_with_exc_info(logger):
+    # Given
+    formatter = jsonlogging.Formatter(FMT + ' {exc_info}',
+                                      style='{',
+                                      _compiler=jsonlogging.codegen_compiler)
+    try:
+        raise ValueError('oops')
+    except ValueError:
+        record = logger.makeRecord(logger.name, logging.ERROR, __file__, 1, 'failure', (),
+                                   sys.exc_info())
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log['exc_info']['type'] == 'ValueError'
+    assert log['exc_info']['value'] == 'oops'
+
+
+def test_codegen_compiler_caches_generated_code():
+    # Given
+    first = jsonlogging.Formatter(FMT, style='{', _compiler=jsonlogging.codegen_compiler)
+
+    # When
+    second = jsonlogging.Formatter(FMT, style='{', _compiler=jsonlogging.codegen_compiler)
+
+    # Then
+    assert first.format is not second.format
+    assert first.format.__code__ is second.format.__code__
+
+
+# vim: et:sw=4:syntax=python:ts=4:
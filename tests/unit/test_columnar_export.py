@@ -0,0 +1,146 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import os
+
+import pytest
+
+import jsonlogging
+
+
+FMT = '{created} {levelname} {levelno} {name} {lineno} {message}'
+
+
+@pytest.fixture
+def formatter():
+    return jsonlogging.Formatter(FMT, style='{', keymap={'levelname': 'level'})
+
+
+@pytest.fixture
+def log_path(tmpdir, formatter):
+    """Provides a log file of entries from two loggers, some with extras, one being written.
+    """
+    path = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.FileHandler(path)
+    handler.setFormatter(formatter)
+    for i in range(10):
+        level = logging.ERROR if i % 5 == 0 else logging.INFO
+        extra = {'user': 'user%d' % i} if i % 2 else {}
+        handler.handle(logging.makeLogRecord(dict(extra,
+                                                  name='app.db' if i % 2 else 'other',
+                                                  levelno=level,
+                                                  levelname=logging.getLevelName(level),
+                                                  lineno=i,
+                                                  msg='entry %d',
+                                                  args=(i, ),
+                                                  created=1000.123456789 + i)))
+    handler.close()
+    with open(path, 'ab') as log_file:
+        log_file.write(b'{"created":"1100.0","level":"ERR')
+    return path
+
+
+def read_lines(path):
+    with open(path, 'rb') as log_file:
+        return [json.loads(line) for line in log_file.read().splitlines()[:-1]]
+
+
+def test_columnar_schema_from_formatter(formatter):
+    # When
+    schema = jsonlogging.columnar_schema(formatter)
+
+    # Then
+    assert schema == (('created', 'delta_time'),
+                      ('level', 'dictionary'),
+                      ('levelno', 'int'),
+                      ('name', 'dictionary'),
+                      ('lineno', 'int'),
+                      ('message', 'json'),
+                      )
+
+
+def test_export_columnar_round_trip(log_path, formatter):
+    # Given
+    schema = jsonlogging.columnar_schema(formatter)
+
+    # When
+    rows = jsonlogging.export_columnar(log_path, schema=schema, chunk_rows=4)
+
+    # Then
+    assert rows == 10
+    entries = list(jsonlogging.read_columnar(log_path + jsonlogging.COLUMNAR_SUFFIX, rows=True))
+    expected = read_lines(log_path)
+    for entry in expected:
+        entry.update(created=float(entry['created']),
+                     levelno=int(entry['levelno']),
+                     lineno=int(entry['lineno']))
+    assert entries == expected
+
+
+def test_export_columnar_encodes_columns(log_path, formatter):
+    # When
+    jsonlogging.export_columnar(log_path, schema=jsonlogging.columnar_schema(formatter))
+
+    # Then
+    output = log_path + jsonlogging.COLUMNAR_SUFFIX
+    chunk, = jsonlogging.read_columnar(output)
+    assert chunk['level'] == ['ERROR', 'INFO', 'INFO', 'INFO', 'INFO',
+                              'ERROR', 'INFO', 'INFO', 'INFO', 'INFO']
+    assert chunk['lineno'] == list(range(10))
+    assert chunk[None] == [None, {'user': 'user1'}, None, {'user': 'user3'}, None,
+                           {'user': 'user5'}, None, {'user': 'user7'}, None, {'user': 'user9'}]
+    assert os.path.getsize(output) < os.path.getsize(log_path)
+
+
+def test_export_columnar_falls_back_to_json(tmpdir):
+    # Given
+    path = str(tmpdir.join('log.jsonl'))
+    with open(path, 'w') as log_file:
+        log_file.write('{"levelno": "high", "created": 1.5, "name": ["a"]}\n'
+                       '{"levelno": 2, "created": null, "name": ["a"]}\n'
+                       '[]\n')
+
+    # When
+    jsonlogging.export_columnar(path)
+
+    # Then
+    chunk, = jsonlogging.read_columnar(path + jsonlogging.COLUMNAR_SUFFIX)
+    assert chunk['levelno'] == ['high', 2]
+    assert chunk['created'] == [1.5, None]
+    assert chunk['name'] == [['a'], ['a']]
+    assert chunk['message'] == [None, None]
+
+
+def test_read_columnar_rejects_other_files(log_path):
+    # Then
+    with pytest.raises(ValueError):
+        list(jsonlogging.read_columnar(log_path))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_export_columnar_files(log_path, tmpdir, processes):
+    # Given
+    other_path = str(tmpdir.join('other.jsonl'))
+    with open(log_path, 'rb') as log_file, open(other_path, 'wb') as other_file:
+        other_file.write(log_file.read())
+
+    # When
+    rows = jsonlogging.export_columnar_files([log_path, other_path], processes=processes)
+
+    # Then
+    assert rows == [10, 10]
+    assert (list(jsonlogging.read_columnar(log_path + jsonlogging.COLUMNAR_SUFFIX))
+            == list(jsonlogging.read_columnar(other_path + jsonlogging.COLUMNAR_SUFFIX)))
+
+
+def test_main_export(log_path):
+    # When
+    assert jsonlogging.main(['export', log_path, '--keymap', 'levelname=level']) == 0
+
+    # Then
+    chunk, = jsonlogging.read_columnar(log_path + jsonlogging.COLUMNAR_SUFFIX)
+    assert chunk['level'][:2] == ['ERROR', 'INFO']
+    assert chunk['exc_info'] == [None] * 10
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,152 @@
+# -*- coding: utf-8; -*-
+import gzip
+import json
+import logging
+import os
+import zlib
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def logger():
+    """Provides a logger out of the logging tree, without any handler.
+    """
+    return logging.Logger('compressed_logger', level=logging.DEBUG)
+
+
+def make_handler(filename, **kwargs):
+    handler = jsonlogging.CompressedRotatingFileHandler(filename, **kwargs)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+    return handler
+
+
+def test_compressed_rotating_file_handler_compresses_rotated_files(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = make_handler(filename, max_bytes=1000, backup_count=2)
+    logger.addHandler(handler)
+
+    # When
+    for i in range(100):
+        logger.info('entry %d', i)
+    handler.close()
+
+    # Then
+    assert sorted(os.listdir(str(tmpdir))) == ['app.log', 'app.log.1.gz', 'app.log.2.gz']
+    with gzip.open(filename + '.2.gz') as older, gzip.open(filename + '.1.gz') as newer, \
+            open(filename, 'rb') as current:
+        lines = older.read().splitlines() + newer.read().splitlines() + current.readlines()
+    entries = [json.loads(line) for line in lines]
+    assert [entry['message'] for entry in entries] == \
+        ['entry {}'.format(i) for i in range(100 - len(entries), 100)]
+    assert os.path.getsize(filename) <= 1000
+    assert handler.bytes_in == sum(len('{{"levelname":"INFO","message":"entry {}"}}\n'.format(i))
+                                   for i in range(100))
+    assert handler.bytes_out > 0
+
+
+def test_compressed_rotating_file_handler_without_backups(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = make_handler(filename, max_bytes=100, backup_count=0)
+    logger.addHandler(handler)
+
+    # When
+    for i in range(10):
+        logger.info('entry %d', i)
+    handler.close()
+
+    # Then
+    assert os.listdir(str(tmpdir)) == ['app.log']
+
+
+def test_compressed_rotating_file_handler_streams_readable_segments(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = make_handler(filename, stream=True, sync_interval=3600)
+    logger.addHandler(handler)
+
+    # When
+    logger.info('first')
+    logger.warning('second')
+    handler.flush()
+
+    # Then
+    with open(filename + '.gz', 'rb') as stream:
+        tail = zlib.decompressobj(31).decompress(stream.read())
+    assert [json.loads(line)['message'] for line in tail.splitlines()] == ['first', 'second']
+
+    # When
+    logger.error('third')
+    handler.close()
+
+    # Then
+    with gzip.open(filename + '.gz') as stream:
+        assert [json.loads(line)['message'] for line in stream] == ['first', 'second', 'third']
+    assert handler.bytes_out == os.path.getsize(filename + '.gz')
+    assert handler.bytes_out < handler.bytes_in * 2
+
+
+def test_compressed_rotating_file_handler_appends_streamed_segments(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    for message in ('first', 'second'):
+        handler = make_handler(filename, stream=True)
+        logger.addHandler(handler)
+
+        # When
+        logger.info(message)
+        handler.close()
+        logger.removeHandler(handler)
+
+    # Then
+    with gzip.open(filename + '.gz') as stream:
+        assert [json.loads(line)['message'] for line in stream] == ['first', 'second']
+
+
+def test_compressed_rotating_file_handler_rotates_streamed_segments(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = make_handler(filename, stream=True, max_bytes=200, backup_count=3, sync_interval=0)
+    logger.addHandler(handler)
+
+    # When
+    for i in range(100):
+        logger.info('entry %d', i)
+    handler.close()
+
+    # Then
+    assert sorted(os.listdir(str(tmpdir))) == \
+        ['app.log.1.gz', 'app.log.2.gz', 'app.log.3.gz', 'app.log.gz']
+    with gzip.open(filename + '.gz') as stream:
+        assert json.loads(stream.readlines()[-1])['message'] == 'entry 99'
+
+
+@pytest.mark.skipif(jsonlogging.zstandard is None, reason='requires zstandard')
+def test_compressed_rotating_file_handler_with_zstd(logger, tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = make_handler(filename, max_bytes=100, compression='zstd')
+    logger.addHandler(handler)
+
+    # When
+    for i in range(10):
+        logger.info('entry %d', i)
+    handler.close()
+
+    # Then
+    with open(filename + '.1.zst', 'rb') as stream:
+        data = jsonlogging.zstandard.ZstdDecompressor().decompressobj().decompress(stream.read())
+    assert json.loads(data.splitlines()[-1])['message'].startswith('entry')
+
+
+def test_compressed_rotating_file_handler_with_unknown_compression(tmpdir):
+    # Then
+    with pytest.raises(ValueError):
+        jsonlogging.CompressedRotatingFileHandler(str(tmpdir.join('app.log')), compression='rar')
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,92 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+import jsonlogging
+from jsonlogging import codegen_compiler, partial_compiler, partial_compiler3
+
+
+COMPILERS = [codegen_compiler, partial_compiler, partial_compiler3]
+
+pytestmark = pytest.mark.skipif(contextvars is None, reason='contextvars require Python 3.7')
+
+
+@pytest.fixture
+def request_id():
+    return contextvars.ContextVar('request_id')
+
+
+def make_record(logger):
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+
+
+@pytest.mark.parametrize('direct_json', [False, True])
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_formatter_outputs_context_variables(compiler, direct_json, logger, request_id):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{',
+                                      context_vars=[request_id],
+                                      direct_json=direct_json,
+                                      static_fields={'service': 'api'},
+                                      _compiler=compiler)
+
+    def log_in_request(value):
+        request_id.set(value)
+        return formatter.format(make_record(logger)), formatter.format_bytes(make_record(logger))
+
+    # When
+    outside = formatter.format(make_record(logger))
+    inside, inside_bytes = contextvars.copy_context().run(log_in_request, 'abc')
+
+    # Then
+    assert json.loads(outside) == {'service': 'api', 'message': 'msg'}
+    assert list(json.loads(inside).items()) == [('service', 'api'),
+                                                ('request_id', 'abc'),
+                                                ('message', 'msg')]
+    assert inside_bytes == inside.encode('utf-8')
+
+
+def test_formatter_encodes_context_once_per_value(logger, request_id):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{', context_vars=[request_id])
+    token = request_id.set({'id': 1})
+
+    # When
+    logs = [formatter.format(make_record(logger)) for _ in range(3)]
+    request_id.reset(token)
+
+    # Then
+    assert logs == ['{"request_id":{"id":1},"message":"msg"}'] * 3
+    assert len(formatter._context_cache) == 1
+
+
+def test_queue_handler_saves_context_for_formatters(logger, request_id):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{', context_vars=[request_id])
+    handler = jsonlogging.QueueHandler()
+    token = request_id.set('abc')
+    record = handler.prepare(make_record(logger))
+    request_id.reset(token)
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log == {'request_id': 'abc', 'message': 'msg'}
+
+
+def test_formatter_rejects_context_variables_duplicating_record_keys(request_id):
+    # Then
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter('{message}', style='{',
+                              keymap={'message': 'request_id'},
+                              context_vars=[request_id])
+
+
+# vim: et:sw=4:syntax=python:ts=4:
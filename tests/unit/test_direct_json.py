@@ -0,0 +1,67 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+COMPILERS = [jsonlogging.partial_compiler,
+             jsonlogging.partial_compiler2,
+             jsonlogging.partial_compiler3,
+             jsonlogging.closure_compiler,
+             jsonlogging.closure_compiler2,
+             jsonlogging.codegen_compiler,
+             ]
+
+
+@pytest.fixture
+def records(logger):
+    """Provides records with plain and non-ASCII messages, extras and exception info.
+    """
+    try:
+        raise ValueError('déjà "vu"')
+    except ValueError:
+        exc_info = sys.exc_info()
+    return [logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'greeting: %s', ('hello', ),
+                              None),
+            logger.makeRecord(logger.name, logging.ERROR, __file__, 2, 'naïve "%s"', ('quote', ),
+                              exc_info, extra={'k': 'v', 'n': 1}),
+            ]
+
+
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_direct_json_output_matches_encoder_output(all_attr_fmt, compiler, records):
+    # Given
+    keymap = {'asctime': 'timestamp', 'levelno': 'level'}
+    reference = jsonlogging.Formatter(all_attr_fmt, style='{', keymap=keymap, _compiler=compiler)
+    formatter = jsonlogging.Formatter(all_attr_fmt,
+                                      direct_json=True,
+                                      style='{',
+                                      keymap=keymap,
+                                      _compiler=compiler)
+
+    for record in records:
+        # When
+        log = formatter.format(record)
+
+        # Then
+        assert log == reference.format(record)
+        assert json.loads(log) == json.loads(reference.format(record))
+
+
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_direct_json_with_format_specs(compiler, records):
+    # Given
+    fmt = '{levelno:3d} {lineno:05d} {created:.2f} {name:>30s} {message}'
+    reference = jsonlogging.Formatter(fmt, style='{', _compiler=compiler)
+    formatter = jsonlogging.Formatter(fmt, direct_json=True, style='{', _compiler=compiler)
+
+    for record in records:
+        # Then
+        assert formatter.format(record) == reference.format(record)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,137 @@
+# -*- coding: utf-8; -*-
+import datetime
+import decimal
+import enum
+import json
+import logging
+import uuid
+
+import pytest
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None
+
+import jsonlogging
+from jsonlogging import codegen_compiler, partial_compiler, partial_compiler3
+
+
+COMPILERS = [codegen_compiler, partial_compiler, partial_compiler3]
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+def make_record(logger, **extra):
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None, extra=extra)
+
+
+@pytest.mark.parametrize('direct_json', [False, True])
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_formatter_outputs_extras_as_nested_json(compiler, direct_json, logger):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{', direct_json=direct_json,
+                                      _compiler=compiler)
+    record = make_record(logger,
+                         request={'id': 1, 'tags': ('a', 'b'), 'ok': True, 'ratio': 0.5},
+                         color=Color.RED,
+                         amount=decimal.Decimal('1.10'),
+                         at=datetime.datetime(2019, 1, 2, 3, 4, 5),
+                         key=uuid.UUID(int=1))
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log == {'message': 'msg',
+                   'request': {'id': 1, 'tags': ['a', 'b'], 'ok': True, 'ratio': 0.5},
+                   'color': 'red',
+                   'amount': '1.10',
+                   'at': '2019-01-02T03:04:05',
+                   'key': '00000000-0000-0000-0000-000000000001'}
+
+
+@pytest.mark.skipif(dataclasses is None, reason='dataclasses require Python 3.7')
+def test_formatter_outputs_dataclasses_as_objects(logger):
+    # Given
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int
+
+    formatter = jsonlogging.Formatter('{message}', style='{')
+
+    # When
+    log = json.loads(formatter.format(make_record(logger, point=Point(1, 2))))
+
+    # Then
+    assert log['point'] == {'x': 1, 'y': 2}
+
+
+def test_formatter_evaluates_lazy_extras_when_formatting(logger):
+    # Given
+    calls = []
+
+    def expensive(value):
+        calls.append(value)
+        return {'value': value}
+
+    formatter = jsonlogging.Formatter('{message}', style='{')
+    record = make_record(logger, state=jsonlogging.Lazy(expensive, 42))
+
+    # When
+    called_before = list(calls)
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert called_before == []
+    assert calls == [42]
+    assert log['state'] == {'value': 42}
+
+
+def test_formatter_uses_registered_encoders_for_subclasses(logger):
+    # Given
+    class Money:
+        def __init__(self, cents):
+            self.cents = cents
+
+    class Euros(Money):
+        pass
+
+    formatter = jsonlogging.Formatter('{message}', style='{',
+                                      encoders={Money: lambda m: {'cents': m.cents}})
+    formatter.register_encoder(set, sorted)
+
+    # When
+    log = json.loads(formatter.format(make_record(logger, price=Euros(100), tags={'b', 'a'})))
+
+    # Then
+    assert log['price'] == {'cents': 100}
+    assert log['tags'] == ['a', 'b']
+
+
+def test_formatter_limits_extras_depth_and_length(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{',
+                                      extras_max_depth=2,
+                                      extras_max_length=3)
+    nested = [[['deep']]]
+    cyclic = {}
+    cyclic['self'] = cyclic
+
+    # When
+    log = json.loads(formatter.format(make_record(logger,
+                                                  nested=nested,
+                                                  cyclic=cyclic,
+                                                  items=list(range(10)),
+                                                  text='abcdef')))
+
+    # Then
+    assert log['nested'] == [[jsonlogging.MAX_DEPTH_MARKER]]
+    assert log['cyclic'] == {'self': {'self': jsonlogging.MAX_DEPTH_MARKER}}
+    assert log['items'] == [0, 1, 2, jsonlogging.TRUNCATED_ITEMS_MARKER.format(7)]
+    assert log['text'] == 'abc' + jsonlogging.TRUNCATED_TEXT_MARKER.format(3)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,62 @@
+# -*- coding: utf-8; -*-
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def record_factory():
+    """Installs a log record factory that adds an attribute to every record.
+    """
+    previous = logging.getLogRecordFactory()
+
+    def factory(*args, **kwargs):
+        record = previous(*args, **kwargs)
+        record.hostname = 'localhost'
+        return record
+
+    logging.setLogRecordFactory(factory)
+    yield factory
+    logging.setLogRecordFactory(previous)
+
+
+def test_extras_only_contains_user_provided_attributes(logger):
+    # Given
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None,
+                               extra={'k': 'v', 'n': 1})
+
+    # When
+    extras = jsonlogging._extras(record)
+
+    # Then
+    assert extras == {'k': 'v', 'n': 1}
+
+
+def test_extras_ignores_attributes_set_by_other_formatters(logger):
+    # Given
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+    logging.Formatter('%(asctime)s %(message)s').format(record)
+
+    # When
+    extras = jsonlogging._extras(record)
+
+    # Then
+    assert extras == {}
+
+
+def test_extras_ignores_attributes_set_by_record_factory(record_factory, logger):
+    # Given
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None,
+                               extra={'k': 'v'})
+
+    # When
+    extras = jsonlogging._extras(record)
+
+    # Then
+    assert record.hostname == 'localhost'
+    assert extras == {'k': 'v'}
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,82 @@
+# -*- coding: utf-8; -*-
+import linecache
+import sys
+
+import jsonlogging
+
+
+def recurse(depth):
+    if depth == 0:
+        raise ValueError('bottom reached')
+    recurse(depth - 1)
+
+
+def exc_info(depth):
+    try:
+        recurse(depth)
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_format_exception_without_source_lines(mocker):
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{', source_lines=False)
+    getline = mocker.spy(linecache, 'getline')
+
+    # When
+    frames = formatter.formatException(exc_info(3))['frames']
+
+    # Then
+    assert len(frames) == 5
+    assert all(line is None for _, _, _, line in frames)
+    assert [code for _, _, code, _ in frames] == ['exc_info'] + 4 * ['recurse']
+    assert getline.call_count == 0
+
+
+def test_format_exception_with_max_frames():
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{', max_frames=4)
+
+    # When
+    frames = formatter.formatException(exc_info(10))['frames']
+
+    # Then
+    assert len(frames) == 5
+    assert frames[2][3] == jsonlogging.ELIDED_FRAMES_MARKER.format(8)
+    assert frames[0][2] == 'exc_info'
+    assert frames[-1][2] == 'recurse'
+
+
+def test_format_exception_with_collapse_recursion():
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{', collapse_recursion=True)
+
+    # When
+    frames = formatter.formatException(exc_info(10))['frames']
+
+    # Then
+    assert [code for _, _, code, _ in frames] == ['exc_info', 'recurse', '...', 'recurse']
+    assert frames[2][3] == jsonlogging.REPEATED_FRAME_MARKER.format(9)
+
+
+def test_format_stack_with_max_frames():
+    # Given
+    formatter = jsonlogging.Formatter('{stack_info}',
+                                      format_stacks=True,
+                                      max_frames=2,
+                                      source_lines=False,
+                                      style='{')
+
+    # When
+    frames = formatter.formatStack(''.join(['Stack (most recent call last):\n']
+                                           + 5 * ['  File "/module.py", line 1, in f\n'
+                                                  '    f()\n']))['frames']
+
+    # Then
+    assert frames == [('/module.py', 1, 'f', None),
+                      jsonlogging._marker_frame(jsonlogging.ELIDED_FRAMES_MARKER.format(3)),
+                      ('/module.py', 1, 'f', None),
+                      ]
+
+
+# vim: et:sw=4:syntax=python:ts=4:
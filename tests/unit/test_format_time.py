@@ -0,0 +1,78 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+COMPILERS = [jsonlogging.partial_compiler,
+             jsonlogging.partial_compiler3,
+             jsonlogging.closure_compiler,
+             jsonlogging.codegen_compiler,
+             ]
+
+
+def make_records(logger, *timestamps):
+    records = []
+    for timestamp in timestamps:
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+        record.created = timestamp
+        record.msecs = (timestamp - int(timestamp)) * 1000
+        records.append(record)
+    return records
+
+
+@pytest.mark.parametrize('datefmt', [None, '%Y%m%d %H:%M:%S'])
+def test_format_time_matches_logging_formatter(datefmt, logger):
+    # Given
+    reference = logging.Formatter(datefmt=datefmt)
+    formatter = jsonlogging.Formatter('{asctime}', datefmt=datefmt, style='{')
+    records = make_records(logger, 1546300800.001, 1546300800.999, 1546300801.5, 1546300800.25)
+
+    for record in records:
+        # Then
+        assert formatter.formatTime(record) == reference.formatTime(record, datefmt)
+
+
+def test_format_time_iso8601(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{asctime}', style='{', time_format='iso8601')
+    records = make_records(logger, 1546300800.125, 1546300800.75, 1546300801.5)
+
+    # When
+    timestamps = [formatter.formatTime(record) for record in records]
+
+    # Then
+    assert timestamps == ['2019-01-01T00:00:00.125Z',
+                          '2019-01-01T00:00:00.750Z',
+                          '2019-01-01T00:00:01.500Z',
+                          ]
+
+
+@pytest.mark.parametrize('compiler', COMPILERS)
+@pytest.mark.parametrize('direct_json', [False, True])
+def test_format_time_epoch(compiler, direct_json, logger):
+    # Given
+    formatter = jsonlogging.Formatter('{asctime} {message}',
+                                      direct_json=direct_json,
+                                      keymap={'asctime': 'ts'},
+                                      style='{',
+                                      time_format='epoch',
+                                      _compiler=compiler)
+    record, = make_records(logger, 1546300800.25)
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log == {'ts': 1546300800.25, 'message': 'msg'}
+
+
+def test_format_time_unknown_format():
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter('{asctime}', style='{', time_format='rfc2822')
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,131 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+FMT = '{name} {module} {levelname} {message}'
+
+
+def make_records(count):
+    return [logging.makeLogRecord({'name': 'app.db' if i % 2 else 'app', 'module': 'models',
+                                   'levelname': 'INFO', 'msg': 'entry %d', 'args': (i, )})
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('compiler', [jsonlogging.partial_compiler,
+                                      jsonlogging.partial_compiler3,
+                                      jsonlogging.codegen_compiler,
+                                      ])
+def test_interned_values_are_referred_to_by_number(compiler):
+    # Given
+    formatter = jsonlogging.Formatter(FMT,
+                                      style='{',
+                                      intern_fields=['name', 'module'],
+                                      keymap={'module': 'mod'},
+                                      _compiler=compiler)
+
+    # When
+    entries = [json.loads(formatter.format(record)) for record in make_records(3)]
+
+    # Then
+    assert entries == [{'name': 'app', 'mod': 'models', 'levelname': 'INFO',
+                        'message': 'entry 0', '@intern': {'name': 0, 'mod': 0}},
+                       {'name': 'app.db', 'mod': 0, 'levelname': 'INFO',
+                        'message': 'entry 1', '@intern': {'name': 1}},
+                       {'name': 0, 'mod': 0, 'levelname': 'INFO', 'message': 'entry 2'},
+                       ]
+
+
+def test_intern_decoder_restores_values():
+    # Given
+    formatter = jsonlogging.Formatter(FMT, style='{', intern_fields=['name', 'module'],
+                                      intern_reset=4)
+    reference = jsonlogging.Formatter(FMT, style='{')
+    records = make_records(10)
+    decoder = jsonlogging.InternDecoder()
+
+    # When
+    lines = [formatter.format_bytes(record) for record in records]
+
+    # Then
+    assert [decoder.decode(json.loads(line)) for line in lines] == \
+        [json.loads(reference.format(record)) for record in records]
+
+
+def test_intern_decoder_picks_up_after_a_reset():
+    # Given
+    formatter = jsonlogging.Formatter(FMT, style='{', intern_fields=['name'], intern_reset=4)
+    lines = [formatter.format(record) for record in make_records(6)]
+    decoder = jsonlogging.InternDecoder(keys=['name'])
+
+    # When
+    entries = [decoder.decode(json.loads(line)) for line in lines[2:]]
+
+    # Then
+    assert [entry['name'] for entry in entries] == [None, None, 'app', 'app.db']
+
+
+def test_interning_is_reset_on_rollover(tmpdir):
+    # Given
+    filename = str(tmpdir.join('app.log'))
+    handler = jsonlogging.CompressedRotatingFileHandler(filename, max_bytes=300)
+    handler.setFormatter(jsonlogging.Formatter(FMT, style='{', intern_fields=['name']))
+    logger = logging.Logger('app', level=logging.DEBUG)
+    logger.addHandler(handler)
+
+    # When
+    for i in range(20):
+        logger.info('entry %d', i)
+    handler.close()
+
+    # Then
+    decoder = jsonlogging.InternDecoder()
+    with open(filename, 'rb') as log_file:
+        entries = [decoder.decode(json.loads(line)) for line in log_file]
+    assert {entry['name'] for entry in entries} == {'app'}
+
+
+def test_interning_with_size_limits_keeps_announcements():
+    # Given
+    formatter = jsonlogging.Formatter(FMT, style='{', intern_fields=['name'], max_line_bytes=120)
+    record = logging.makeLogRecord({'name': 'app', 'msg': 'entry', 'payload': 'x' * 200})
+
+    # When
+    entry = json.loads(formatter.format(record))
+
+    # Then
+    assert entry['@intern'] == {'name': 0}
+    assert 'payload' not in entry
+
+
+def test_interning_with_size_limits_keeps_announced_values():
+    # Given
+    formatter = jsonlogging.Formatter(FMT, style='{', intern_fields=['name', 'module'],
+                                      max_line_bytes=100, drop_order=['name', 'module'])
+    records = [logging.makeLogRecord({'name': 'app.' + 'x' * 60, 'module': 'm' * 60,
+                                      'msg': 'entry %d', 'args': (i, )})
+               for i in range(3)]
+    decoder = jsonlogging.InternDecoder()
+
+    # When
+    lines = [formatter.format(record) for record in records]
+    entries = [decoder.decode(json.loads(line)) for line in lines]
+
+    # Then
+    assert json.loads(lines[0])['@intern'] == {'name': 0, 'module': 0}
+    assert all(entry['name'] == 'app.' + 'x' * 60 for entry in entries)
+    assert all(entry['module'] == 'm' * 60 for entry in entries)
+    assert all(len(line.encode('utf-8')) <= 100 for line in lines[1:])
+
+
+def test_interning_unknown_fields():
+    # Then
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter(FMT, style='{', intern_fields=['message'])
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,113 @@
+# -*- coding: utf-8; -*-
+import io
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+BACKENDS = [pytest.param(name,
+                         marks=pytest.mark.skipif(module() is None,
+                                                  reason='{} is not installed'.format(name)))
+            for name, module, _, _ in jsonlogging.JSON_BACKENDS]
+
+
+@pytest.fixture
+def record(logger):
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'naïve %s', ('greeting', ),
+                             None, extra={'k': 'v'})
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('compiler',
+                         [jsonlogging.partial_compiler,
+                          jsonlogging.partial_compiler3,
+                          jsonlogging.codegen_compiler,
+                          ])
+@pytest.mark.parametrize('direct_json', [False, True])
+def test_json_backend_output(all_attr_fmt, backend, compiler, direct_json, record):
+    # Given
+    reference = jsonlogging.Formatter(all_attr_fmt, style='{', _compiler=compiler)
+    formatter = jsonlogging.Formatter(all_attr_fmt,
+                                      direct_json=direct_json,
+                                      json_backend=backend,
+                                      style='{',
+                                      _compiler=compiler)
+
+    # When
+    log = formatter.format(record)
+    log_bytes = formatter.format_bytes(record)
+
+    # Then
+    assert json.loads(log) == json.loads(reference.format(record))
+    assert isinstance(log_bytes, bytes)
+    assert json.loads(log_bytes.decode('utf-8')) == json.loads(log)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_json_backend_serializes_unknown_types_as_strings(backend):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{', json_backend=backend)
+
+    # When
+    log = formatter._dumps({'value': ValueError('oops')})
+
+    # Then
+    assert json.loads(log) == {'value': 'oops'}
+
+
+def test_json_backend_unknown():
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter('{message}', style='{', json_backend='simplejson')
+
+
+def test_stream_handler_writes_bytes(record):
+    # Given
+    stream = io.BytesIO()
+    handler = jsonlogging.StreamHandler(stream)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+
+    # When
+    handler.handle(record)
+    handler.handle(record)
+
+    # Then
+    lines = stream.getvalue().split(b'\n')
+    assert lines[-1] == b''
+    assert [json.loads(line.decode('utf-8')) for line in lines[:-1]] \
+        == 2 * [{'levelname': 'INFO', 'message': 'naïve greeting', 'k': 'v'}]
+
+
+def test_stream_handler_writes_text_to_streams_without_buffer(record):
+    # Given
+    stream = io.StringIO()
+    handler = jsonlogging.StreamHandler()
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+
+    # When
+    handler.setStream(stream)
+    handler.handle(record)
+
+    # Then
+    assert json.loads(stream.getvalue()) == {'levelname': 'INFO', 'message': 'naïve greeting',
+                                             'k': 'v'}
+
+
+def test_file_handler_writes_bytes(record, tmpdir):
+    # Given
+    path = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.FileHandler(path, delay=True)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+
+    # When
+    handler.handle(record)
+    handler.close()
+
+    # Then
+    with open(path, 'rb') as log_file:
+        assert json.loads(log_file.read().decode('utf-8'))['message'] == 'naïve greeting'
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,54 @@
+# -*- coding: utf-8; -*-
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+def test_formatters_share_layout_and_callables():
+    # Given
+    keymap = {'asctime': 'timestamp'}
+    first = jsonlogging.Formatter('{asctime} {name} {message}', style='{', keymap=keymap)
+    hits = jsonlogging._layout.cache_info().hits
+
+    # When
+    second = jsonlogging.Formatter('{asctime} {name} {message}', style='{', keymap=dict(keymap))
+
+    # Then
+    assert jsonlogging._layout.cache_info().hits == hits + 1
+    assert second._keymap['name'][1] is first._keymap['name'][1]
+    assert second._keymap['asctime'][1] is not first._keymap['asctime'][1]
+
+
+@pytest.mark.parametrize('compiler', [jsonlogging.partial_compiler, jsonlogging.partial_compiler3])
+def test_formatters_sharing_layout_format_with_their_own_settings(compiler):
+    # Given
+    record = logging.makeLogRecord({'msg': 'message', 'created': 0.0, 'msecs': 0.0})
+    iso = jsonlogging.Formatter('{asctime} {message}', style='{', time_format='iso8601',
+                                _compiler=compiler)
+    epoch = jsonlogging.Formatter('{asctime} {message}', style='{', time_format='epoch',
+                                  _compiler=compiler)
+
+    # Then
+    assert iso.format(record) == '{"asctime":"1970-01-01T00:00:00.000Z","message":"message"}'
+    assert epoch.format(record) == '{"asctime":0.0,"message":"message"}'
+
+
+def test_custom_compilers_are_given_their_formatter():
+    # Given
+    formatters = []
+
+    def compiler(formatter, attr, fmt):
+        formatters.append(formatter)
+        return jsonlogging.partial_compiler(formatter, attr, fmt)
+
+    # When
+    first = jsonlogging.Formatter('{name} {message}', style='{', _compiler=compiler)
+    second = jsonlogging.Formatter('{name} {message}', style='{', _compiler=compiler)
+
+    # Then
+    assert formatters == [first, first, second, second]
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -16,6 +16,7 @@ import jsonlogging
                           jsonlogging.partial_compiler3,
                           jsonlogging.closure_compiler,
                           jsonlogging.closure_compiler2,
+                          jsonlogging.codegen_compiler,
                           ])
 def test_logger_with_all_attributes(logger, handler, all_attr_fmt, compiler):
     # Given
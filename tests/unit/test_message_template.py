@@ -0,0 +1,76 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+from jsonlogging import (closure_compiler, closure_compiler2, codegen_compiler, partial_compiler,
+                         partial_compiler2, partial_compiler3)
+
+
+COMPILERS = [closure_compiler, closure_compiler2, codegen_compiler, partial_compiler,
+             partial_compiler2, partial_compiler3]
+
+
+@pytest.mark.parametrize('direct_json', [False, True])
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_formatter_outputs_message_template_and_arguments(compiler, direct_json, logger):
+    # Given
+    formatter = jsonlogging.Formatter('{msg} {args} {message}', style='{',
+                                      direct_json=direct_json,
+                                      keymap={'msg': 'template'},
+                                      _compiler=compiler)
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'user %s has %d items',
+                               ('alice', 3), None)
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log == {'template': 'user %s has %d items',
+                   'args': ['alice', 3],
+                   'message': 'user alice has 3 items'}
+
+
+def test_formatter_outputs_mapping_arguments(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{msg} {args}', style='{')
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, '%(user)s logged in',
+                               ({'user': 'alice'}, ), None)
+
+    # When
+    log = json.loads(formatter.format(record))
+
+    # Then
+    assert log == {'msg': '%(user)s logged in', 'args': {'user': 'alice'}}
+
+
+def test_queue_handler_keeps_message_template(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{msg} {args} {message}', style='{')
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'greeting: %s',
+                               ('hello', ), None)
+
+    # When
+    prepared = jsonlogging.QueueHandler().prepare(record)
+
+    # Then
+    assert prepared.args is None
+    assert json.loads(formatter.format(prepared)) == {'msg': 'greeting: %s',
+                                                      'args': ['hello'],
+                                                      'message': 'greeting: hello'}
+
+
+def test_partial_compiler_skips_formatting_without_spec(logger):
+    # Given
+    formatter = jsonlogging.Formatter('%(message)s %(asctime)s %(lineno)d', style='%')
+
+    # Then
+    functions = {attr: f.func for attr, (_, f) in formatter._keymap.items()}
+    assert functions == {'message': jsonlogging._messager2,
+                         'asctime': jsonlogging._dater2,
+                         'lineno': jsonlogging._formatter}
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,127 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+import jsonlogging
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+try:
+    fork = multiprocessing.get_context('fork')
+except ValueError:  # pragma: no cover
+    fork = None
+
+pytestmark = pytest.mark.skipif(fork is None, reason='requires the fork start method')
+
+
+def log_records(handler, count):
+    logger = logging.Logger('worker', level=logging.DEBUG)
+    logger.addHandler(handler)
+    for i in range(count):
+        # Some records are far larger than atomic writes.
+        logger.info('record %d %s', i, 'x' * (10000 if i % 10 == 0 else 10))
+    handler.flush()
+
+
+def run_workers(handler, processes=4, count=100):
+    workers = [fork.Process(target=log_records, args=(handler, count)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+
+def read_logs(filename):
+    with open(filename, 'rb') as log_file:
+        return [json.loads(line.decode('utf-8')) for line in log_file]
+
+
+def test_multiprocess_file_handler_never_tears_lines(tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.MultiprocessFileHandler(filename, buffer_size=16 * 1024)
+    handler.setFormatter(jsonlogging.Formatter('{process} {message}', style='{'))
+
+    # When
+    handler.handle(logging.makeLogRecord({'msg': 'before fork'}))
+    run_workers(handler)
+    handler.close()
+
+    # Then
+    logs = read_logs(filename)
+    assert len(logs) == 401
+    assert [log['message'] for log in logs].count('before fork') == 1
+
+
+@pytest.mark.skipif(fcntl is None, reason='requires fcntl')
+def test_multiprocess_file_handler_batches_wait_for_oversized_records(tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.MultiprocessFileHandler(filename, flush_interval=None)
+    handler.setFormatter(jsonlogging.Formatter('{message}', style='{'))
+    handler.handle(logging.makeLogRecord({'msg': 'small'}))
+    # Another process writing an oversized record holds the lock exclusively.
+    lock_fd = os.open(filename + '.lock', os.O_RDWR | os.O_CREAT)
+    fcntl.flock(lock_fd, fcntl.LOCK_EX)
+    flusher = threading.Thread(target=handler.flush)
+
+    # When
+    flusher.start()
+    time.sleep(0.1)
+
+    # Then
+    assert os.path.getsize(filename) == 0
+    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    flusher.join()
+    os.close(lock_fd)
+    handler.close()
+    assert [log['message'] for log in read_logs(filename)] == ['small']
+
+
+def test_multiprocess_file_handler_oversized_records_race_batches(tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.MultiprocessFileHandler(filename, atomic_size=64, buffer_size=4096)
+    handler.setFormatter(jsonlogging.Formatter('{process} {message}', style='{'))
+
+    # When
+    run_workers(handler, processes=8, count=200)
+    handler.close()
+
+    # Then
+    logs = read_logs(filename)
+    assert len(logs) == 1600
+    assert sum(len(log['message']) > 10000 for log in logs) == 160
+
+
+def test_log_aggregator_collects_lines(tmpdir):
+    # Given
+    filename = str(tmpdir.join('log.jsonl'))
+    aggregator = jsonlogging.LogAggregator(str(tmpdir.join('log.sock')), filename)
+    server = threading.Thread(target=aggregator.serve_forever, kwargs={'poll_interval': 0.01})
+    server.start()
+    handler = jsonlogging.UnixSocketHandler(aggregator.path)
+    handler.setFormatter(jsonlogging.Formatter('{process} {message}', style='{'))
+
+    # When
+    run_workers(handler)
+    aggregator.shutdown()
+    server.join()
+
+    # Then
+    logs = read_logs(filename)
+    assert len(logs) == aggregator.lines == 400
+    assert len({log['process'] for log in logs}) == 4
+
+
+# vim: et:sw=4:syntax=python:ts=4:
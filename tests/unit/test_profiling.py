@@ -0,0 +1,101 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def records(logger):
+    """Provides a plain record, and one with extras and exception info.
+    """
+    try:
+        raise ValueError('failure')
+    except ValueError:
+        exc_info = sys.exc_info()
+    return [logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'greeting: %s', ('hello', ),
+                              None),
+            logger.makeRecord(logger.name, logging.ERROR, __file__, 2, 'failed', (), exc_info,
+                              extra={'k': 'v'}),
+            ]
+
+
+@pytest.mark.parametrize('compiler', [jsonlogging.partial_compiler,
+                                      jsonlogging.closure_compiler2,
+                                      jsonlogging.codegen_compiler,
+                                      ])
+def test_profiling_formatter_output_is_unchanged(all_attr_fmt, compiler, records):
+    # Given
+    reference = jsonlogging.Formatter(all_attr_fmt, style='{', _compiler=compiler)
+    formatter = jsonlogging.Formatter(all_attr_fmt, style='{', profile=True, _compiler=compiler)
+
+    for record in records:
+        # Then
+        assert json.loads(formatter.format(record)) == json.loads(reference.format(record))
+        assert json.loads(formatter.format_bytes(record)) == json.loads(reference.format(record))
+
+
+def test_profiling_formatter_counts_stages(all_attr_fmt, records):
+    # Given
+    formatter = jsonlogging.Formatter(all_attr_fmt, style='{', profile=True)
+
+    # When
+    for record in records:
+        formatter.format(record)
+    stats = formatter.stats(reset=True)
+
+    # Then
+    assert set(stats) == set(jsonlogging.PROFILE_STAGES)
+    assert stats['format']['count'] == 2
+    assert stats['attributes']['count'] == 2
+    assert stats['extras']['count'] == 2
+    assert stats['dumps']['count'] == 2
+    assert stats['exception']['count'] == 1
+    assert stats['format']['total_ns'] >= stats['attributes']['total_ns'] > 0
+    assert sum(count for _, count in stats['format']['histogram']) == 2
+    assert formatter.stats()['format'] == {'count': 0, 'total_ns': 0, 'histogram': []}
+
+
+def test_formatter_without_profile_has_no_stats(records):
+    # Given
+    formatter = jsonlogging.Formatter('{message}', style='{')
+
+    # When
+    formatter.format(records[0])
+
+    # Then
+    assert formatter.stats() == {}
+    assert formatter.format == formatter._format1
+
+
+def test_profiling_formatter_logs_its_stats(handler, logger, records):
+    # Given
+    formatter = jsonlogging.Formatter('{name} {message}', style='{', profile=True,
+                                      profile_interval=0)
+    handler.setFormatter(formatter)
+    profile_logger = logging.getLogger(jsonlogging.PROFILE_LOGGER)
+    profile_logger.addHandler(handler)
+    profile_logger.propagate = False
+    profile_logger.setLevel(logging.INFO)
+
+    # When
+    try:
+        logger.info('message')
+    finally:
+        profile_logger.removeHandler(handler)
+        profile_logger.propagate = True
+        profile_logger.setLevel(logging.NOTSET)
+
+    # Then
+    # The statistics are logged while the record is formatted, thus emitted first.
+    report, entry = [json.loads(log) for log in handler.logs]
+    assert entry == {'name': logger.name, 'message': 'message'}
+    assert report['name'] == jsonlogging.PROFILE_LOGGER
+    assert report['message'] == jsonlogging.PROFILE_MESSAGE
+    assert report['formatter_stats']['format']['count'] == 1
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,107 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def queue_logger(logger, handler):
+    """Makes the logger hand records to a QueueHandler, and the handler a listener's.
+    """
+    queue_handler = jsonlogging.QueueHandler(maxsize=2, policy='drop')
+    logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+    yield logger, queue_handler
+    logger.removeHandler(queue_handler)
+
+
+def test_queue_handler_formats_in_listener(queue_logger, handler):
+    # Given
+    logger, queue_handler = queue_logger
+
+    # When
+    with jsonlogging.QueueListener(queue_handler, handler):
+        logger.info('greeting: %s', 'hello', extra={'k': 'v'})
+        logger.error('failure %d%%', 100)
+
+    # Then
+    assert [json.loads(log) for log in handler.logs] \
+        == [{'levelname': 'INFO', 'message': 'greeting: hello', 'k': 'v'},
+            {'levelname': 'ERROR', 'message': 'failure 100%'},
+            ]
+
+
+def test_queue_handler_snapshots_records(queue_logger):
+    # Given
+    logger, queue_handler = queue_logger
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'greeting: %s',
+                               ('hello', ), None, extra={'k': 'v'})
+
+    # When
+    queue_handler.handle(record)
+    record.k = 'changed'
+
+    # Then
+    queued = queue_handler.queue.get_nowait()
+    assert (queued.msg, queued.args, queued.k) == ('greeting: hello', None, 'v')
+
+
+@pytest.mark.parametrize('policy,expected', [('drop', ['0', '1']), ('drop_oldest', ['2', '3'])])
+def test_queue_handler_policy(expected, policy, queue_logger):
+    # Given
+    logger, queue_handler = queue_logger
+    queue_handler.policy = policy
+
+    # When
+    for i in range(4):
+        logger.info('%d', i)
+
+    # Then
+    assert queue_handler.dropped == 2
+    assert [queue_handler.queue.get_nowait().msg for _ in range(2)] == expected
+
+
+@pytest.mark.parametrize('policy', ['drop', 'drop_oldest'])
+def test_queue_handler_drops_leave_queue_joinable(policy, queue_logger):
+    # Given
+    logger, queue_handler = queue_logger
+    queue_handler.policy = policy
+    for i in range(4):
+        logger.info('%d', i)
+
+    # When
+    while not queue_handler.queue.empty():
+        queue_handler.queue.get_nowait()
+        queue_handler.queue.task_done()
+
+    # Then: does not wait forever
+    queue_handler.queue.join()
+
+
+def test_queue_handler_never_drops_the_listener_sentinel(queue_logger):
+    # Given
+    logger, queue_handler = queue_logger
+    queue_handler.policy = 'drop_oldest'
+    logger.info('0')
+    queue_handler.queue.put_nowait(jsonlogging.QueueListener._sentinel)  # stop() was called
+
+    # When
+    logger.info('1')
+    logger.info('2')
+
+    # Then
+    items = [queue_handler.queue.get_nowait() for _ in range(2)]
+    assert jsonlogging.QueueListener._sentinel in items
+    assert queue_handler.dropped == 2
+
+
+def test_queue_handler_unknown_policy():
+    with pytest.raises(ValueError):
+        jsonlogging.QueueHandler(policy='ignore')
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,95 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def json_handler(handler):
+    handler.setFormatter(jsonlogging.Formatter('{levelname} {message}', style='{'))
+    return handler
+
+
+def log_repeatedly(logger, count, level=logging.WARNING):
+    for i in range(count):
+        logger.log(level, 'disk full: %d', i)
+
+
+def test_rate_limit_filter_suppresses_repeated_records(json_handler, logger):
+    # Given
+    json_handler.addFilter(jsonlogging.RateLimitFilter(rate=0.001, burst=2,
+                                                       summary_interval=None))
+
+    # When
+    log_repeatedly(logger, 5)
+    logger.warning('another message')
+
+    # Then
+    messages = [json.loads(log)['message'] for log in json_handler.logs]
+    assert messages == ['disk full: 0', 'disk full: 1', 'another message']
+
+
+def test_rate_limit_filter_samples_by_level(json_handler, logger):
+    # Given
+    json_handler.addFilter(jsonlogging.RateLimitFilter(rate=1000,
+                                                       sample_rates={logging.DEBUG: 0.0,
+                                                                     logging.INFO: 1.0}))
+
+    # When
+    log_repeatedly(logger, 3, logging.DEBUG)
+    log_repeatedly(logger, 3, logging.INFO)
+
+    # Then
+    assert len(list(json_handler.debug_logs)) == 0
+    assert len(list(json_handler.info_logs)) == 3
+
+
+def test_rate_limit_filter_logs_summaries_of_suppressed_records(json_handler, logger):
+    # Given
+    rate_limit = jsonlogging.RateLimitFilter(rate=0.001, burst=1, summary_interval=None)
+    json_handler.addFilter(rate_limit)
+    log_repeatedly(logger, 4)
+
+    # When
+    rate_limit.log_summaries()
+    rate_limit.log_summaries()
+
+    # Then
+    logs = [json.loads(log) for log in json_handler.logs]
+    assert logs == [{'levelname': 'WARNING', 'message': 'disk full: 0'},
+                    {'levelname': 'WARNING',
+                     'message': 'Suppressed 3 occurrences of: disk full: %d',
+                     'suppressed': 3}]
+
+
+def test_rate_limit_filter_logs_summaries_periodically(json_handler, logger):
+    # Given
+    json_handler.addFilter(jsonlogging.RateLimitFilter(rate=0.001, burst=1, summary_interval=0))
+
+    # When
+    log_repeatedly(logger, 3)
+
+    # Then
+    messages = [json.loads(log)['message'] for log in json_handler.logs]
+    assert messages == ['disk full: 0',
+                        'Suppressed 1 occurrences of: disk full: %d',
+                        'Suppressed 1 occurrences of: disk full: %d']
+
+
+def test_rate_limit_filter_bounds_keys(logger):
+    # Given
+    rate_limit = jsonlogging.RateLimitFilter(max_keys=10)
+
+    # When
+    for i in range(100):
+        rate_limit.filter(logger.makeRecord(logger.name, logging.INFO, __file__, i, 'msg', (),
+                                            None))
+
+    # Then
+    assert len(rate_limit._buckets) == 10
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,206 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+KEYMAP = {'levelname': 'level', 'asctime': 'ts'}
+
+
+@pytest.fixture
+def log_path(tmpdir):
+    """Provides a log file of entries from two loggers, with renamed keys, one second apart.
+    """
+    path = str(tmpdir.join('log.jsonl'))
+    handler = jsonlogging.FileHandler(path)
+    handler.setFormatter(jsonlogging.Formatter('{asctime} {levelname} {name} {message}',
+                                               style='{',
+                                               keymap=KEYMAP,
+                                               time_format='epoch'))
+    for i in range(100):
+        name = 'app.db' if i % 2 else 'other'
+        level = logging.ERROR if i % 10 == 0 else logging.INFO
+        handler.handle(logging.makeLogRecord({'name': name, 'levelno': level,
+                                              'levelname': logging.getLevelName(level),
+                                              'msg': 'entry %d', 'args': (i, ),
+                                              'created': 1000.0 + i, 'user': 'user%d' % (i % 3)}))
+    handler.close()
+    with open(path, 'ab') as log_file:
+        log_file.write(b'{"ts":1100.0,"level":"ERR')  # An entry being written
+    return path
+
+
+def messages(entries):
+    return [entry['message'] for entry in entries]
+
+
+def test_read_logs_filters_by_level_logger_and_fields(log_path):
+    # Given
+    query = jsonlogging.LogQuery(level=logging.ERROR, keymap=KEYMAP)
+    by_logger = jsonlogging.LogQuery(logger='app', fields={'user': 'user1'}, keymap=KEYMAP)
+
+    # Then
+    assert messages(jsonlogging.read_logs(log_path, query)) == ['entry {}'.format(i)
+                                                                for i in range(0, 100, 10)]
+    assert messages(jsonlogging.read_logs(log_path, by_logger)) == ['entry {}'.format(i)
+                                                                    for i in range(100)
+                                                                    if i % 2 and i % 3 == 1]
+
+
+def test_read_logs_filters_by_time_range(log_path):
+    # Given
+    query = jsonlogging.LogQuery(since=1010.0, until=1012.0, keymap=KEYMAP)
+
+    # When
+    lines = list(jsonlogging.read_logs(log_path, query, raw=True))
+
+    # Then
+    assert [json.loads(line.decode('utf-8'))['ts'] for line in lines] == [1010.0, 1011.0, 1012.0]
+
+
+def test_query_prefilter_rejects_lines_without_decoding_them():
+    # Given
+    query = jsonlogging.LogQuery(level=logging.ERROR, fields={'user': 'alice'},
+                                 keymap={'levelno': 'lvl'})
+    lines = [b'{"levelname":"INFO","user":"alice"}',
+             b'{"levelname":"ERROR","user":"bob"}',
+             b'{"levelname":"ERROR","user":"alice"}',
+             b'{"lvl":40,"user":"alice"}']
+
+    # Then
+    assert [query.prefilter(line, 0, len(line)) for line in lines] == [False, False, True, True]
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_read_logs_with_index(log_path, use_index):
+    # Given
+    jsonlogging.build_index(log_path, keymap=KEYMAP, block_lines=10)
+    with open(log_path, 'ab') as log_file:  # Completes the entry, after the index was built
+        log_file.write(b'OR","name":"app","message":"late"}\n')
+    query = jsonlogging.LogQuery(level=logging.ERROR, since=1030.0, keymap=KEYMAP)
+
+    # When
+    entries = list(jsonlogging.read_logs(log_path, query, use_index=use_index))
+
+    # Then
+    assert messages(entries) == ['entry {}'.format(i) for i in range(30, 100, 10)] + ['late']
+
+
+def test_build_index_records_levels_and_time_ranges(log_path):
+    # When
+    index = jsonlogging.build_index(log_path, keymap=KEYMAP, block_lines=50)
+
+    # Then
+    assert os.path.exists(log_path + jsonlogging.INDEX_SUFFIX)
+    assert [block[1:] for block in index['blocks']] == [[1000.0, 1049.0], [1050.0, 1099.0]]
+    assert len(index['levels'][str(logging.ERROR)]) == 10
+    assert len(index['levels'][str(logging.INFO)]) == 90
+
+
+def test_command_line_queries_logs(log_path, capsysbinary):
+    # When
+    status = jsonlogging.main(['query', log_path, '--level', 'error', '--logger', 'other',
+                               '--field', 'user=user0', '--keymap', 'levelname=level'])
+
+    # Then
+    lines = capsysbinary.readouterr().out.splitlines()
+    assert status == 0
+    assert [json.loads(line.decode('utf-8'))['message'] for line in lines] == ['entry 0',
+                                                                               'entry 30',
+                                                                               'entry 60',
+                                                                               'entry 90']
+
+
+@pytest.fixture
+def default_log_path(tmpdir):
+    """Provides a log file of the default formatter output, which has numbers as strings.
+    """
+    path = str(tmpdir.join('default.jsonl'))
+    handler = jsonlogging.FileHandler(path)
+    handler.setFormatter(jsonlogging.Formatter('{created} {levelno} {levelname} {message}',
+                                               style='{'))
+    for i in range(20):
+        level = logging.WARNING if i % 5 == 0 else logging.INFO
+        handler.handle(logging.makeLogRecord({'levelno': level,
+                                              'levelname': logging.getLevelName(level),
+                                              'msg': 'entry %d', 'args': (i, ),
+                                              'created': 1000.0 + i}))
+    handler.close()
+    return path
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_read_logs_of_default_formatter_output(default_log_path, use_index):
+    # Given
+    if use_index:
+        jsonlogging.build_index(default_log_path, time_key='created', block_lines=5)
+    by_level = jsonlogging.LogQuery(level=logging.WARNING, time_key='created')
+    by_time = jsonlogging.LogQuery(since=1015, until=1016.0, time_key='created')
+
+    # Then
+    assert messages(jsonlogging.read_logs(default_log_path, by_level)) == \
+        ['entry 0', 'entry 5', 'entry 10', 'entry 15']
+    assert messages(jsonlogging.read_logs(default_log_path, by_time)) == ['entry 15', 'entry 16']
+
+
+def test_build_index_of_default_formatter_output(default_log_path):
+    # When
+    index = jsonlogging.build_index(default_log_path, time_key='created', block_lines=10)
+
+    # Then
+    assert [block[1:] for block in index['blocks']] == [[1000.0, 1009.0], [1010.0, 1019.0]]
+    assert len(index['levels'][str(logging.WARNING)]) == 4
+
+
+def test_command_line_queries_default_formatter_output(default_log_path, capsysbinary):
+    # When
+    jsonlogging.main(['query', default_log_path, '--level', 'WARNING'])
+
+    # Then
+    lines = capsysbinary.readouterr().out.splitlines()
+    assert [json.loads(line)['message'] for line in lines] == \
+        ['entry 0', 'entry 5', 'entry 10', 'entry 15']
+
+
+def test_command_line_queries_default_formatter_output_by_number(default_log_path,
+                                                                 capsysbinary):
+    # When
+    jsonlogging.main(['query', default_log_path, '--field', 'levelno=30'])
+
+    # Then
+    lines = capsysbinary.readouterr().out.splitlines()
+    assert [json.loads(line)['message'] for line in lines] == \
+        ['entry 0', 'entry 5', 'entry 10', 'entry 15']
+
+
+def test_query_fields_match_numbers_written_as_strings():
+    # Given
+    query = jsonlogging.LogQuery(fields={'lineno': '42'})
+    line = b'{"lineno":42}'
+
+    # Then
+    assert query.prefilter(line, 0, len(line))
+    assert query.matches({'lineno': 42})
+    assert not query.matches({'lineno': 43})
+    assert not query.matches({'lineno': 'x'})
+
+
+def test_module_runs_as_a_command(log_path):
+    # Given
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(jsonlogging.__file__))
+
+    # When
+    subprocess.check_call([sys.executable, '-m', 'jsonlogging', 'index', log_path,
+                           '--keymap', 'levelname=level'], env=env)
+
+    # Then
+    assert os.path.exists(log_path + jsonlogging.INDEX_SUFFIX)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
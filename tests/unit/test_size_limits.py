@@ -0,0 +1,120 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+def make_record(logger, msg='msg', exc_info=None, **extra):
+    return logger.makeRecord(logger.name, logging.ERROR, __file__, 1, msg, (), exc_info,
+                             extra=extra)
+
+
+@pytest.fixture
+def exc_info():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_formatter_truncates_long_fields(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{levelname} {message}', style='{', max_field_length=5)
+
+    # When
+    log = json.loads(formatter.format(make_record(logger, 'x' * 8, k='y' * 6, n=123456)))
+
+    # Then
+    assert log == {'levelname': 'ERROR',
+                   'message': 'xxxxx' + jsonlogging.TRUNCATED_TEXT_MARKER.format(3),
+                   'k': 'yyyyy' + jsonlogging.TRUNCATED_TEXT_MARKER.format(1),
+                   'n': 123456}
+
+
+def test_formatter_drops_fields_in_order_to_fit_budget(exc_info, logger):
+    # Given
+    formatter = jsonlogging.Formatter('{levelname} {message} {exc_info}', style='{',
+                                      max_line_bytes=150)
+    record = make_record(logger, exc_info=exc_info, k='v' * 100)
+
+    # When
+    log = formatter.format_bytes(record)
+
+    # Then
+    assert len(log) <= 150
+    assert json.loads(log.decode('utf-8')) == {'levelname': 'ERROR',
+                                               'message': 'msg',
+                                               'exc_info': {'value': 'boom', 'type': 'ValueError'}}
+
+
+def test_formatter_truncates_longest_string_as_last_resort(logger):
+    # Given
+    formatter = jsonlogging.Formatter('{levelname} {message}', style='{',
+                                      drop_order=[],
+                                      max_line_bytes=100,
+                                      static_fields={'service': 'api'})
+
+    # When
+    log = formatter.format(make_record(logger, 'é' * 500))
+
+    # Then
+    assert len(log.encode('utf-8')) <= 100
+    entry = json.loads(log)
+    assert entry['service'] == 'api'
+    assert entry['message'].startswith('éé')
+    assert entry['message'].endswith(' more characters]')
+
+
+def test_formatter_keeps_entries_within_budget_as_is(logger):
+    # Given
+    reference = jsonlogging.Formatter('{levelname} {message}', style='{')
+    formatter = jsonlogging.Formatter('{levelname} {message}', style='{', max_line_bytes=1000)
+    record = make_record(logger, k='v')
+
+    # Then
+    assert formatter.format(record) == reference.format(record)
+
+
+@pytest.mark.parametrize('budget', [60, 30, 10])
+def test_formatter_with_budget_below_fixed_fields(logger, budget):
+    # Given
+    formatter = jsonlogging.Formatter('{levelname} {levelno} {lineno} {message}', style='{',
+                                      max_line_bytes=budget)
+
+    # When
+    log = json.loads(formatter.format(make_record(logger, 'x' * 200)))
+
+    # Then: as short as it gets, without looping forever
+    assert log['levelname'] == 'ERROR'
+    assert log['message'] == jsonlogging.TRUNCATED_TEXT_MARKER.format(200)
+
+
+@pytest.mark.skipif(jsonlogging.contextvars is None, reason='requires contextvars')
+def test_formatter_counts_context_variables_in_budget(logger):
+    # Given
+    var = jsonlogging.contextvars.ContextVar('request_id')
+    formatter = jsonlogging.Formatter('{levelname} {message}', style='{', context_vars=[var],
+                                      max_line_bytes=130)
+    context = jsonlogging.contextvars.copy_context()
+    context.run(var.set, 'r' * 40)
+
+    # When
+    output = context.run(formatter.format_bytes, make_record(logger, 'x' * 200))
+
+    # Then
+    assert len(output) <= 130
+    assert json.loads(output)['request_id'] == 'r' * 40
+    assert json.loads(output)['message'].startswith('x')
+
+
+def test_formatter_rejects_unknown_fields_to_drop():
+    # Then
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter('{message}', style='{', drop_order=['nope'], max_line_bytes=100)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
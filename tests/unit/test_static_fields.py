@@ -0,0 +1,61 @@
+# -*- coding: utf-8; -*-
+import json
+import logging
+
+import pytest
+
+import jsonlogging
+from jsonlogging import codegen_compiler, partial_compiler, partial_compiler3
+
+
+COMPILERS = [codegen_compiler, partial_compiler, partial_compiler3]
+
+
+@pytest.mark.parametrize('direct_json', [False, True])
+@pytest.mark.parametrize('compiler', COMPILERS)
+def test_formatter_outputs_static_fields_first(compiler, direct_json, logger):
+    # Given
+    static_fields = {'service': 'api', 'version': [1, 2]}
+    formatter = jsonlogging.Formatter('{levelname} {message}', style='{',
+                                      direct_json=direct_json,
+                                      static_fields=static_fields,
+                                      _compiler=compiler)
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None,
+                               extra={'k': 'v'})
+
+    # When
+    log = formatter.format(record)
+    log_bytes = formatter.format_bytes(record)
+
+    # Then
+    assert list(json.loads(log).items()) == [('service', 'api'),
+                                             ('version', [1, 2]),
+                                             ('levelname', 'INFO'),
+                                             ('message', 'msg'),
+                                             ('k', 'v')]
+    assert log_bytes == log.encode('utf-8')
+
+
+def test_formatter_outputs_static_fields_without_other_fields(logger):
+    # Given
+    with pytest.warns(UserWarning):
+        formatter = jsonlogging.Formatter('', style='{', static_fields={'service': 'api'})
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+
+    # When
+    log = formatter.format(record)
+
+    # Then
+    assert log == '{"service":"api"}'
+    assert formatter.format_bytes(record) == b'{"service":"api"}'
+
+
+def test_formatter_rejects_static_fields_duplicating_record_keys():
+    # Then
+    with pytest.raises(ValueError):
+        jsonlogging.Formatter('{levelname} {message}', style='{',
+                              keymap={'levelname': 'level'},
+                              static_fields={'level': 'INFO'})
+
+
+# vim: et:sw=4:syntax=python:ts=4:
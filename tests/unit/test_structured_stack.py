@@ -0,0 +1,114 @@
+# -*- coding: utf-8; -*-
+import copy
+import json
+import logging
+import logging.handlers
+import pickle
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+@pytest.fixture
+def structured_logger(handler):
+    """Create a jsonlogging.Logger, isolated from others.
+    """
+    the_logger = jsonlogging.Logger('structured_logger', level=logging.DEBUG)
+    the_logger.propagate = False
+    the_logger.addHandler(handler)
+    yield the_logger
+    the_logger.removeHandler(handler)
+
+
+def log_from_helper(logger, **kwargs):
+    logger.info('from helper', **kwargs)
+
+
+def test_logger_finds_caller_as_logging_does(structured_logger, logger, handler):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{funcName} {filename} {lineno}', style='{'))
+
+    # When
+    log_from_helper(structured_logger)
+    log_from_helper(logger)
+
+    # Then
+    structured, reference = [json.loads(log) for log in handler.logs]
+    assert structured == reference
+    assert structured['funcName'] == 'log_from_helper'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires python3.8 or higher")
+def test_logger_finds_caller_with_stacklevel(structured_logger, handler):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{funcName}', style='{'))
+
+    # When
+    log_from_helper(structured_logger, stacklevel=2)
+
+    # Then
+    log_entry = json.loads(list(handler.logs)[0])
+    assert log_entry == {'funcName': 'test_logger_finds_caller_with_stacklevel'}
+
+
+def test_logger_captures_stack_as_frames(structured_logger, handler):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{stack_info}', format_stacks=True, style='{'))
+
+    # When
+    log_from_helper(structured_logger, stack_info=True)
+
+    # Then
+    frames = json.loads(list(handler.logs)[0])['stack_info']['frames']
+    codes = [code for _, _, code, _ in frames[-2:]]
+    assert codes == ['test_logger_captures_stack_as_frames', 'log_from_helper']
+    assert all(isinstance(lineno, int) for _, lineno, _, _ in frames)
+    assert frames[-1][0] == __file__
+
+
+def test_parsed_and_captured_stacks_frames_agree(structured_logger, logger, handler):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{stack_info}', format_stacks=True, style='{'))
+
+    # When
+    log_from_helper(structured_logger, stack_info=True)
+    log_from_helper(logger, stack_info=True)
+
+    # Then
+    captured, parsed = [json.loads(log)['stack_info']['frames'][-1] for log in handler.logs]
+    assert captured[:3] == parsed[:3]
+    assert isinstance(parsed[1], int)
+
+
+def test_logger_stack_renders_as_text(structured_logger, handler):
+    # Given
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    # When
+    log_from_helper(structured_logger, stack_info=True)
+
+    # Then
+    lines = list(handler.logs)[0].split('\n')
+    assert lines[:2] == ['from helper', 'Stack (most recent call last):']
+    assert lines[-1].startswith('  File "{}", line '.format(__file__))
+    assert lines[-1].endswith(', in log_from_helper')
+
+
+def test_structured_stack_survives_pickling_and_copying(structured_logger, handler):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{stack_info}', style='{', format_stacks=True))
+    memory = logging.handlers.MemoryHandler(capacity=10)
+    structured_logger.addHandler(memory)
+    log_from_helper(structured_logger, stack_info=True)
+    record, = memory.buffer
+
+    for clone in (pickle.loads(pickle.dumps(record)), copy.deepcopy(record)):
+        # Then
+        assert clone.stack_info == record.stack_info
+        assert clone.stack_info.frames == record.stack_info.frames
+        assert handler.formatter.format(clone) == handler.formatter.format(record)
+
+
+# vim: et:sw=4:syntax=python:ts=4:
@@ -0,0 +1,87 @@
+# -*- coding: utf-8; -*-
+import json
+import sys
+
+import pytest
+
+import jsonlogging
+
+
+def fail(value):
+    raise ValueError(value)
+
+
+def exc_info(value):
+    try:
+        fail(value)
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_format_exception_reuses_cached_frames():
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{')
+
+    # When
+    first = formatter.formatException(exc_info('first'))
+    second = formatter.formatException(exc_info('second'))
+
+    # Then
+    assert first['frames'] == second['frames']
+    assert [first['value'], second['value']] == ['first', 'second']
+    assert formatter.traceback_cache_info() == jsonlogging.CacheInfo(1, 1, 128, 1)
+
+
+def test_format_exception_distinguishes_code_locations():
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{')
+
+    # When
+    first = formatter.formatException(exc_info('first'))
+    try:
+        fail('second')
+    except ValueError:
+        second = formatter.formatException(sys.exc_info())
+
+    # Then
+    assert first['frames'] != second['frames']
+    assert formatter.traceback_cache_info().misses == 2
+
+
+def test_format_exception_cache_is_bounded():
+    # Given
+    formatter = jsonlogging.Formatter('{exc_info}', style='{', traceback_cache_size=1)
+
+    # When
+    formatter.formatException(exc_info('first'))
+    try:
+        fail('second')
+    except ValueError:
+        formatter.formatException(sys.exc_info())
+    formatter.formatException(exc_info('third'))
+
+    # Then
+    assert formatter.traceback_cache_info() == jsonlogging.CacheInfo(0, 3, 1, 1)
+
+
+@pytest.mark.parametrize('size', [0, 128])
+def test_format_exception_output_does_not_depend_on_cache(size, handler, logger):
+    # Given
+    handler.setFormatter(jsonlogging.Formatter('{exc_info}',
+                                               style='{',
+                                               traceback_cache_size=size))
+
+    # When
+    for _ in range(2):
+        try:
+            fail('oops')
+        except ValueError:
+            logger.exception('failure')
+
+    # Then
+    first, second = [json.loads(log) for log in handler.logs]
+    assert first == second
+    assert first['exc_info']['frames'][-1][2] == 'fail'
+
+
+# vim: et:sw=4:syntax=python:ts=4: